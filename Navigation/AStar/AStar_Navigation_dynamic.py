@@ -4,6 +4,8 @@ import json
 import heapq # For A* priority queue
 import matplotlib.pyplot as plt
 from pupil_apriltags import Detector
+from scan_matcher import ScanOdometry
+from particle_localizer import simulate_scan
 
 
 # --- 1. LOCALIZATION CLASS (MOCK SENSOR) ---
@@ -29,6 +31,8 @@ class CameraLocalization:
         self.detector = Detector(families="tag36h11", nthreads=1)
         # Using a dummy value for cap as we won't read it
         self.cap = type('MockCap', (object,), {'read': lambda: (False, None)})() 
+        # Last tag-derived pose, advanced by lidar odometry between sightings
+        self.last_pose = None
         print("CameraLocalization initialized in MOCK mode.")
         
     def get_robot_pose(self):
@@ -38,11 +42,27 @@ class CameraLocalization:
         """
         try:
             x, y, theta = next(self.simulated_path)
+            self.last_pose = (x, y, theta)
             return x, y, theta
         except StopIteration:
             # End of simulated path, stop simulation
             return None, None, None
 
+    def apply_odometry(self, delta):
+        """
+        Dead-reckons the last known pose by a robot-frame increment (dx, dy, dtheta),
+        e.g. from scan_matcher.ScanOdometry, so the pose stays current between tag sightings.
+        """
+        if self.last_pose is None:
+            return None
+        x, y, theta = self.last_pose
+        dx, dy, dtheta = delta
+        x += dx * np.cos(theta) - dy * np.sin(theta)
+        y += dx * np.sin(theta) + dy * np.cos(theta)
+        theta = (theta + dtheta + np.pi) % (2 * np.pi) - np.pi
+        self.last_pose = (x, y, theta)
+        return self.last_pose
+
 # --- 2. MAPPING CLASS (MOCK LiDAR) ---
 class LidarMapper:
     """Simulates LiDAR output by providing a static occupancy grid."""
@@ -188,6 +208,9 @@ def run_navigation():
     localizer = CameraLocalization("map_definition.json", camera_params)
     mapper = LidarMapper()
     planner = AStarPlanner()
+    # Between tag sightings the pose is carried by scan-to-scan lidar odometry
+    odometry = ScanOdometry()
+    lidar_angles = np.arange(0.0, 360.0, 0.75)
 
     robot_trace = []
     
@@ -201,6 +224,9 @@ def run_navigation():
 
     # 1. INITIAL MAP AND PATH PLAN
     current_pose = (initial_x, initial_y, initial_theta)
+    # Where the robot really is; it only ever sees this through the lidar
+    true_pose = current_pose
+    odometry.update(lidar_angles, simulate_scan(mapper.occupancy_grid, mapper.cell_size, true_pose, lidar_angles))
     occupancy_grid = mapper.update_map({}, current_pose)
     
     planned_path = planner.plan_path(current_pose, (TARGET_X, TARGET_Y), occupancy_grid)
@@ -255,13 +281,24 @@ def run_navigation():
                 break
             continue
         
-        # Simulate a small, intentional step towards the next waypoint
-        step_size = planner.cell_size * 0.5 
-        step_x = current_pose[0] + dx / distance * step_size
-        step_y = current_pose[1] + dy / distance * step_size
-        
-        # Update current pose (mocking what the INS/wheel encoders would do)
-        current_pose = (step_x, step_y, current_pose[2])
+        # Command a small step towards the next waypoint, in the robot frame
+        step_size = planner.cell_size * 0.5
+        c, s = np.cos(current_pose[2]), np.sin(current_pose[2])
+        step_wx, step_wy = dx / distance * step_size, dy / distance * step_size
+        command = (c * step_wx + s * step_wy, -s * step_wx + c * step_wy, 0.0)
+
+        # The robot moves; the lidar revolution taken there gives the increment
+        tx, ty, ttheta = true_pose
+        true_pose = (tx + np.cos(ttheta) * command[0] - np.sin(ttheta) * command[1],
+                     ty + np.sin(ttheta) * command[0] + np.cos(ttheta) * command[1], ttheta)
+        scan = simulate_scan(mapper.occupancy_grid, mapper.cell_size, true_pose, lidar_angles)
+        delta = odometry.update(lidar_angles, scan)
+        if delta is None:
+            # Match failed: assume the commanded step happened
+            delta = command
+
+        # Update current pose from the odometry; re-planning starts from here
+        current_pose = tuple(localizer.apply_odometry(delta))
         robot_trace.append((current_pose[0], current_pose[1]))
         
 
@@ -0,0 +1,248 @@
+# Monte Carlo Localisation on the LidarMapper occupancy grid
+# Particles are scored against a precomputed likelihood field (distance
+# transform of the occupied cells), so a whole revolution for the whole
+# particle set is one batched NumPy gather.
+
+import time
+import cv2
+import numpy as np
+
+
+# --- 1. LIKELIHOOD FIELD ---
+class LikelihoodField:
+    """Per-cell beam-endpoint likelihood precomputed from an occupancy grid."""
+
+    def __init__(self, occupancy_grid, cell_size=0.1, sigma_hit=0.2, z_hit=0.9, z_rand=0.1, max_range=8.0):
+        self.cell_size = cell_size
+        self.shape = occupancy_grid.shape
+
+        # Distance (m) from every cell to the nearest occupied cell
+        free = (occupancy_grid == 0).astype(np.uint8)
+        self.distance = cv2.distanceTransform(free, cv2.DIST_L2, 5).astype(np.float32) * cell_size
+
+        hit = np.exp(-0.5 * (self.distance / sigma_hit) ** 2)
+        self.log_likelihood = np.log(z_hit * hit + z_rand / max_range).astype(np.float32)
+        # Endpoints outside the map only get the random-measurement term
+        self.outside_log_likelihood = np.float32(np.log(z_rand / max_range))
+
+
+# --- 2. PARTICLE FILTER ---
+class ParticleLocalizer:
+    """
+    Particle filter over (x, y, theta) in the LidarMapper / AStarPlanner frame:
+    cell = (int(x / cell_size), int(y / cell_size)), theta CCW from +x.
+
+    Lidar angles use the LD06 convention (0 deg = forward, 90 deg = left).
+    """
+
+    def __init__(
+        self,
+        occupancy_grid,
+        cell_size=0.1,
+        min_particles=500,
+        max_particles=5000,
+        beams_per_update=60,
+        motion_noise=(0.05, 0.05, 0.02),
+        kld_epsilon=0.05,
+        kld_z=2.33,
+        kld_bin=(0.2, 0.2, np.radians(10)),
+        rng=None,
+    ):
+        self.grid = occupancy_grid
+        self.cell_size = cell_size
+        self.field = LikelihoodField(occupancy_grid, cell_size)
+        self.min_particles = int(min_particles)
+        self.max_particles = int(max_particles)
+        self.beams_per_update = int(beams_per_update)
+        self.motion_noise = np.asarray(motion_noise, dtype=float)
+        self.kld_epsilon = kld_epsilon
+        self.kld_z = kld_z
+        self.kld_bin = np.asarray(kld_bin, dtype=float)
+        self.rng = rng if rng is not None else np.random.default_rng()
+
+        self.particles = np.zeros((0, 3))
+        self.weights = np.zeros(0)
+        self.last_update_ms = 0.0
+        self.initialize_global()
+
+    # --- Initialisation ---
+    def initialize_global(self, n=None):
+        """Spread particles uniformly over the free cells."""
+        n = self.max_particles if n is None else n
+        free_cells = np.argwhere(self.grid == 0)
+        picks = free_cells[self.rng.integers(len(free_cells), size=n)]
+        xy = (picks + self.rng.random((n, 2))) * self.cell_size
+        theta = self.rng.uniform(-np.pi, np.pi, n)
+        self._set_particles(np.column_stack((xy, theta)))
+
+    def initialize_pose(self, pose, std=(0.2, 0.2, np.radians(15)), n=None):
+        """Gaussian cloud around a known pose."""
+        n = self.min_particles if n is None else n
+        particles = np.asarray(pose, dtype=float) + self.rng.normal(size=(n, 3)) * np.asarray(std)
+        self._set_particles(particles)
+
+    def _set_particles(self, particles):
+        particles[:, 2] = _wrap_angle(particles[:, 2])
+        self.particles = particles
+        self.weights = np.full(len(particles), 1.0 / len(particles))
+
+    # --- Motion update ---
+    def predict(self, delta):
+        """
+        Apply a robot-frame motion increment (dx forward, dy left, dtheta),
+        e.g. from scan matching or the commanded motion, with Gaussian noise.
+        """
+        n = len(self.particles)
+        noisy = np.asarray(delta, dtype=float) + self.rng.normal(size=(n, 3)) * self.motion_noise
+        c, s = np.cos(self.particles[:, 2]), np.sin(self.particles[:, 2])
+        self.particles[:, 0] += c * noisy[:, 0] - s * noisy[:, 1]
+        self.particles[:, 1] += s * noisy[:, 0] + c * noisy[:, 1]
+        self.particles[:, 2] = _wrap_angle(self.particles[:, 2] + noisy[:, 2])
+
+    # --- Measurement updates ---
+    def update_scan(self, angles_deg, distances_mm):
+        """Weight all particles against one lidar revolution, then resample."""
+        t_start = time.perf_counter()
+
+        angles = np.radians(np.asarray(angles_deg, dtype=float))
+        ranges = np.asarray(distances_mm, dtype=float) / 1000.0
+        valid = ranges > 0
+        angles, ranges = angles[valid], ranges[valid]
+        if len(ranges) == 0:
+            return
+        if len(ranges) > self.beams_per_update:
+            pick = np.linspace(0, len(ranges) - 1, self.beams_per_update).astype(int)
+            angles, ranges = angles[pick], ranges[pick]
+
+        # (N, B) beam endpoints in world cells
+        beam_theta = self.particles[:, 2:3] + angles[None, :]
+        ex = self.particles[:, 0:1] + ranges[None, :] * np.cos(beam_theta)
+        ey = self.particles[:, 1:2] + ranges[None, :] * np.sin(beam_theta)
+        ix = np.floor(ex / self.cell_size).astype(np.int32)
+        iy = np.floor(ey / self.cell_size).astype(np.int32)
+
+        rows, cols = self.field.shape
+        inside = (ix >= 0) & (ix < rows) & (iy >= 0) & (iy < cols)
+        log_l = np.full(ix.shape, self.field.outside_log_likelihood, dtype=np.float32)
+        log_l[inside] = self.field.log_likelihood[ix[inside], iy[inside]]
+
+        self._apply_log_weights(log_l.sum(axis=1))
+        self.resample()
+        self.last_update_ms = (time.perf_counter() - t_start) * 1000.0
+
+    def update_position_fix(self, xy, sigma=0.1, theta=None, sigma_theta=np.radians(10)):
+        """
+        Strong measurement from an AprilTag world-position fix. If no particle
+        agrees with the fix (kidnapped / diverged), the filter is re-seeded
+        around it.
+        """
+        xy = np.asarray(xy, dtype=float)
+        d2 = np.sum((self.particles[:, :2] - xy) ** 2, axis=1)
+        log_w = -0.5 * d2 / sigma ** 2
+        if theta is not None:
+            dtheta = _wrap_angle(self.particles[:, 2] - theta)
+            log_w += -0.5 * (dtheta / sigma_theta) ** 2
+
+        if np.max(log_w) < -0.5 * 9.0:  # nobody within 3 sigma
+            heading = self.rng.uniform(-np.pi, np.pi, self.min_particles) if theta is None else None
+            self.initialize_pose((xy[0], xy[1], 0.0 if theta is None else theta),
+                                 std=(sigma, sigma, sigma_theta))
+            if heading is not None:
+                self.particles[:, 2] = heading
+            return
+
+        self._apply_log_weights(log_w)
+        self.resample()
+
+    def _apply_log_weights(self, log_w):
+        log_w = np.log(np.maximum(self.weights, 1e-300)) + log_w
+        log_w -= np.max(log_w)
+        w = np.exp(log_w)
+        self.weights = w / np.sum(w)
+
+    # --- Resampling ---
+    def kld_sample_size(self):
+        """Number of particles needed for the current spread (KLD sampling)."""
+        # Only count bins that carry noticeable weight
+        significant = self.weights > (0.1 / len(self.weights))
+        bins = np.floor(self.particles[significant] / self.kld_bin).astype(np.int64)
+        k = len(np.unique(bins, axis=0))
+        if k <= 1:
+            return self.min_particles
+
+        a = 2.0 / (9.0 * (k - 1))
+        n = (k - 1) / (2.0 * self.kld_epsilon) * (1.0 - a + np.sqrt(a) * self.kld_z) ** 3
+        return int(np.clip(np.ceil(n), self.min_particles, self.max_particles))
+
+    def resample(self):
+        """Low-variance resampling to the KLD sample size."""
+        n = self.kld_sample_size()
+        positions = (self.rng.random() + np.arange(n)) / n
+        cumulative = np.cumsum(self.weights)
+        cumulative[-1] = 1.0
+        idx = np.searchsorted(cumulative, positions)
+        self._set_particles(self.particles[idx].copy())
+
+    # --- Estimate ---
+    def estimate(self):
+        """Weighted mean pose (x, y, theta) and 3x3 covariance."""
+        w = self.weights
+        x = np.sum(w * self.particles[:, 0])
+        y = np.sum(w * self.particles[:, 1])
+        theta = np.arctan2(np.sum(w * np.sin(self.particles[:, 2])), np.sum(w * np.cos(self.particles[:, 2])))
+
+        diff = self.particles - np.array([x, y, theta])
+        diff[:, 2] = _wrap_angle(diff[:, 2])
+        cov = (w[:, None] * diff).T @ diff
+        return (x, y, theta), cov
+
+
+def _wrap_angle(theta):
+    return (theta + np.pi) % (2.0 * np.pi) - np.pi
+
+
+# --- 3. SIMULATION HELPERS ---
+def simulate_scan(occupancy_grid, cell_size, pose, angles_deg, max_range=8.0):
+    """Ray-cast a lidar revolution (distances in mm) from pose on the grid."""
+    angles = np.radians(np.asarray(angles_deg, dtype=float))
+    steps = np.arange(0.0, max_range, cell_size * 0.5)
+    theta = pose[2] + angles[:, None]
+    px = (pose[0] + steps[None, :] * np.cos(theta)) / cell_size
+    py = (pose[1] + steps[None, :] * np.sin(theta)) / cell_size
+    ix, iy = np.floor(px).astype(int), np.floor(py).astype(int)
+
+    rows, cols = occupancy_grid.shape
+    inside = (ix >= 0) & (ix < rows) & (iy >= 0) & (iy < cols)
+    hit = ~inside & (steps[None, :] < max_range)
+    hit[inside] = occupancy_grid[ix[inside], iy[inside]] == 1
+    # no return within range reads 0, like the LD06
+    return np.where(hit.any(axis=1), steps[np.argmax(hit, axis=1)] * 1000.0, 0.0)
+
+
+# --- 4. BENCHMARK ---
+def benchmark(particle_counts=(500, 1000, 2000, 5000), repeats=20):
+    """Scan-update rate on the simulated LidarMapper map."""
+    from AStar_Navigation_dynamic import LidarMapper
+
+    mapper = LidarMapper()
+    grid = mapper.occupancy_grid
+    true_pose = np.array([3.0, 3.0, np.pi / 4])
+    angles = np.arange(0.0, 360.0, 0.75)
+    scan = simulate_scan(grid, mapper.cell_size, true_pose, angles)
+
+    print(f"{'particles':>10} {'update ms':>10} {'Hz':>8}")
+    for n in particle_counts:
+        localizer = ParticleLocalizer(grid, mapper.cell_size, min_particles=n, max_particles=n,
+                                      rng=np.random.default_rng(0))
+        localizer.initialize_pose(true_pose, n=n)
+        timings = []
+        for _ in range(repeats):
+            localizer.predict((0.0, 0.0, 0.0))
+            localizer.update_scan(angles, scan)
+            timings.append(localizer.last_update_ms)
+        ms = float(np.median(timings))
+        print(f"{n:>10} {ms:>10.2f} {1000.0 / ms:>8.1f}")
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,250 @@
+# Correlative scan matching for lidar odometry
+# Scans are matched against a likelihood grid built from either the previous
+# revolution (scan-to-scan) or the LidarMapper occupancy grid (scan-to-map).
+# The (dx, dy, dtheta) window is searched with branch-and-bound over a stack
+# of precomputed max-pooled grids, evaluating each batch of candidates with
+# one NumPy gather.
+
+import time
+import cv2
+import numpy as np
+
+
+# --- 1. MULTI-RESOLUTION LOOKUP GRID ---
+class MultiResolutionGrid:
+    """
+    Likelihood grid plus precomputed branch-and-bound levels.
+
+    Level h stores, for every cell, the maximum likelihood over the
+    2^h x 2^h block starting at that cell, so a coarse score is an upper bound
+    for every translation inside the block. Indexing is grid[ix, iy] with
+    ix = floor((x - origin_x) / resolution), as in LidarMapper.
+    """
+
+    def __init__(self, likelihood, origin, resolution, levels):
+        self.origin = np.asarray(origin, dtype=float)
+        self.resolution = float(resolution)
+        self.levels = [likelihood.astype(np.float32)]
+        for h in range(1, levels):
+            prev = self.levels[-1]
+            step = 1 << (h - 1)
+            padded = np.pad(prev, ((0, step), (0, step)))
+            pooled = np.maximum(padded[:-step, :], padded[step:, :])
+            pooled = np.maximum(pooled[:, :-step], pooled[:, step:])
+            self.levels.append(pooled)
+
+    @classmethod
+    def from_points(cls, points, resolution=0.05, sigma=0.05, levels=4, margin=1.0):
+        """Likelihood grid around a point set (N, 2) in metres."""
+        lo = points.min(axis=0) - margin
+        hi = points.max(axis=0) + margin
+        shape = np.ceil((hi - lo) / resolution).astype(int) + 1
+        occupied = np.zeros(shape, dtype=np.uint8)
+        idx = np.floor((points - lo) / resolution).astype(int)
+        occupied[idx[:, 0], idx[:, 1]] = 1
+        return cls._from_occupied(occupied, lo, resolution, sigma, levels)
+
+    @classmethod
+    def from_occupancy(cls, occupancy_grid, cell_size=0.1, sigma=0.1, levels=4):
+        """Likelihood grid from a LidarMapper occupancy grid (origin at 0, 0)."""
+        occupied = (occupancy_grid == 1).astype(np.uint8)
+        return cls._from_occupied(occupied, (0.0, 0.0), cell_size, sigma, levels)
+
+    @classmethod
+    def _from_occupied(cls, occupied, origin, resolution, sigma, levels):
+        distance = cv2.distanceTransform(1 - occupied, cv2.DIST_L2, 5) * resolution
+        likelihood = np.exp(-0.5 * (distance / sigma) ** 2)
+        return cls(likelihood, origin, resolution, levels)
+
+    def score(self, level, base, offsets):
+        """
+        Mean likelihood for every candidate.
+
+        base: (B, 2) integer cells of the rotated scan for one rotation
+        offsets: (C, 2) integer cell translations
+        """
+        grid = self.levels[level]
+        ix = base[None, :, 0] + offsets[:, None, 0]
+        iy = base[None, :, 1] + offsets[:, None, 1]
+        rows, cols = grid.shape
+        inside = (ix >= 0) & (ix < rows) & (iy >= 0) & (iy < cols)
+        values = np.zeros(ix.shape, dtype=np.float32)
+        values[inside] = grid[ix[inside], iy[inside]]
+        return values.mean(axis=1)
+
+
+# --- 2. CORRELATIVE SCAN MATCHER ---
+class ScanMatcher:
+    """Branch-and-bound correlative matcher over a (dx, dy, dtheta) window."""
+
+    def __init__(
+        self,
+        linear_window=0.3,
+        angular_window_deg=15.0,
+        angular_step_deg=None,
+        max_points=200,
+        max_range=8.0,
+        min_score=0.3,
+    ):
+        self.linear_window = float(linear_window)
+        self.angular_window = np.radians(angular_window_deg)
+        self.angular_step = None if angular_step_deg is None else np.radians(angular_step_deg)
+        self.max_points = int(max_points)
+        self.max_range = float(max_range)
+        self.min_score = float(min_score)
+        self.grid = None
+        self.last_match_ms = 0.0
+
+    def set_reference(self, grid):
+        self.grid = grid
+
+    def scan_to_points(self, angles_deg, distances_mm):
+        """Robot-frame points (x forward, y left) in metres from an LD06 revolution."""
+        angles = np.radians(np.asarray(angles_deg, dtype=float))
+        ranges = np.asarray(distances_mm, dtype=float) / 1000.0
+        valid = (ranges > 0) & (ranges < self.max_range)
+        angles, ranges = angles[valid], ranges[valid]
+        if len(ranges) > self.max_points:
+            pick = np.linspace(0, len(ranges) - 1, self.max_points).astype(int)
+            angles, ranges = angles[pick], ranges[pick]
+        return np.column_stack((ranges * np.cos(angles), ranges * np.sin(angles)))
+
+    def match(self, points, initial_pose=(0.0, 0.0, 0.0)):
+        """
+        Best pose of `points` in the reference grid frame near initial_pose.
+
+        Returns ((x, y, theta), score), or (None, score) when the best score is
+        below min_score.
+        """
+        t_start = time.perf_counter()
+        grid = self.grid
+        res = grid.resolution
+        top = len(grid.levels) - 1
+
+        # rotation step so the farthest point moves about one cell
+        if self.angular_step is None:
+            far = max(float(np.max(np.linalg.norm(points, axis=1))), res)
+            angular_step = np.arccos(1.0 - res ** 2 / (2.0 * far ** 2))
+        else:
+            angular_step = self.angular_step
+        n_rot = int(np.ceil(self.angular_window / angular_step))
+        thetas = initial_pose[2] + np.arange(-n_rot, n_rot + 1) * angular_step
+        window = int(np.ceil(self.linear_window / res))
+
+        # discretised scan cells per rotation, before translation
+        c, s = np.cos(thetas), np.sin(thetas)
+        rx = c[:, None] * points[None, :, 0] - s[:, None] * points[None, :, 1] + initial_pose[0]
+        ry = s[:, None] * points[None, :, 0] + c[:, None] * points[None, :, 1] + initial_pose[1]
+        base = np.stack((
+            np.floor((rx - grid.origin[0]) / res).astype(np.int32),
+            np.floor((ry - grid.origin[1]) / res).astype(np.int32),
+        ), axis=2)
+
+        # top-level candidates: every rotation x coarse translation block
+        coarse = np.arange(-window, window + 1, 1 << top)
+        offsets = np.stack(np.meshgrid(coarse, coarse, indexing="ij"), axis=2).reshape(-1, 2)
+        stack = []
+        for r in range(len(thetas)):
+            scores = grid.score(top, base[r], offsets)
+            stack.extend((float(sc), top, r, int(o[0]), int(o[1])) for sc, o in zip(scores, offsets))
+        stack.sort()
+
+        best_score, best = self.min_score, None
+        while stack:
+            score, level, r, i, j = stack.pop()
+            if score <= best_score:
+                continue
+            if level == 0:
+                best_score, best = score, (r, i, j)
+                continue
+
+            half = 1 << (level - 1)
+            children = np.array([(i, j), (i + half, j), (i, j + half), (i + half, j + half)])
+            children = children[np.all(children <= window, axis=1)]
+            scores = grid.score(level - 1, base[r], children)
+            order = np.argsort(scores)
+            stack.extend((float(scores[k]), level - 1, r, int(children[k, 0]), int(children[k, 1]))
+                         for k in order if scores[k] > best_score)
+
+        self.last_match_ms = (time.perf_counter() - t_start) * 1000.0
+        if best is None:
+            return None, best_score
+        r, i, j = best
+        pose = (initial_pose[0] + i * res, initial_pose[1] + j * res, float(thetas[r]))
+        return pose, best_score
+
+
+# --- 3. LIDAR ODOMETRY ---
+class ScanOdometry:
+    """
+    Relative pose increments at the lidar rate from scan-to-scan matching.
+
+    Each revolution is matched against the previous one; the increment is in
+    the previous robot frame (dx forward, dy left, dtheta) and is also
+    composed into self.pose. Feed the increments to
+    CameraLocalization.apply_odometry() / ParticleLocalizer.predict() between
+    tag sightings.
+    """
+
+    def __init__(self, matcher=None, resolution=0.05, levels=4):
+        self.matcher = matcher if matcher is not None else ScanMatcher()
+        self.resolution = resolution
+        self.levels = levels
+        self.pose = np.zeros(3)
+        self._last_delta = (0.0, 0.0, 0.0)
+        self._has_reference = False
+
+    def update(self, angles_deg, distances_mm):
+        """Returns the (dx, dy, dtheta) increment, or None if the match failed."""
+        points = self.matcher.scan_to_points(angles_deg, distances_mm)
+        if len(points) < 10:
+            return None
+
+        delta = None
+        if self._has_reference:
+            # constant-velocity guess keeps the search window centred
+            pose, _ = self.matcher.match(points, self._last_delta)
+            if pose is not None:
+                delta = pose
+                self._last_delta = pose
+                self.pose = compose(self.pose, pose)
+
+        self.matcher.set_reference(MultiResolutionGrid.from_points(points, self.resolution, levels=self.levels))
+        self._has_reference = True
+        return delta
+
+
+def compose(pose, delta):
+    """Apply a robot-frame increment to a world pose (x, y, theta)."""
+    x, y, theta = pose
+    dx, dy, dtheta = delta
+    c, s = np.cos(theta), np.sin(theta)
+    new_theta = (theta + dtheta + np.pi) % (2.0 * np.pi) - np.pi
+    return np.array([x + c * dx - s * dy, y + s * dx + c * dy, new_theta])
+
+
+# --- 4. BENCHMARK ---
+if __name__ == "__main__":
+    from AStar_Navigation_dynamic import LidarMapper
+    from particle_localizer import simulate_scan
+
+    mapper = LidarMapper()
+    angles = np.arange(0.0, 360.0, 0.75)
+    true_pose = np.array([3.0, 3.0, np.pi / 4])
+    step = np.array([0.08, 0.01, np.radians(3)])
+
+    odom = ScanOdometry()
+    odom.update(angles, simulate_scan(mapper.occupancy_grid, mapper.cell_size, true_pose, angles))
+    timings = []
+    for _ in range(20):
+        true_pose = compose(true_pose, step)
+        delta = odom.update(angles, simulate_scan(mapper.occupancy_grid, mapper.cell_size, true_pose, angles))
+        timings.append(odom.matcher.last_match_ms)
+    print(f"scan-to-scan: median {np.median(timings):.2f} ms, last delta {np.round(delta, 3)}, true {step.round(3)}")
+
+    map_matcher = ScanMatcher(linear_window=0.5, angular_window_deg=20)
+    map_matcher.set_reference(MultiResolutionGrid.from_occupancy(mapper.occupancy_grid, mapper.cell_size))
+    points = map_matcher.scan_to_points(angles, simulate_scan(mapper.occupancy_grid, mapper.cell_size, true_pose, angles))
+    guess = true_pose + np.array([0.3, -0.2, np.radians(8)])
+    pose, score = map_matcher.match(points, guess)
+    print(f"scan-to-map: {map_matcher.last_match_ms:.2f} ms, pose {np.round(pose, 3)}, true {true_pose.round(3)}, score {score:.2f}")
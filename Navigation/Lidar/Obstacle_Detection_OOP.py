@@ -5,6 +5,9 @@ import struct
 import threading
 import time
 import lgpio as GPIO
+from scan_filter import RevolutionBuffer, ScanFilter
+from obstacle_tracker import ObstacleTracker
+from vfh_planner import VFHPlanner
 
 
 class LidarSensor:
@@ -15,14 +18,22 @@ class LidarSensor:
     MESSAGE_FORMAT = "<xBHH" + "HB" * MEASUREMENT_LENGTH + "HHB"
     MAX_RANGE_MM = 12000
 
-    def __init__(self, calibration_offset_mm=0, front_angle_range=30):
+    def __init__(self, calibration_offset_mm=0, front_angle_range=30, scan_filter=None):
         self.calibration_offset = calibration_offset_mm
         self.front_angle_range = front_angle_range
 
+        # Packets are grouped into full revolutions and filtered before use
+        self.revolution_buffer = RevolutionBuffer()
+        self.scan_filter = scan_filter if scan_filter is not None else ScanFilter()
+
         self.front_min_distance_mm = 9999.0
         self.left_avg_distance_mm = 9999.0
         self.right_avg_distance_mm = 9999.0
 
+        # Latest filtered revolution: (angles_deg, distances_mm, confidences)
+        self.scan = (np.empty(0), np.empty(0), np.empty(0))
+        self.scan_time = None
+
         self.running = False
         self.thread = None
         self.serial_port = None
@@ -42,8 +53,23 @@ class LidarSensor:
         step = (stop_angle - start_angle) / (self.MEASUREMENT_LENGTH - 1)
         angles = [start_angle + step * i for i in range(self.MEASUREMENT_LENGTH)]
         distances = pos_data[0::2]
-        distances_corrected = [d + self.calibration_offset for d in distances]
-        return list(zip(angles, distances_corrected))
+        confidences = pos_data[1::2]
+        distances_corrected = [d + self.calibration_offset if d > 0 else 0 for d in distances]
+        return list(zip(angles, distances_corrected, confidences))
+
+    def _update_scan(self, angles, distances, confidences):
+        angles, distances, confidences = self.scan_filter.apply(angles, distances, confidences)
+
+        front = (angles <= self.front_angle_range) | (angles >= 360 - self.front_angle_range)
+        left = (angles >= 45) & (angles <= 135)
+        right = (angles >= 225) & (angles <= 315)
+
+        self.front_min_distance_mm = float(np.min(distances[front])) if np.any(front) else 9999.0
+        self.left_avg_distance_mm = float(np.mean(distances[left])) if np.any(left) else 9999.0
+        self.right_avg_distance_mm = float(np.mean(distances[right])) if np.any(right) else 9999.0
+
+        self.scan = (angles, distances, confidences)
+        self.scan_time = time.time()
 
     def _read_loop(self):
         try:
@@ -67,25 +93,9 @@ class LidarSensor:
                 full_data = b"\x54\x2C" + data
                 measurements = self._parse_packet(full_data)
 
-                front_points = [
-                    d for (a, d) in measurements
-                    if (a <= self.front_angle_range or a >= 360 - self.front_angle_range)
-                    and 0 < d < self.MAX_RANGE_MM
-                ]
-                left_points = [
-                    d for (a, d) in measurements
-                    if 45 <= a <= 135 and 0 < d < self.MAX_RANGE_MM
-                ]
-                right_points = [
-                    d for (a, d) in measurements
-                    if 225 <= a <= 315 and 0 < d < self.MAX_RANGE_MM
-                ]
-
-                self.front_min_distance_mm = float(np.min(front_points)) if front_points else 9999.0
-                self.left_avg_distance_mm = float(np.mean(left_points)) if left_points else 9999.0
-                self.right_avg_distance_mm = float(np.mean(right_points)) if right_points else 9999.0
-
-                time.sleep(0.01)
+                revolution = self.revolution_buffer.add_packet(measurements)
+                if revolution is not None:
+                    self._update_scan(*revolution)
 
             except Exception as e:
                 print(f"[WARN] LIDAR read error: {e}")
@@ -115,6 +125,13 @@ class LidarSensor:
     def get_side_distances(self):
         return float(self.left_avg_distance_mm), float(self.right_avg_distance_mm)
 
+    def get_scan(self):
+        """Latest filtered revolution as (angles_deg, distances_mm, confidences)."""
+        return self.scan
+
+    def get_filter_stats(self) -> dict:
+        return dict(self.scan_filter.last_stats)
+
     def get_clearer_direction(self) -> str:
         return "left" if self.left_avg_distance_mm > self.right_avg_distance_mm else "right"
 
@@ -191,6 +208,8 @@ class ObstacleDetector:
         turn_duration_s=0.6,
         clear_required_s=0.4,
         control_hz=8.0,
+        crossing_lookahead_mm=1500,
+        max_crossing_wait_s=5.0,
     ):
         self.h = gpio_handle
 
@@ -199,9 +218,14 @@ class ObstacleDetector:
         self.turn_duration_s = float(turn_duration_s)
         self.clear_required_s = float(clear_required_s)
         self.control_dt = 1.0 / float(control_hz)
+        self.crossing_lookahead_mm = float(crossing_lookahead_mm)
+        self.max_crossing_wait_s = float(max_crossing_wait_s)
 
         self.lidar = LidarSensor()
         self.ultrasonic = UltrasonicSensor(self.h)
+        self.tracker = ObstacleTracker()
+        self.vfh = VFHPlanner()
+        self.goal_bearing_deg = 0.0
 
         # Avoidance internal state
         self._avoidance_active = False
@@ -209,6 +233,10 @@ class ObstacleDetector:
         self._turn_direction = None
         self._clear_start = None
 
+        # Moving-obstacle tracking state
+        self._tracked_scan_time = None
+        self._crossing_wait_start = None
+
     def start(self):
         self.lidar.start()
         self.ultrasonic.start()
@@ -223,6 +251,30 @@ class ObstacleDetector:
         ultra_d = self.ultrasonic.get_distance()
         return float(np.min([lidar_d, ultra_d]))
 
+    def _update_tracker(self):
+        # one tracker update per new lidar revolution
+        scan_time = self.lidar.scan_time
+        if scan_time is None or scan_time == self._tracked_scan_time:
+            return
+        self._tracked_scan_time = scan_time
+        angles, distances, _ = self.lidar.get_scan()
+        self.tracker.update(angles, distances, scan_time)
+
+    def get_tracks(self):
+        self._update_tracker()
+        return self.tracker.confirmed_tracks()
+
+    def _should_wait_for_crossing(self) -> bool:
+        # someone walking across our path: stop and let them pass instead of turning,
+        # but only if they are the obstacle, i.e. inside avoid_threshold_mm themselves
+        crossing = self.tracker.crossing(self.crossing_lookahead_mm)
+        if any(np.hypot(*t.position) < self.avoid_threshold_mm for t in crossing):
+            if self._crossing_wait_start is None:
+                self._crossing_wait_start = time.time()
+            return (time.time() - self._crossing_wait_start) < self.max_crossing_wait_s
+        self._crossing_wait_start = None
+        return False
+
     def obstacle_present(self) -> bool:
         return self._fused_min_distance() < self.avoid_threshold_mm
 
@@ -236,8 +288,20 @@ class ObstacleDetector:
             return False
         return (time.time() - self._clear_start) >= self.clear_required_s
 
+    def set_goal_bearing(self, bearing_deg: float):
+        # 0 = straight ahead, positive = left (lidar convention)
+        self.goal_bearing_deg = float(bearing_deg)
+
+    def _start_timed_turn(self) -> str:
+        # fallback when no lidar revolution is available yet
+        self._turn_direction = self.lidar.get_clearer_direction()
+        self._avoidance_active = True
+        self._avoidance_end_time = time.time() + self.turn_duration_s
+        return "LEFT" if self._turn_direction == "left" else "RIGHT"
+
     def step(self) -> str:
         min_dist = self._fused_min_distance()
+        self._update_tracker()
 
         # continue a timed turn maneuver if active
         if self._avoidance_active:
@@ -250,20 +314,32 @@ class ObstacleDetector:
                 time.sleep(self.control_dt)
                 return "FORWARD"
 
-        # trigger avoidance
-        if min_dist < self.emergency_stop_mm:
-            self._turn_direction = self.lidar.get_clearer_direction()
-            self._avoidance_active = True
-            self._avoidance_end_time = time.time() + self.turn_duration_s
+        # wait for a crossing obstacle rather than starting a turn
+        if min_dist < self.avoid_threshold_mm and self._should_wait_for_crossing():
             time.sleep(self.control_dt)
             return "STOP"
+        if min_dist >= self.avoid_threshold_mm:
+            self._crossing_wait_start = None
 
-        if min_dist < self.avoid_threshold_mm:
-            self._turn_direction = self.lidar.get_clearer_direction()
-            self._avoidance_active = True
-            self._avoidance_end_time = time.time() + self.turn_duration_s
+        angles, distances, _ = self.lidar.get_scan()
+        if len(distances) == 0:
+            if min_dist < self.emergency_stop_mm:
+                self._start_timed_turn()
+                time.sleep(self.control_dt)
+                return "STOP"
+            if min_dist < self.avoid_threshold_mm:
+                cmd = self._start_timed_turn()
+                time.sleep(self.control_dt)
+                return cmd
             time.sleep(self.control_dt)
-            return "LEFT" if self._turn_direction == "left" else "RIGHT"
+            return "FORWARD"
+
+        # VFH steering, re-evaluated every control tick
+        cmd = self.vfh.steer(angles, distances, self.goal_bearing_deg)
+
+        if cmd == "FORWARD" and min_dist < self.avoid_threshold_mm:
+            # something the lidar plane misses (ultrasonic) is still ahead
+            cmd = "LEFT" if self.lidar.get_clearer_direction() == "left" else "RIGHT"
 
         time.sleep(self.control_dt)
-        return "FORWARD"
\ No newline at end of file
+        return cmd
@@ -5,6 +5,7 @@ import matplotlib.pyplot as plt
 import serial
 from enum import Enum
 import struct
+from scan_filter import ScanFilter
 
 # ----------------------------------------------------------------------
 # System Constants
@@ -24,6 +25,9 @@ PLOT_CONFIDENCE = True
 # Set the colour gradiant to use. See this URL for options:
 # https://matplotlib.org/stable/gallery/color/colormap_reference.html
 PLOT_CONFIDENCE_COLOUR_MAP = "bwr_r"
+# Run each revolution through the noise filter (confidence, speckle,
+# median) before plotting
+FILTER_SCAN = True
 # Enable debug messages
 PRINT_DEBUG = False
 # ----------------------------------------------------------------------
@@ -84,6 +88,14 @@ def get_xyc_data(measurements):
     y = np.cos(np.radians(angle)) * (distance / 1000.0)
     return x, y, confidence
 
+def filter_measurements(measurements, scan_filter):
+    # Run one revolution through the ScanFilter and repack as tuples
+    angle, distance, confidence = np.array(measurements, dtype=float).T
+    angle, distance, confidence = scan_filter.apply(angle, distance, confidence)
+    if PRINT_DEBUG:
+        print(scan_filter.last_stats)
+    return list(zip(angle, distance, confidence))
+
 running = True
 
 def on_plot_close(event):
@@ -98,6 +110,7 @@ if __name__ == "__main__":
     measurements = []
     data = b''
     state = State.SYNC0
+    scan_filter = ScanFilter()
 
     # Set up matplotlib plot
     plt.ion()
@@ -152,6 +165,8 @@ if __name__ == "__main__":
             if len(measurements) > MEASUREMENTS_PER_PLOT:
                 state = State.UPDATE_PLOT
         elif state == State.UPDATE_PLOT:
+            if FILTER_SCAN:
+                measurements = filter_measurements(measurements, scan_filter)
             x, y, c = get_xyc_data(measurements)
             # Work out max coordinate, and set the scale based on this.
             # Force a 1:1 aspect ratio
@@ -5,6 +5,8 @@ import threading
 import time
 import lgpio as GPIO
 import sys 
+from scan_filter import RevolutionBuffer, ScanFilter
+from vfh_planner import VFHPlanner
 
 # ------------------------------------------------------------
 # LIDAR PARAMETERS
@@ -31,7 +33,6 @@ BACK_LEFT = 500
 # OBSTACLE AVOIDANCE THRESHOLDS (in mm)
 EMERGENCY_STOP_MM = 250 
 AVOID_THRESHOLD_MM = 700 # Changed from 450 back to 700 to match original intent
-TURN_DURATION = 0.6 
 
 
 # GPIO INITIALIZATION
@@ -102,14 +103,19 @@ def parse_lidar_data(data):
     step = (stop_angle - start_angle) / (MEASUREMENT_LENGTH - 1)
     angles = [start_angle + step * i for i in range(MEASUREMENT_LENGTH)]
     distances = pos_data[0::2]  # mm
-    return list(zip(angles, distances))
+    confidences = pos_data[1::2]
+    return list(zip(angles, distances, confidences))
 
 front_min_distance = 9999
+latest_scan = (np.empty(0), np.empty(0))  # filtered (angles, distances) of last revolution
 running = True
 
+# Speckle / low-confidence returns are removed per revolution before use
+scan_filter = ScanFilter()
+
 def lidar_thread():
-    """Continuously read LIDAR and update global front_min_distance."""
-    global front_min_distance
+    """Continuously read LIDAR and update global front_min_distance and latest_scan."""
+    global front_min_distance, latest_scan
     try:
         lidar = serial.Serial(SERIAL_PORT, 230400, timeout=0.1) 
     except Exception as e:
@@ -118,6 +124,7 @@ def lidar_thread():
         running = False
         return
 
+    revolution_buffer = RevolutionBuffer()
     while running:
         try:
             if lidar.read() != b'\x54':
@@ -130,27 +137,33 @@ def lidar_thread():
                 continue
 
             measurements = parse_lidar_data(data)
-            
-            # Filter for the front sector (e.g., +/- 30 degrees)
-            front_points = [d for (a, d) in measurements if (a <= 60 or a >= 300) and d > 0]
-            
-            if front_points:
-                front_min_distance = np.min(front_points)
+            revolution = revolution_buffer.add_packet(measurements)
+            if revolution is None:
+                continue
+
+            angles, distances, _ = scan_filter.apply(*revolution)
+            latest_scan = (angles, distances)
+
+            # Filter for the front sector (e.g., +/- 60 degrees)
+            front = (angles <= 60) | (angles >= 300)
+
+            if np.any(front):
+                front_min_distance = np.min(distances[front])
             else:
                 front_min_distance = 9999 
 
-            time.sleep(0.01) 
         except Exception as e:
             print(f"[WARN] LIDAR read error: {e}")
             time.sleep(0.25) 
 
 
 
-# MAIN CONTROL LOOP (Fixed)
+# MAIN CONTROL LOOP (VFH)
 
-# NEW STATE VARIABLES (to manage the turn maneuver duration)
-avoidance_state = False 
-avoidance_end_time = 0 
+# VFH local planner replaces the fixed-duration turn: the steering direction
+# is re-evaluated from the latest revolution on every loop
+vfh = VFHPlanner()
+VFH_TO_MOTION = {"FORWARD": "forward", "LEFT": "turn_left", "RIGHT": "turn_right", "STOP": "stop"}
 
 # Start the separate thread for reading the LiDAR
 threading.Thread(target=lidar_thread, daemon=True).start()
@@ -158,49 +171,24 @@ threading.Thread(target=lidar_thread, daemon=True).start()
 try:
     while running:
         dist = front_min_distance
+        angles, distances = latest_scan
         
         # Log distance and current planned action
-        print(f"Distance: {dist:.1f} mm, Action: {last_action}, State: {'AVOIDING' if avoidance_state else 'CRUISING'}")
-
-        # --- State 1: Running Avoidance Maneuver ---
-        if avoidance_state:
-            if time.time() < avoidance_end_time:
-                # Continue turning until the timer expires
-                set_motion("turn_right")
-            else:
-                # Timer expired, return to cruising
-                avoidance_state = False
-                print("--- Avoidance maneuver complete. Resuming cruise. ---")
-
-        # --- State 2: Cruising or Triggering Avoidance ---
-        else: 
-            if dist < EMERGENCY_STOP_MM:
-                # EMERGENCY: Too close (e.g., < 25 cm). Stop immediately, then start turn.
-                print("!!! EMERGENCY STOP: Initiating turn !!!")
-                # Immediately transition to the turning state
-                avoidance_state = True
-                avoidance_end_time = time.time() + TURN_DURATION
-                set_motion("turn_right") 
-                if dist > AVOID_THRESHOLD_MM:
-
-                    print("!!! Obstacle avoided, move forward !!!")
-                    set_motion("forward")
-                
-            elif dist < AVOID_THRESHOLD_MM:
-                # OBSTACLE AHEAD: Start turn maneuver.
-                print("Obstacle detected. Initiating turn right maneuver.")
-                avoidance_state = True
-                avoidance_end_time = time.time() + TURN_DURATION
-                set_motion("turn_right")
-                if dist > AVOID_THRESHOLD_MM:
-                    print("!!! Obstacle avoided, move forward !!!")
-                    set_motion("forward")
-            else:
-                # PATH CLEAR: Drive forward.
-                set_motion("forward")
-
-        # Control loop frequency (2Hz)
-        time.sleep(1.0) 
+        print(f"Distance: {dist:.1f} mm, Action: {last_action}, State: {'AVOIDING' if dist < AVOID_THRESHOLD_MM else 'CRUISING'}")
+
+        if len(distances) == 0:
+            # No full revolution yet: only drive when the front is clear
+            set_motion("forward" if dist >= AVOID_THRESHOLD_MM else "stop")
+        else:
+            command = vfh.steer(angles, distances)
+            if dist < EMERGENCY_STOP_MM and command == "FORWARD":
+                # EMERGENCY: Too close and no clear heading ahead
+                print("!!! EMERGENCY STOP !!!")
+                command = "STOP"
+            set_motion(VFH_TO_MOTION[command])
+
+        # Control loop frequency (10Hz)
+        time.sleep(0.1) 
 
 except KeyboardInterrupt:
     pass
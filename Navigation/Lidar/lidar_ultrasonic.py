@@ -7,6 +7,8 @@ import threading
 import time
 import lgpio as GPIO
 import sys
+from scan_filter import RevolutionBuffer, ScanFilter
+from vfh_planner import VFHPlanner
 
 # PIN CONFIGURATION
 # Motor Pins (Servo PWM controlled by lgpio.tx_servo)
@@ -39,15 +41,18 @@ LIDAR_CALIBRATION_OFFSET_MM = 0
 # OBSTACLE AVOIDANCE THRESHOLDS (in mm)
 EMERGENCY_STOP_MM = 250
 AVOID_THRESHOLD_MM = 700
-TURN_DURATION = 0.6
 
 # Global shared variables for sensor data
 front_min_distance_lidar_mm = 9999
+latest_scan = (np.empty(0), np.empty(0)) # Filtered (angles, distances) of last revolution
 ultrasonic_distance_mm = 9999
 running = True
 last_action = None
 h = -1 # GPIO chip handle initialized to -1 (invalid)
 
+# Per-revolution LIDAR noise filter (confidence, speckle, median)
+scan_filter = ScanFilter()
+
 # GPIO INITIALIZATION
 try:
     h = GPIO.gpiochip_open(CHIP) 
@@ -138,15 +143,16 @@ def parse_lidar_data(data):
     
     angles = [start_angle + step * i for i in range(MEASUREMENT_LENGTH)]
     distances = pos_data[0::2]  # Distances are at even indices in pos_data
+    confidences = pos_data[1::2]  # Confidence bytes are at odd indices
 
-    # Apply calibration offset during parsing
-    distances_corrected = [d + LIDAR_CALIBRATION_OFFSET_MM for d in distances]
+    # Apply calibration offset during parsing (0 stays 0 = no return)
+    distances_corrected = [d + LIDAR_CALIBRATION_OFFSET_MM if d > 0 else 0 for d in distances]
 
-    return list(zip(angles, distances_corrected))
+    return list(zip(angles, distances_corrected, confidences))
 
 def lidar_thread():
-    """Continuously read LIDAR and update global front_min_distance_lidar_mm."""
-    global front_min_distance_lidar_mm
+    """Continuously read LIDAR and update global front_min_distance_lidar_mm and latest_scan."""
+    global front_min_distance_lidar_mm, latest_scan
     
     try:
         # Try to open serial port
@@ -157,6 +163,7 @@ def lidar_thread():
         running = False
         return
 
+    revolution_buffer = RevolutionBuffer()
     while running:
         try:
             # Look for the start bytes (0x54 0x2C)
@@ -175,18 +182,23 @@ def lidar_thread():
             full_data = b'\x54\x2C' + data
             
             measurements = parse_lidar_data(full_data)
+
+            # Only act on complete, filtered revolutions
+            revolution = revolution_buffer.add_packet(measurements)
+            if revolution is None:
+                continue
+            angles, distances, _ = scan_filter.apply(*revolution)
+            latest_scan = (angles, distances)
             
             # Filter for the front sector (e.g., +/- 30 degrees: 0 to 30 or 330 to 360)
-            front_points = [d for (a, d) in measurements if (a <= 30 or a >= 330) and d > 0]
+            front = (angles <= 30) | (angles >= 330)
             
-            if front_points:
+            if np.any(front):
                 # np.min ensures we are using the closest object in the front sector
-                front_min_distance_lidar_mm = np.min(front_points)
+                front_min_distance_lidar_mm = np.min(distances[front])
             else:
                 front_min_distance_lidar_mm = 9999 
 
-            time.sleep(0.01) # Short delay for other threads
-            
         except Exception as e:
             # Handle reading errors without crashing the main loop
             print(f"[WARN] LIDAR thread read error: {e}")
@@ -239,9 +251,11 @@ def ultrasonic_thread():
             time.sleep(0.5) 
 
 
-# MAIN CONTROL LOOP (FUSION)
-avoidance_state = False 
-avoidance_end_time = 0 
+# MAIN CONTROL LOOP (FUSION + VFH)
+# VFH local planner: steering is re-evaluated from the latest lidar
+# revolution every loop instead of committing to a fixed-duration turn
+vfh = VFHPlanner()
+VFH_TO_MOTION = {"FORWARD": "forward", "LEFT": "turn_left", "RIGHT": "turn_right", "STOP": "stop"}
 
 # Start threads for both sensors
 threading.Thread(target=lidar_thread, daemon=True).start()
@@ -256,6 +270,7 @@ try:
         # --- SENSOR FUSION ---
         lidar_dist = front_min_distance_lidar_mm 
         ultra_dist = ultrasonic_distance_mm 
+        angles, distances = latest_scan
 
         # FUSE: Take the minimum distance (closest obstacle) from both sensors
         min_distance_fused = np.min([lidar_dist, ultra_dist])
@@ -263,40 +278,25 @@ try:
         # Log fusion result and current planned action
         print(f"LIDAR: {lidar_dist:.1f}mm | ULTRA: {ultra_dist:.1f}mm | FUSED MIN: {min_distance_fused:.1f}mm")
 
-        # --- State 1: Running Avoidance Maneuver (Turning) ---
-        if avoidance_state:
-            if time.time() < avoidance_end_time:
-                set_motion("turn_right")
-            else:
-                # Maneuver complete, check if path is clear before cruising
-                avoidance_state = False
-                print("--- Avoidance maneuver complete. Checking path. ---")
-
-        # --- State 2: Cruising or Triggering Avoidance ---
-        else: 
-            if min_distance_fused < EMERGENCY_STOP_MM:
-                # EMERGENCY: Too close. Stop and start turn immediately.
-                print("!!! EMERGENCY STOP: Initiating turn !!!")
-                set_motion("stop") # Brake/Stop first
-                time.sleep(0.1)
-                
-                avoidance_state = True
-                avoidance_end_time = time.time() + TURN_DURATION
-                set_motion("turn_right")
-                
-            elif min_distance_fused < AVOID_THRESHOLD_MM:
-                # OBSTACLE AHEAD: Start turn maneuver.
-                print("Obstacle detected. Initiating turn right maneuver.")
-                avoidance_state = True
-                avoidance_end_time = time.time() + TURN_DURATION
-                set_motion("turn_right")
-                
-            else:
-                # PATH CLEAR: Drive forward.
-                set_motion("forward")
-
-        # Control loop frequency (2Hz)
-        time.sleep(0.5) 
+        if len(distances) == 0:
+            # No full lidar revolution yet: only drive when the front is clear
+            set_motion("forward" if min_distance_fused >= AVOID_THRESHOLD_MM else "stop")
+        else:
+            command = vfh.steer(angles, distances)
+
+            if command == "FORWARD" and min_distance_fused < EMERGENCY_STOP_MM:
+                # EMERGENCY: the ultrasonic sees something right ahead that
+                # the lidar plane misses
+                print("!!! EMERGENCY STOP !!!")
+                command = "STOP"
+            elif command == "FORWARD" and min_distance_fused < AVOID_THRESHOLD_MM:
+                # Ultrasonic-only obstacle: turn away from it
+                command = "RIGHT"
+
+            set_motion(VFH_TO_MOTION[command])
+
+        # Control loop frequency (10Hz)
+        time.sleep(0.1) 
 
 except KeyboardInterrupt:
     pass
@@ -0,0 +1,242 @@
+# obstacle_tracker.py
+import time
+import numpy as np
+
+
+class Track:
+    """
+    One tracked obstacle with a constant-velocity Kalman filter.
+
+    State is [x, y, vx, vy] in the robot frame (mm, mm/s), using the same axes
+    as lidar_mapping.get_xyc_data: y points forward (0 deg), x towards 90 deg.
+    """
+
+    def __init__(self, track_id, position, timestamp, pos_var, vel_var):
+        self.id = track_id
+        self.x = np.array([position[0], position[1], 0.0, 0.0])
+        self.P = np.diag([pos_var, pos_var, vel_var, vel_var])
+        self.last_time = timestamp
+        self.hits = 1
+        self.misses = 0
+        self.size_mm = 0.0
+
+    @property
+    def position(self):
+        return self.x[:2].copy()
+
+    @property
+    def velocity(self):
+        return self.x[2:].copy()
+
+    @property
+    def speed(self) -> float:
+        return float(np.hypot(self.x[2], self.x[3]))
+
+    def predict(self, timestamp, accel_var):
+        dt = max(timestamp - self.last_time, 0.0)
+        F = np.eye(4)
+        F[0, 2] = F[1, 3] = dt
+
+        # white-acceleration process noise
+        dt2, dt3, dt4 = dt * dt, dt ** 3 / 2.0, dt ** 4 / 4.0
+        Q = accel_var * np.array([
+            [dt4, 0, dt3, 0],
+            [0, dt4, 0, dt3],
+            [dt3, 0, dt2, 0],
+            [0, dt3, 0, dt2],
+        ])
+
+        self.x = F @ self.x
+        self.P = F @ self.P @ F.T + Q
+        self.last_time = timestamp
+
+    def update(self, measurement, meas_var):
+        H = np.zeros((2, 4))
+        H[0, 0] = H[1, 1] = 1.0
+        S = H @ self.P @ H.T + np.eye(2) * meas_var
+        K = self.P @ H.T @ np.linalg.inv(S)
+        self.x = self.x + K @ (np.asarray(measurement) - H @ self.x)
+        self.P = (np.eye(4) - K @ H) @ self.P
+        self.hits += 1
+        self.misses = 0
+
+    def time_to_collision(self, radius_mm) -> float:
+        """
+        Seconds until the track comes within radius_mm of the robot, assuming
+        both keep their current velocity (robot stationary). inf if it never does.
+        """
+        p, v = self.x[:2], self.x[2:]
+        c = float(p @ p) - radius_mm ** 2
+        if c <= 0:
+            return 0.0
+
+        a = float(v @ v)
+        b = 2.0 * float(p @ v)
+        if a < 1e-9 or b >= 0:
+            return float("inf")
+
+        disc = b * b - 4.0 * a * c
+        if disc < 0:
+            return float("inf")
+        return (-b - np.sqrt(disc)) / (2.0 * a)
+
+
+class ObstacleTracker:
+    """
+    Tracks obstacles across lidar revolutions.
+
+    Each revolution is segmented into clusters (consecutive points closer than
+    cluster_gap_mm), clusters are associated to existing tracks by gated nearest
+    neighbour, and every track runs a constant-velocity Kalman filter. Large
+    clusters (walls, tables) are not tracked.
+
+    Velocities are relative to the robot; there is no odometry, so they are
+    only true ground speeds while the robot is stopped. Lateral velocity (vx)
+    is largely unaffected by driving forward, which is what crossing() uses.
+    """
+
+    def __init__(
+        self,
+        cluster_gap_mm=150.0,
+        min_cluster_points=3,
+        max_cluster_size_mm=900.0,
+        gate_mm=500.0,
+        meas_std_mm=50.0,
+        accel_std_mm_s2=1500.0,
+        init_vel_std_mm_s=1000.0,
+        max_misses=3,
+        min_hits=3,
+        max_range_mm=4000.0,
+    ):
+        self.cluster_gap_mm = float(cluster_gap_mm)
+        self.min_cluster_points = int(min_cluster_points)
+        self.max_cluster_size_mm = float(max_cluster_size_mm)
+        self.gate_mm = float(gate_mm)
+        self.meas_var = float(meas_std_mm) ** 2
+        self.accel_var = float(accel_std_mm_s2) ** 2
+        self.init_vel_var = float(init_vel_std_mm_s) ** 2
+        self.max_misses = int(max_misses)
+        self.min_hits = int(min_hits)
+        self.max_range_mm = float(max_range_mm)
+
+        self.tracks = []
+        self._next_id = 0
+        self.last_cost_ms = 0.0
+
+    def update(self, angles, distances, timestamp=None):
+        """
+        angles: degrees, distances: mm (one filtered revolution)
+
+        Returns the list of confirmed tracks.
+        """
+        t_start = time.perf_counter()
+        if timestamp is None:
+            timestamp = time.time()
+
+        centroids, sizes = self.cluster(angles, distances)
+
+        for track in self.tracks:
+            track.predict(timestamp, self.accel_var)
+
+        matches, unmatched_tracks, unmatched_clusters = self._associate(centroids)
+
+        for ti, ci in matches:
+            self.tracks[ti].update(centroids[ci], self.meas_var)
+            self.tracks[ti].size_mm = float(sizes[ci])
+        for ti in unmatched_tracks:
+            self.tracks[ti].misses += 1
+        for ci in unmatched_clusters:
+            track = Track(self._next_id, centroids[ci], timestamp, self.meas_var, self.init_vel_var)
+            track.size_mm = float(sizes[ci])
+            self.tracks.append(track)
+            self._next_id += 1
+
+        self.tracks = [t for t in self.tracks if t.misses <= self.max_misses]
+
+        self.last_cost_ms = (time.perf_counter() - t_start) * 1000.0
+        return self.confirmed_tracks()
+
+    def cluster(self, angles, distances):
+        """
+        Adjacency segmentation of one revolution.
+
+        Returns (centroids (N, 2), sizes (N,)) in mm for clusters that pass the
+        point-count and size limits.
+        """
+        angles = np.asarray(angles, dtype=float)
+        distances = np.asarray(distances, dtype=float)
+        keep = (distances > 0) & (distances < self.max_range_mm)
+        angles, distances = angles[keep], distances[keep]
+        if len(distances) < self.min_cluster_points:
+            return np.empty((0, 2)), np.empty(0)
+
+        order = np.argsort(angles)
+        rad = np.radians(angles[order])
+        d = distances[order]
+        xy = np.column_stack((np.sin(rad) * d, np.cos(rad) * d))
+
+        gaps = np.linalg.norm(np.diff(xy, axis=0), axis=1)
+        labels = np.concatenate(([0], np.cumsum(gaps > self.cluster_gap_mm)))
+
+        # join the last cluster onto the first across the 0/360 seam
+        if labels[-1] > 0 and np.linalg.norm(xy[-1] - xy[0]) <= self.cluster_gap_mm:
+            labels[labels == labels[-1]] = 0
+
+        n_labels = labels.max() + 1
+        counts = np.bincount(labels, minlength=n_labels)
+        cx = np.bincount(labels, weights=xy[:, 0], minlength=n_labels)
+        cy = np.bincount(labels, weights=xy[:, 1], minlength=n_labels)
+        centroids = np.column_stack((cx, cy)) / np.maximum(counts, 1)[:, None]
+
+        # cluster extent: twice the largest point-to-centroid distance
+        spread = np.linalg.norm(xy - centroids[labels], axis=1)
+        sizes = np.zeros(n_labels)
+        np.maximum.at(sizes, labels, 2.0 * spread)
+
+        good = (counts >= self.min_cluster_points) & (sizes <= self.max_cluster_size_mm)
+        return centroids[good], sizes[good]
+
+    def _associate(self, centroids):
+        n_tracks, n_clusters = len(self.tracks), len(centroids)
+        if n_tracks == 0 or n_clusters == 0:
+            return [], list(range(n_tracks)), list(range(n_clusters))
+
+        predicted = np.array([t.x[:2] for t in self.tracks])
+        cost = np.linalg.norm(predicted[:, None, :] - centroids[None, :, :], axis=2)
+
+        # greedy assignment in order of increasing distance inside the gate
+        matches = []
+        used_tracks, used_clusters = set(), set()
+        for flat in np.argsort(cost, axis=None):
+            ti, ci = divmod(int(flat), n_clusters)
+            if cost[ti, ci] > self.gate_mm:
+                break
+            if ti in used_tracks or ci in used_clusters:
+                continue
+            matches.append((ti, ci))
+            used_tracks.add(ti)
+            used_clusters.add(ci)
+
+        unmatched_tracks = [i for i in range(n_tracks) if i not in used_tracks]
+        unmatched_clusters = [i for i in range(n_clusters) if i not in used_clusters]
+        return matches, unmatched_tracks, unmatched_clusters
+
+    def confirmed_tracks(self):
+        return [t for t in self.tracks if t.hits >= self.min_hits and t.misses == 0]
+
+    def crossing(self, max_distance_mm, front_half_width_mm=400.0, min_lateral_speed_mm_s=200.0):
+        """
+        Confirmed tracks moving sideways across the robot's path within
+        max_distance_mm ahead.
+        """
+        crossing = []
+        for t in self.confirmed_tracks():
+            x, y = t.x[0], t.x[1]
+            if not (0 < y < max_distance_mm):
+                continue
+            if abs(t.x[2]) < min_lateral_speed_mm_s:
+                continue
+            # inside the corridor, or heading into it
+            if abs(x) < front_half_width_mm or x * t.x[2] < 0:
+                crossing.append(t)
+        return crossing
@@ -0,0 +1,198 @@
+# scan_filter.py
+import time
+import numpy as np
+
+
+class RevolutionBuffer:
+    """
+    Collects decoded LD06 packets until the start angle wraps back past 0 deg,
+    then returns the completed revolution as numpy arrays.
+    """
+
+    def __init__(self):
+        self._angles = []
+        self._distances = []
+        self._confidences = []
+        self._last_start_angle = None
+
+    def add_packet(self, measurements):
+        """
+        measurements: list of (angle_deg, distance_mm, confidence) for one packet
+
+        Returns:
+            (angles, distances, confidences) arrays for the previous revolution
+            when this packet starts a new one, otherwise None.
+        """
+        if not measurements:
+            return None
+
+        angles, distances, confidences = zip(*measurements)
+        start_angle = angles[0] % 360.0
+
+        revolution = None
+        if self._last_start_angle is not None and start_angle < self._last_start_angle:
+            revolution = self._flush()
+        self._last_start_angle = start_angle
+
+        self._angles.append(angles)
+        self._distances.append(distances)
+        self._confidences.append(confidences)
+        return revolution
+
+    def _flush(self):
+        if not self._angles:
+            return None
+        angles = np.asarray(self._angles, dtype=float).ravel() % 360.0
+        distances = np.asarray(self._distances, dtype=float).ravel()
+        confidences = np.asarray(self._confidences, dtype=float).ravel()
+        self._angles, self._distances, self._confidences = [], [], []
+        return angles, distances, confidences
+
+
+class ScanFilter:
+    """
+    Per-revolution noise filter for LD06 scans.
+
+    Stages (all vectorised over the whole revolution):
+      1. range + confidence threshold
+      2. isolated-point rejection (speckle with no neighbour at a similar range)
+      3. angular median filter over the range values
+      4. optional angular binning (closest return per bin) or voxel downsampling
+
+    After every apply() the cost and number of removed points are in last_stats.
+    """
+
+    def __init__(
+        self,
+        min_confidence=100,
+        max_range_mm=12000,
+        isolation_mm=150.0,
+        isolation_max_gap_deg=3.0,
+        min_neighbours=1,
+        median_window=3,
+        angular_bin_deg=None,
+        voxel_size_mm=None,
+    ):
+        self.min_confidence = float(min_confidence)
+        self.max_range_mm = float(max_range_mm)
+        self.isolation_mm = float(isolation_mm)
+        self.isolation_max_gap_deg = float(isolation_max_gap_deg)
+        self.min_neighbours = int(min_neighbours)
+        self.median_window = int(median_window)
+        self.angular_bin_deg = angular_bin_deg
+        self.voxel_size_mm = voxel_size_mm
+
+        self.last_stats = {
+            "input": 0,
+            "output": 0,
+            "removed": 0,
+            "low_confidence": 0,
+            "isolated": 0,
+            "downsampled": 0,
+            "cost_ms": 0.0,
+        }
+
+    def apply(self, angles, distances, confidences):
+        """
+        angles: degrees, distances: mm, confidences: 0..255 (arrays of equal length)
+
+        Returns filtered (angles, distances, confidences), sorted by angle.
+        """
+        t_start = time.perf_counter()
+
+        angles = np.asarray(angles, dtype=float) % 360.0
+        distances = np.asarray(distances, dtype=float)
+        confidences = np.asarray(confidences, dtype=float)
+        n_input = len(distances)
+
+        # 1) range + confidence
+        valid = (
+            (distances > 0)
+            & (distances < self.max_range_mm)
+            & (confidences >= self.min_confidence)
+        )
+        n_low_confidence = n_input - int(np.count_nonzero(valid))
+
+        order = np.argsort(angles[valid], kind="stable")
+        angles = angles[valid][order]
+        distances = distances[valid][order]
+        confidences = confidences[valid][order]
+
+        # 2) isolated points
+        n_isolated = 0
+        if self.min_neighbours > 0 and len(distances) > 2:
+            keep = self._non_isolated_mask(angles, distances)
+            n_isolated = len(distances) - int(np.count_nonzero(keep))
+            angles, distances, confidences = angles[keep], distances[keep], confidences[keep]
+
+        # 3) angular median
+        if self.median_window > 1 and len(distances) >= self.median_window:
+            distances = self._median(distances)
+
+        # 4) downsampling
+        n_before_downsample = len(distances)
+        if self.angular_bin_deg:
+            angles, distances, confidences = self._angular_downsample(angles, distances, confidences)
+        elif self.voxel_size_mm:
+            angles, distances, confidences = self._voxel_downsample(angles, distances, confidences)
+
+        n_output = len(distances)
+        self.last_stats = {
+            "input": n_input,
+            "output": n_output,
+            "removed": n_low_confidence + n_isolated,
+            "low_confidence": n_low_confidence,
+            "isolated": n_isolated,
+            "downsampled": n_before_downsample - n_output,
+            "cost_ms": (time.perf_counter() - t_start) * 1000.0,
+        }
+        return angles, distances, confidences
+
+    def _non_isolated_mask(self, angles, distances):
+        # neighbours on each side, wrapping around 360 deg
+        prev_d, next_d = np.roll(distances, 1), np.roll(distances, -1)
+        prev_gap = (angles - np.roll(angles, 1)) % 360.0
+        next_gap = (np.roll(angles, -1) - angles) % 360.0
+
+        close_prev = (np.abs(distances - prev_d) <= self.isolation_mm) & (prev_gap <= self.isolation_max_gap_deg)
+        close_next = (np.abs(distances - next_d) <= self.isolation_mm) & (next_gap <= self.isolation_max_gap_deg)
+        neighbours = close_prev.astype(np.int8) + close_next.astype(np.int8)
+        return neighbours >= self.min_neighbours
+
+    def _median(self, distances):
+        half = self.median_window // 2
+        padded = np.concatenate((distances[-half:], distances, distances[:half]))
+        windows = np.lib.stride_tricks.sliding_window_view(padded, self.median_window)
+        return np.median(windows, axis=1)
+
+    def _angular_downsample(self, angles, distances, confidences):
+        if len(distances) == 0:
+            return angles, distances, confidences
+        bins = np.floor(angles / self.angular_bin_deg).astype(np.int64)
+        # angles are sorted, so every bin is one contiguous run
+        starts = np.flatnonzero(np.r_[True, bins[1:] != bins[:-1]])
+        # keep the closest return per bin so obstacles are never thinned out
+        binned_distances = np.minimum.reduceat(distances, starts)
+        binned_confidences = np.maximum.reduceat(confidences, starts)
+        binned_angles = (bins[starts] + 0.5) * self.angular_bin_deg
+        return binned_angles, binned_distances, binned_confidences
+
+    def _voxel_downsample(self, angles, distances, confidences):
+        if len(distances) == 0:
+            return angles, distances, confidences
+        # same axis convention as lidar_mapping.get_xyc_data
+        rad = np.radians(angles)
+        x = np.sin(rad) * distances
+        y = np.cos(rad) * distances
+
+        keys = np.floor(np.column_stack((x, y)) / self.voxel_size_mm).astype(np.int64)
+        _, inverse, counts = np.unique(keys, axis=0, return_inverse=True, return_counts=True)
+        inverse = inverse.ravel()
+        x_mean = np.bincount(inverse, weights=x) / counts
+        y_mean = np.bincount(inverse, weights=y) / counts
+        c_mean = np.bincount(inverse, weights=confidences) / counts
+
+        voxel_angles = np.degrees(np.arctan2(x_mean, y_mean)) % 360.0
+        voxel_distances = np.hypot(x_mean, y_mean)
+        order = np.argsort(voxel_angles)
+        return voxel_angles[order], voxel_distances[order], c_mean[order]
@@ -0,0 +1,144 @@
+# vfh_planner.py
+import numpy as np
+
+
+class VFHPlanner:
+    """
+    Vector Field Histogram (VFH+) local planner for one lidar revolution.
+
+    Angles follow the LD06 / LidarSensor convention: 0 deg is straight ahead
+    and 90 deg is the left side. Internally headings are signed, in
+    (-180, 180], positive to the left.
+
+    Each call builds a polar obstacle density histogram (every return is
+    enlarged by the robot radius + safety margin), thresholds it with
+    hysteresis, and picks the free valley direction closest to the goal
+    bearing. The chosen heading is turned into a motor command every tick,
+    so there is no fixed-duration turn to wait out.
+    """
+
+    def __init__(
+        self,
+        sector_deg=5.0,
+        max_range_mm=1500.0,
+        robot_radius_mm=200.0,
+        safety_margin_mm=100.0,
+        threshold_low=0.3,
+        threshold_high=0.5,
+        wide_valley_deg=40.0,
+        heading_tol_deg=15.0,
+        goal_weight=5.0,
+        heading_weight=2.0,
+        previous_weight=2.0,
+    ):
+        self.sector_deg = float(sector_deg)
+        self.n_sectors = int(round(360.0 / self.sector_deg))
+        self.max_range_mm = float(max_range_mm)
+        self.enlarge_mm = float(robot_radius_mm) + float(safety_margin_mm)
+        self.threshold_low = float(threshold_low)
+        self.threshold_high = float(threshold_high)
+        self.wide_valley_sectors = max(1, int(round(wide_valley_deg / self.sector_deg)))
+        self.heading_tol_deg = float(heading_tol_deg)
+        self.goal_weight = float(goal_weight)
+        self.heading_weight = float(heading_weight)
+        self.previous_weight = float(previous_weight)
+
+        # sector centres as signed headings
+        centres = (np.arange(self.n_sectors) + 0.5) * self.sector_deg
+        self.sector_headings = _wrap_deg(centres)
+
+        self._blocked = np.zeros(self.n_sectors, dtype=bool)
+        self.previous_heading_deg = 0.0
+        self.last_histogram = np.zeros(self.n_sectors)
+
+    def histogram(self, angles, distances):
+        """Polar obstacle density per sector (0 = free, ~1 = wall at the robot)."""
+        angles = np.asarray(angles, dtype=float)
+        distances = np.asarray(distances, dtype=float)
+        near = (distances > 0) & (distances < self.max_range_mm)
+        angles, distances = angles[near], distances[near]
+        if len(distances) == 0:
+            return np.zeros(self.n_sectors)
+
+        # magnitude grows linearly as the obstacle gets closer
+        magnitude = 1.0 - distances / self.max_range_mm
+
+        # enlargement: a return blocks every sector within asin(r / d) of it
+        ratio = np.clip(self.enlarge_mm / np.maximum(distances, 1.0), 0.0, 1.0)
+        half_width = np.degrees(np.arcsin(ratio)) + self.sector_deg / 2.0
+
+        diff = np.abs(_wrap_deg(self.sector_headings[None, :] - angles[:, None]))
+        covered = diff <= half_width[:, None]
+        return np.max(np.where(covered, magnitude[:, None], 0.0), axis=0)
+
+    def select_heading(self, angles, distances, goal_bearing_deg=0.0):
+        """
+        Returns the chosen signed heading in degrees, or None when every
+        direction is blocked.
+        """
+        density = self.histogram(angles, distances)
+        self.last_histogram = density
+
+        # hysteresis keeps sector states from flickering between revolutions
+        blocked = self._blocked.copy()
+        blocked[density > self.threshold_high] = True
+        blocked[density < self.threshold_low] = False
+        self._blocked = blocked
+
+        if blocked.all():
+            return None
+
+        goal = float(_wrap_deg(goal_bearing_deg))
+        if not blocked.any():
+            candidates = np.array([goal])
+        else:
+            candidates = self._valley_candidates(blocked, goal)
+
+        cost = (
+            self.goal_weight * np.abs(_wrap_deg(candidates - goal))
+            + self.heading_weight * np.abs(candidates)
+            + self.previous_weight * np.abs(_wrap_deg(candidates - self.previous_heading_deg))
+        )
+        heading = float(candidates[np.argmin(cost)])
+        self.previous_heading_deg = heading
+        return heading
+
+    def _valley_candidates(self, blocked, goal):
+        # rotate so index 0 is blocked, then every free run is contiguous
+        shift = int(np.argmax(blocked))
+        free = ~np.roll(blocked, -shift)
+        edges = np.diff(np.r_[0, free.astype(np.int8), 0])
+        starts = np.flatnonzero(edges == 1)
+        ends = np.flatnonzero(edges == -1) - 1
+
+        candidates = []
+        for start, end in zip(starts, ends):
+            width = end - start + 1
+            right_edge = (start + shift) % self.n_sectors
+            left_edge = (end + shift) % self.n_sectors
+            if width >= self.wide_valley_sectors:
+                # wide valley: hug the nearer edge, or head straight for the goal
+                half = self.wide_valley_sectors // 2
+                candidates.append(self.sector_headings[(right_edge + half) % self.n_sectors])
+                candidates.append(self.sector_headings[(left_edge - half) % self.n_sectors])
+                goal_sector = int(((goal % 360.0) // self.sector_deg)) % self.n_sectors
+                if (goal_sector - right_edge) % self.n_sectors < width:
+                    candidates.append(goal)
+            else:
+                centre = (right_edge + (width - 1) / 2.0) * self.sector_deg + self.sector_deg / 2.0
+                candidates.append(float(_wrap_deg(centre)))
+        return np.asarray(candidates, dtype=float)
+
+    def steer(self, angles, distances, goal_bearing_deg=0.0) -> str:
+        """Motor command (FORWARD / LEFT / RIGHT / STOP) for this control tick."""
+        heading = self.select_heading(angles, distances, goal_bearing_deg)
+        if heading is None:
+            return "STOP"
+        if abs(heading) <= self.heading_tol_deg:
+            return "FORWARD"
+        return "LEFT" if heading > 0 else "RIGHT"
+
+
+def _wrap_deg(angle):
+    """Wrap degrees into (-180, 180]."""
+    return 180.0 - np.mod(180.0 - np.asarray(angle, dtype=float), 360.0)
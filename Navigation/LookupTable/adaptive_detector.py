@@ -0,0 +1,162 @@
+import time
+import cv2
+import numpy as np
+from pupil_apriltags import Detector
+
+
+class DetectorPool:
+    """
+    Pre-built pupil_apriltags detectors, one per quad_decimate level.
+
+    quad_decimate is fixed when a Detector is created, so switching it
+    per frame means keeping one instance per setting instead of rebuilding.
+    """
+
+    def __init__(self, decimations=(1.0, 1.5, 2.0, 3.0, 4.0), families="tag36h11", **detector_kwargs):
+        self.decimations = tuple(sorted(decimations))
+        self.detectors = {
+            d: Detector(families=families, quad_decimate=d, **detector_kwargs)
+            for d in self.decimations
+        }
+
+    def get(self, decimate):
+        return self.detectors[decimate]
+
+
+class AdaptiveDetector:
+    """
+    Chooses quad_decimate and a processing scale per frame from the last
+    observed tag width and the navigation state.
+
+    The rule is to keep the tag at least min_width_px wide in the decimated
+    image. A close tag that stays wide enough at the coarsest decimation is
+    also detected on a downscaled image. If nothing has been observed, e.g.
+    after a miss, it detects at full resolution so far tags are not lost.
+    """
+
+    # Decimated tag width (px) to keep per NavState. While rotating to search,
+    # the tag may be blurred, so there is more margin. While approaching it
+    # only gets bigger.
+    STATE_MIN_WIDTH_PX = {
+        "S1_ROTATE_LEFT": 60,
+        "S2_CENTER_TAG": 40,
+        "S3_MOVE_FORWARD": 30,
+    }
+    DEFAULT_MIN_WIDTH_PX = 40
+
+    def __init__(self, pool=None, scales=(1.0, 0.5)):
+        self.pool = pool if pool is not None else DetectorPool(nthreads=2, refine_edges=1)
+        self.scales = tuple(sorted(scales, reverse=True))
+        self.state = None
+        self.tag_width_px = None
+        self.last_settings = (self.pool.decimations[0], 1.0)
+
+    def set_state(self, state):
+        self.state = state
+
+    def observe(self, corners):
+        """Width of the tag to keep detectable, from its corners, or None if it was missed."""
+        if corners is None:
+            self.tag_width_px = None
+        else:
+            self.tag_width_px = float(np.linalg.norm(corners[0] - corners[1]))
+
+    def choose(self):
+        """(quad_decimate, scale) for the next frame."""
+        finest = self.pool.decimations[0]
+        if self.tag_width_px is None:
+            return finest, 1.0
+
+        min_width = self.STATE_MIN_WIDTH_PX.get(self.state, self.DEFAULT_MIN_WIDTH_PX)
+        usable = [d for d in self.pool.decimations if self.tag_width_px / d >= min_width]
+        decimate = usable[-1] if usable else finest
+
+        scale = 1.0
+        if decimate == self.pool.decimations[-1]:
+            fits = [s for s in self.scales if self.tag_width_px * s / decimate >= min_width]
+            scale = fits[-1] if fits else 1.0
+        return decimate, scale
+
+    def detect(self, gray, estimate_tag_pose=False, camera_params=None, tag_size=None):
+        """Same as Detector.detect, with corners and centre in the pixels of gray."""
+        decimate, scale = self.choose()
+        self.last_settings = (decimate, scale)
+
+        if scale != 1.0:
+            gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+            if camera_params is not None:
+                camera_params = tuple(p * scale for p in camera_params)
+
+        detections = self.pool.get(decimate).detect(
+            gray,
+            estimate_tag_pose=estimate_tag_pose,
+            camera_params=camera_params,
+            tag_size=tag_size
+        )
+
+        if scale != 1.0:
+            for det in detections:
+                det.corners = det.corners / scale
+                det.center = det.center / scale
+        return detections
+
+
+# -----------------------------
+# BENCHMARK
+# -----------------------------
+def _scene(image, truth, tag_id, width_px, size=(1280, 720)):
+    """Scale the image so tag_id is width_px wide and centre a frame on it."""
+    ref = truth[tag_id]
+    scale = width_px / np.linalg.norm(ref[0] - ref[1])
+    scaled = cv2.resize(image, None, fx=scale, fy=scale,
+                        interpolation=cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR)
+    offset = np.array(size) / 2.0 - ref.mean(axis=0) * scale
+
+    M = np.float32([[1, 0, offset[0]], [0, 1, offset[1]]])
+    frame = cv2.warpAffine(scaled, M, size, borderValue=128)
+    visible = {
+        i for i, c in truth.items()
+        if np.all((c * scale + offset >= 0) & (c * scale + offset < np.array(size)))
+    }
+    return frame, visible
+
+
+def benchmark(widths=(24, 40, 80, 160, 320, 480), repeats=5):
+    import os
+    BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+    path = os.path.join(BASE_DIR, "..", "..", "TopoTag", "test-images", "IMG_6397.png")
+    image = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+
+    pool = DetectorPool(nthreads=2, refine_edges=1)
+    # the full-size photo is too soft for decimate 1.0, take the reference at half size
+    half = cv2.resize(image, None, fx=0.5, fy=0.5, interpolation=cv2.INTER_AREA)
+    truth = {d.tag_id: d.corners / 0.5 for d in pool.get(1.0).detect(half)}
+    tag_id = min(truth)
+    adaptive = AdaptiveDetector(pool)
+
+    def run(fn):
+        t0 = time.perf_counter()
+        for _ in range(repeats):
+            dets = fn()
+        return (time.perf_counter() - t0) * 1000.0 / repeats, {d.tag_id for d in dets}
+
+    # recall is over every fully visible tag, "target" is whether the tracked tag was found
+    print(f"{'tag px':>7} {'state':<16} {'fixed 1.0 ms':>12} {'recall':>6} {'target':>6} "
+          f"{'adaptive':>12} {'ms':>7} {'recall':>6} {'target':>6}")
+    for width in widths:
+        frame, visible = _scene(image, truth, tag_id, width)
+        for state in ("S1_ROTATE_LEFT", "S3_MOVE_FORWARD"):
+            adaptive.set_state(state)
+            adaptive.observe(truth[tag_id] * (width / np.linalg.norm(truth[tag_id][0] - truth[tag_id][1])))
+
+            ms_fixed, found_fixed = run(lambda: pool.get(1.0).detect(frame))
+            ms_adapt, found_adapt = run(lambda: adaptive.detect(frame))
+            decimate, scale = adaptive.last_settings
+            recall_fixed = len(found_fixed & visible) / len(visible)
+            recall_adapt = len(found_adapt & visible) / len(visible)
+            print(f"{width:>7} {state:<16} {ms_fixed:>12.2f} {recall_fixed:>6.2f} {str(tag_id in found_fixed):>6} "
+                  f"{f'd={decimate} s={scale}':>12} {ms_adapt:>7.2f} {recall_adapt:>6.2f} {str(tag_id in found_adapt):>6}")
+
+
+if __name__ == "__main__":
+    benchmark()
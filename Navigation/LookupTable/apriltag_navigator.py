@@ -1,6 +1,16 @@
+import os
+import time
 import cv2
 import numpy as np
-from pupil_apriltags import Detector
+from types import SimpleNamespace
+from undistorter import Undistorter, DEFAULT_CALIBRATION
+from frame_grabber import FrameGrabber
+from roi_tracker import RoiTracker, offset_detections
+from adaptive_detector import AdaptiveDetector, DetectorPool
+from pose_ekf import PoseEKF
+from flow_tracker import CornerFlowTracker, quad_center
+from frame_gate import FrameGate
+from multi_camera import Camera, DetectorWorkers, MultiCameraRig, merge_detections, tag_in_camera
 
 
 class AprilTagNavigator:
@@ -10,12 +20,54 @@ class AprilTagNavigator:
         camera_index=0,
         image_width=1280,
         image_height=720,
-        center_tol=30
+        center_tol=30,
+        calibration_path=DEFAULT_CALIBRATION,
+        undistort_mode="frame",
+        track_roi=True,
+        coast_s=0.3,
+        detect_interval=3,
+        gate_frames=True,
+        camera_pose=None,
+        extra_cameras=()
     ):
+        """
+        undistort_mode:
+            "frame"   - undistort the whole image, then detect
+            "corners" - detect on the raw image and undistort only the tag
+                        corners / centre (cv2.undistortPoints)
+        track_roi:
+            once the target tag is found, detect only in a crop around its
+            predicted position (see RoiTracker), with full-frame fallback
+        coast_s:
+            the target's position is filtered (PoseEKF, camera frame); for
+            this long after it was last seen, step() steers on the
+            prediction instead of falling back to searching
+        detect_interval:
+            run the detector every this many frames; in between, the target's
+            corners are carried by optical flow (CornerFlowTracker). A failed
+            flow check re-detects on the same frame. 1 = detect every frame
+        gate_frames:
+            skip detection on frames that are motion-blurred or unchanged for
+            the current nav state (FrameGate); step() then steers on the
+            target prediction as if the frame had not arrived. Once the
+            target has not been measured for half of coast_s, the next frame
+            is detected regardless, so gating alone never loses the target
+        camera_pose:
+            (R, t) of this camera in the robot frame (camera_extrinsics),
+            default straight ahead at the robot origin
+        extra_cameras:
+            more multi_camera.Camera objects (e.g. a side camera). While the
+            target is lost, their frames are detected alongside this one's
+            on a shared DetectorWorkers pool sized to the cores, and a target
+            they see is steered to directly instead of searching by rotation
+        """
         self.camera_index = camera_index
         self.image_width = image_width
         self.image_height = image_height
         self.center_tol = center_tol
+        self.undistort_mode = undistort_mode
+        self.track_roi = track_roi
+        self.coast_s = coast_s
 
         self.target_tags = set(range((target_table - 1) * 4, target_table * 4))
         self.img_cx = image_width // 2
@@ -35,27 +87,162 @@ class AprilTagNavigator:
         self.dist = np.array([0.06860953, 0.01557485, 0.00265338, -0.00024421, 0.22515038])
         self.TAG_SIZE = 0.09
 
-        self.cap = cv2.VideoCapture(self.camera_index)
-        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, self.image_width)
-        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.image_height)
+        # Undistortion maps are built once per frame size (and cached on disk)
+        if os.path.exists(calibration_path):
+            self.undistorter = Undistorter.from_file(calibration_path)
+            self.K = self.undistorter.camera_matrix
+            self.dist = self.undistorter.dist_coeffs
+            self.FX, self.FY = self.K[0, 0], self.K[1, 1]
+            self.CX, self.CY = self.K[0, 2], self.K[1, 2]
+        else:
+            self.undistorter = Undistorter(self.K, self.dist)
+
+        # Camera runs on its own thread; step() only picks up the newest frame
+        self.grabber = FrameGrabber(self.camera_index, self.image_width, self.image_height)
+        self.grabber.start()
+        self.frame_age = None  # seconds between capture and the last step()
+        self.frame_id = 0
+        self.processed_frame_id = 0  # last frame_id the detector / flow ran on
+        self.last_step_repeat = False  # True if the last step() got a frame it had already processed
+
+        self.roi_tracker = RoiTracker(self.image_width, self.image_height)
+        self.last_region = None  # crop used by the last step(), None = full frame
+
+        # Every camera shares one pool of detector threads; a single camera
+        # keeps its own multi-threaded detectors
+        self.camera = Camera("main", camera_index, camera_pose, self.undistorter, image_width, image_height)
+        self.rig = None
+        self.workers = None
+        if extra_cameras:
+            self.workers = DetectorWorkers(refine_edges=1)
+            for cam in extra_cameras:
+                if cam.undistorter is None:
+                    cam.undistorter = self.undistorter
+            self.rig = MultiCameraRig(extra_cameras, self.workers)
+            self.rig.start()
+        self.last_detections = None  # merged robot-frame detection set of the last search step
+
+        # quad_decimate / processing scale follow the target's size and nav state
+        pool = self.workers if self.workers is not None else DetectorPool(nthreads=2, refine_edges=1)
+        self.detector = AdaptiveDetector(pool)
+        self.frame_detections = None  # all detections of the last detector run, undistorted pixels
+
+        # Between detections the target's corners follow optical flow
+        self.flow_tracker = CornerFlowTracker(detect_interval) if detect_interval > 1 else None
+        self.flow_tag_id = None
+        self.last_step_flow = False  # True if the last step() used flow instead of the detector
+        self.last_flow_corners = None  # raw corners flow gave in the last step()
+
+        # Blurred / unchanged frames never reach the detector
+        self.gate = FrameGate() if gate_frames else None
+        self.force_detect_s = 0.5 * coast_s
+        self.last_step_skipped = False
+
+        # Target tag centre in the camera frame, smoothed and predicted between detections
+        self.target_filter = PoseEKF(accel_noise=1.0)
+        self.target_source = None  # "main" / "rig": which camera(s) gave the filter's last update
+
+    def _target_in_camera(self, det):
+        """Target centre (m, camera frame) from its pixel centre and size, with covariance."""
+        return tag_in_camera(det, self.undistorter.camera_params(), self.TAG_SIZE)
 
-        self.detector = Detector(
-            families="tag36h11",
-            nthreads=2,
-            quad_decimate=1.0,
-            refine_edges=1
+    def _search_other_cameras(self, pending, stamp):
+        """
+        Merge the other cameras' detections (and this camera's, if the
+        detector ran) into one robot-frame set; the target in this camera's
+        frame as (stamp, position, covariance), or None.
+        """
+        observations = self.rig.collect(pending)
+        if self.frame_detections is not None:
+            observations.append((self.camera, self.frame_detections, stamp))
+        self.last_detections = merge_detections(observations, self.TAG_SIZE)
+
+        seen = [self.last_detections.tags[i] for i in sorted(self.target_tags & self.last_detections.tags.keys())]
+        if not seen:
+            return None
+        best = min(seen, key=lambda tag: np.trace(tag.position_cov))
+        return (best.stamp,) + self.camera.from_robot(best.position, best.position_cov)
+
+    def predict_target(self, t=None):
+        """
+        Filtered target centre in the camera frame at time t (time.monotonic(),
+        default now), or None if it was never seen or not for coast_s.
+        """
+        t = time.monotonic() if t is None else t
+        if not self.target_filter.initialized or t - self.target_filter.last_update_t > self.coast_s:
+            return None
+        return self.target_filter.predict(t)[0]
+
+    def _target_going_stale(self, t):
+        """True if the target is being coasted and is getting close to coast_s without a measurement."""
+        f = self.target_filter
+        return f.initialized and self.force_detect_s <= t - f.last_update_t <= self.coast_s
+
+    def _detect_target(self, frame):
+        """Run the detector (ROI / full frame); the target in undistorted pixels, or None."""
+        region = self.roi_tracker.region() if self.track_roi else None
+        self.last_region = region
+        # Gray first: remapping one channel costs half of remapping BGR
+        if region is None:
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            if self.undistort_mode == "frame":
+                gray = self.undistorter.undistort(gray)
+        else:
+            x0, y0, x1, y1 = region
+            if self.undistort_mode == "frame":
+                # The window samples the maps anywhere in the frame, so it needs the whole image
+                gray = self.undistorter.undistort_region(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), x0, y0, x1, y1)
+            else:
+                gray = cv2.cvtColor(frame[y0:y1, x0:x1], cv2.COLOR_BGR2GRAY)
+
+        detections = self.detector.detect(
+            gray,
+            estimate_tag_pose=False,
+            camera_params=(self.FX, self.FY, self.CX, self.CY),
+            tag_size=self.TAG_SIZE
         )
+        if region is not None:
+            detections = offset_detections(detections, region[0], region[1])
+        self.frame_detections = detections
 
-    def _estimate_distance_camera_to_tag(self, det):
-        corners = det.corners
-        pixel_width = np.linalg.norm(corners[0] - corners[1])
+        target = self._find_target_tag(detections)
+        # Tracked in the coordinates the detector sees (raw in "corners" mode)
+        self.roi_tracker.update(None if target is None else target.corners, full_frame=region is None)
+        self.detector.observe(None if target is None else target.corners)
+        raw_corners = None if target is None else target.corners.copy()
+
+        if self.undistort_mode == "corners":
+            # Only the points we use are corrected; centring and distance
+            # then work in the same undistorted pixel frame as "frame" mode
+            detections = self.undistorter.undistort_detections(detections)
+        elif target is not None:
+            raw_corners = self.undistorter.distort_points(target.corners)
+
+        # Flow runs on the raw frame, so it is seeded with raw corners
+        if self.flow_tracker is not None:
+            if target is None:
+                self.flow_tracker.reset()
+            else:
+                self.flow_tracker.start(frame, raw_corners)
+                self.flow_tag_id = target.tag_id
+        return target
 
-        if pixel_width <= 0:
+    def _flow_target(self, frame):
+        """The target carried over from the last frame by optical flow, or None if the check failed."""
+        self.last_region = None
+        self.last_flow_corners = None
+        raw_corners = self.flow_tracker.propagate(frame)
+        if raw_corners is None:
             return None
+        corners = self.undistorter.undistort_points(raw_corners)
 
-        distance = (self.FX * self.TAG_SIZE) / pixel_width
-        return distance
+        # Keep the ROI tracker and the detector settings following the tag
+        seen = raw_corners if self.undistort_mode == "corners" else corners
+        self.roi_tracker.update(seen, full_frame=False)
+        self.detector.observe(seen)
 
+        self.last_flow_corners = raw_corners
+        return SimpleNamespace(tag_id=self.flow_tag_id, corners=corners, center=quad_center(corners))
 
     def _find_target_tag(self, detections):
         for det in detections:
@@ -70,34 +257,79 @@ class AprilTagNavigator:
             aligned (bool): True when camera is facing table
             distance (float | None): meters from camera to tag
             frame (np.array): Debug frame
+
+        Never waits for the camera. The age of the frame used is stored in
+        self.frame_age (None until the first frame arrives). When the loop
+        runs faster than the camera, a frame already processed is not
+        detected or measured again; step() steers on the prediction.
         """
-        ret, frame = self.cap.read()
-        if not ret:
+        frame, self.frame_id, self.frame_age = self.grabber.read()
+        if frame is None:
             return "LEFT", False, None, None
+        frame = frame.copy()
+        stamp = time.monotonic() - self.frame_age
+        self.last_step_repeat = self.frame_id == self.processed_frame_id
+        self.processed_frame_id = self.frame_id
 
+        # Target lost, or only seen by the other cameras: they keep looking
+        # for it while this one detects, until this camera measures it itself
+        pending = None
+        if self.rig is not None and (self.predict_target(stamp) is None or self.target_source != "main"):
+            pending = self.rig.submit()
 
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        gray = cv2.undistort(gray, self.K, self.dist)
+        target = None
+        self.frame_detections = None
+        self.last_region = None
+        self.last_flow_corners = None
+        self.last_step_flow = (self.flow_tracker is not None and not self.last_step_repeat
+                               and not self.flow_tracker.needs_detection())
+        if self.last_step_flow:
+            target = self._flow_target(frame)
+            # A failed forward-backward check re-detects right away
+            self.last_step_flow = target is not None
+        self.last_step_skipped = False
+        if not self.last_step_flow and not self.last_step_repeat:
+            if self.gate is None or self.gate.check(frame, force=self._target_going_stale(stamp)):
+                target = self._detect_target(frame)
+            else:
+                # Not a miss: ROI / flow / detector state is left as it was
+                self.last_step_skipped = True
 
-        detections = self.detector.detect(
-            gray,
-            estimate_tag_pose=False,
-            camera_params=(self.FX, self.FY, self.CX, self.CY),
-            tag_size=self.TAG_SIZE
-        )
+        if target is not None:
+            measured = self._target_in_camera(target)
+            if measured is not None:
+                self.target_filter.update(stamp, *measured)
+                self.target_source = "main"
+        if pending is not None:
+            found = self._search_other_cameras(pending, stamp)
+            if target is None and found is not None:
+                self.target_filter.update(*found)
+                self.target_source = "rig"
 
-        target = self._find_target_tag(detections)
+        # Overlays only now: flow and the gate have taken what they need from the frame
+        if self.last_region is not None:
+            cv2.rectangle(frame, self.last_region[:2], self.last_region[2:], (255, 0, 0), 2)
+        if self.last_flow_corners is not None:
+            cv2.polylines(frame, [self.last_flow_corners.reshape(-1, 1, 2).astype(int)], True, (255, 0, 255), 1)
 
-        if target is None:
+        # A repeated frame's stamp is old: predict to now instead
+        position = self.predict_target(None if self.last_step_repeat else stamp)
+        if position is None:
             return "LEFT", False, None, frame
 
-        
-        distance = self._estimate_distance_camera_to_tag(target) * 0.7
+        distance = np.linalg.norm(position) * 0.7
 
-        tag_x, tag_y = map(int, target.center)
-        error = tag_x - self.img_cx
+        fx, fy, cx, cy = self.undistorter.camera_params()
+        if position[2] > 0:
+            tag_x = int(fx * position[0] / position[2] + cx)
+            tag_y = int(fy * position[1] / position[2] + cy)
+            error = tag_x - self.img_cx
 
-        cv2.circle(frame, (tag_x, tag_y), 6, (0, 255, 0), -1)
+            # Filled when seen this frame, hollow while coasting on the prediction
+            cv2.circle(frame, (tag_x, tag_y), 6, (0, 255, 0), -1 if target is not None else 2)
+        else:
+            # Beside or behind this camera (seen by another one): turn towards it
+            error = self.image_width if position[0] > 0 else -self.image_width
 
         if abs(error) < self.center_tol:
             if distance < 0.5: # TODO: Finalise this
@@ -108,5 +340,20 @@ class AprilTagNavigator:
         else:
             return "LEFT", False, distance, frame
 
+    def set_nav_state(self, state):
+        """Navigation state name (e.g. NavState.name), used to pick detector settings."""
+        self.detector.set_state(state)
+        if self.gate is not None:
+            self.gate.set_state(state)
+
+    def get_frame_age(self):
+        return self.frame_age
+
     def shutdown(self):
-        self.cap.release()
+        self.grabber.stop()
+        if self.rig is not None:
+            self.rig.stop()
+            self.workers.shutdown()
+        if self.gate is not None and self.gate.counts:
+            print("Frame gate:\n" + self.gate.summary())
+
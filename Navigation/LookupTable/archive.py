@@ -1,6 +1,7 @@
 import cv2
 import numpy as np
-from pupil_apriltags import Detector
+from adaptive_detector import AdaptiveDetector, DetectorPool
+from undistorter import Undistorter
 
 # -----------------------------
 # CONFIGURATION
@@ -30,6 +31,18 @@ dist = np.array([0.06860953, 0.01557485, 0.00265338, -0.00024421, 0.22515038])
 
 TAG_SIZE = 0.09  # meters
 
+# Detect on the raw frame and undistort only the tag corners instead of
+# remapping the whole image; pose then comes from solvePnP on those corners
+UNDISTORT_CORNERS_ONLY = False
+
+# Tag corners in the tag frame, in pupil_apriltags corner order
+TAG_OBJECT_POINTS = np.array([
+    [-TAG_SIZE / 2,  TAG_SIZE / 2, 0],
+    [ TAG_SIZE / 2,  TAG_SIZE / 2, 0],
+    [ TAG_SIZE / 2, -TAG_SIZE / 2, 0],
+    [-TAG_SIZE / 2, -TAG_SIZE / 2, 0],
+], dtype=np.float64)
+
 # -----------------------------
 # TABLE LAYOUT
 # -----------------------------
@@ -124,6 +137,18 @@ def tag_id_to_cube_id(tag_id: int) -> int:
     return (tag_id // 4) + 1
 
 
+def estimate_tag_translation(corners_undistorted):
+    """Tag translation (3x1, camera frame) from undistorted corners via IPPE."""
+    ok, _, tvec = cv2.solvePnP(
+        TAG_OBJECT_POINTS,
+        np.asarray(corners_undistorted, dtype=np.float64),
+        K,
+        None,
+        flags=cv2.SOLVEPNP_IPPE_SQUARE
+    )
+    return tvec if ok else None
+
+
 
 # -----------------------------
 # CAMERA + APRILTAG PIPELINE
@@ -137,16 +162,17 @@ def main():
         print("ERROR: Could not open camera")
         return
 
-    # Pupil-apriltags detector
-    detector = Detector(
-        families="tag36h11",
+    # Remap tables for K / dist, built on the first frame
+    undistorter = Undistorter(K, dist)
+
+    # Pupil-apriltags detectors, quad_decimate picked per frame from the tag size
+    detector = AdaptiveDetector(DetectorPool(
         nthreads=2,
-        quad_decimate=1.0,
         quad_sigma=0.0,
         refine_edges=1,
         decode_sharpening=0.25,
         debug=0
-    )
+    ))
 
     while True:
         ret, frame = cap.read()
@@ -154,14 +180,21 @@ def main():
             break
 
         gray_raw = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        gray = cv2.undistort(gray_raw, K, dist)
 
-        detections = detector.detect(
-            gray,
-            estimate_tag_pose=True,
-            camera_params=(FX, FY, CX, CY),
-            tag_size=TAG_SIZE
-        )
+        if UNDISTORT_CORNERS_ONLY:
+            detections = detector.detect(gray_raw, estimate_tag_pose=False)
+            detections = undistorter.undistort_detections(detections)
+            for det in detections:
+                det.pose_t = estimate_tag_translation(det.corners)
+            detections = [det for det in detections if det.pose_t is not None]
+        else:
+            gray = undistorter.undistort(gray_raw)
+            detections = detector.detect(
+                gray,
+                estimate_tag_pose=True,
+                camera_params=(FX, FY, CX, CY),
+                tag_size=TAG_SIZE
+            )
 
 
         command = None
@@ -172,6 +205,8 @@ def main():
             IMAGE_HEIGHT
         )
 
+        detector.observe(None if selected_det is None else selected_det.corners)
+
         if selected_det is not None:
             print("\n--- TAG DETECTED ---")
             print("Raw tag ID:", selected_det.tag_id)
@@ -0,0 +1,125 @@
+"""
+Compares full-frame undistortion against corner-only undistortion.
+
+Every image from TopoTag/test-images and TopoTag/calibration/calibration_images
+is letterboxed to 1280x720 and then distorted with the robot camera model
+(camera_calibration.npz), so it looks like a raw frame from our camera. Tags
+detected on the clean letterboxed image are the ground truth.
+
+For both modes it reports per-frame time, detections, mean corner error (px)
+against ground truth and the distance error of the navigator's pixel-width
+estimate.
+"""
+
+import os
+import glob
+import time
+import cv2
+import numpy as np
+from pupil_apriltags import Detector
+from undistorter import Undistorter
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+TOPOTAG_DIR = os.path.join(BASE_DIR, "..", "..", "TopoTag")
+IMAGE_GLOBS = [
+    os.path.join(TOPOTAG_DIR, "test-images", "*.png"),
+    os.path.join(TOPOTAG_DIR, "calibration", "calibration_images", "*.jpg"),
+]
+
+IMAGE_WIDTH = 1280
+IMAGE_HEIGHT = 720
+TAG_SIZE = 0.09
+REPEATS = 5
+
+
+def letterbox(gray, width=IMAGE_WIDTH, height=IMAGE_HEIGHT):
+    scale = min(width / gray.shape[1], height / gray.shape[0])
+    resized = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    canvas = np.full((height, width), 128, dtype=np.uint8)
+    y0 = (height - resized.shape[0]) // 2
+    x0 = (width - resized.shape[1]) // 2
+    canvas[y0:y0 + resized.shape[0], x0:x0 + resized.shape[1]] = resized
+    return canvas
+
+
+def distort(gray, undistorter):
+    """Apply the lens model, i.e. the inverse of undistort()."""
+    h, w = gray.shape
+    xs, ys = np.meshgrid(np.arange(w, dtype=np.float32), np.arange(h, dtype=np.float32))
+    # for every raw (distorted) pixel, where it lands in the undistorted image
+    src = undistorter.undistort_points(np.stack((xs, ys), axis=2)).astype(np.float32)
+    return cv2.remap(gray, src[..., 0], src[..., 1], cv2.INTER_LINEAR, borderValue=128)
+
+
+def pixel_width_distance(det, fx):
+    width = np.linalg.norm(det.corners[0] - det.corners[1])
+    return (fx * TAG_SIZE) / width if width > 0 else None
+
+
+def run_mode(mode, raw, detector, undistorter):
+    timings = []
+    for _ in range(REPEATS):
+        t0 = time.perf_counter()
+        if mode == "frame":
+            detections = detector.detect(undistorter.undistort(raw))
+        else:
+            detections = undistorter.undistort_detections(detector.detect(raw))
+        timings.append((time.perf_counter() - t0) * 1000.0)
+    return float(np.median(timings)), detections
+
+
+def compare(truth, detections, fx):
+    truth_by_id = {d.tag_id: d for d in truth}
+    corner_err, dist_err = [], []
+    for det in detections:
+        ref = truth_by_id.get(det.tag_id)
+        if ref is None:
+            continue
+        corner_err.append(np.mean(np.linalg.norm(det.corners - ref.corners, axis=1)))
+        d, d_ref = pixel_width_distance(det, fx), pixel_width_distance(ref, fx)
+        if d is not None and d_ref is not None:
+            dist_err.append(abs(d - d_ref))
+    return corner_err, dist_err
+
+
+def main():
+    undistorter = Undistorter.from_file()
+    undistorter.maps_for((IMAGE_WIDTH, IMAGE_HEIGHT))
+    fx = undistorter.camera_matrix[0, 0]
+    detector = Detector(families="tag36h11", nthreads=2, quad_decimate=1.0, refine_edges=1)
+
+    paths = sorted(p for pattern in IMAGE_GLOBS for p in glob.glob(pattern))
+    totals = {"frame": {"ms": [], "corner": [], "dist": [], "n": 0},
+              "corners": {"ms": [], "corner": [], "dist": [], "n": 0}}
+
+    print(f"{'image':<16} {'mode':<8} {'ms':>7} {'tags':>5} {'corner px':>10} {'dist mm':>8}")
+    for path in paths:
+        gray = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+        if gray is None:
+            continue
+        clean = letterbox(gray)
+        raw = distort(clean, undistorter)
+        truth = detector.detect(clean)
+
+        for mode in ("frame", "corners"):
+            ms, detections = run_mode(mode, raw, detector, undistorter)
+            corner_err, dist_err = compare(truth, detections, fx)
+            t = totals[mode]
+            t["ms"].append(ms)
+            t["corner"] += corner_err
+            t["dist"] += dist_err
+            t["n"] += len(detections)
+            corner_txt = f"{np.mean(corner_err):.3f}" if corner_err else "-"
+            dist_txt = f"{np.mean(dist_err) * 1000:.1f}" if dist_err else "-"
+            print(f"{os.path.basename(path):<16} {mode:<8} {ms:>7.2f} {len(detections):>5} {corner_txt:>10} {dist_txt:>8}")
+
+    print("\nSummary")
+    for mode, t in totals.items():
+        corner_txt = f"{np.mean(t['corner']):.3f}" if t["corner"] else "-"
+        dist_txt = f"{np.mean(t['dist']) * 1000:.1f}" if t["dist"] else "-"
+        print(f"  {mode:<8} median {np.median(t['ms']):.2f} ms/frame, {t['n']} detections, "
+              f"corner error {corner_txt} px, distance error {dist_txt} mm")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+import time
+import cv2
+import numpy as np
+
+
+def quad_center(corners):
+    """Intersection of the diagonals, the projected centre of a square tag."""
+    p0, p1, p2, p3 = np.asarray(corners, dtype=np.float64).reshape(4, 2)
+    d1, d2 = p2 - p0, p3 - p1
+    denom = d1[0] * d2[1] - d1[1] * d2[0]
+    if abs(denom) < 1e-9:
+        return (p0 + p1 + p2 + p3) / 4.0
+    s = ((p1[0] - p0[0]) * d2[1] - (p1[1] - p0[1]) * d2[0]) / denom
+    return p0 + s * d1
+
+
+class CornerFlowTracker:
+    """
+    Carries the target tag's four corners from frame to frame with pyramidal
+    Lucas-Kanade optical flow, so the detector only has to run every
+    detect_interval frames.
+
+    Flow runs on a small window around the tag, cut from the same place in
+    the previous and current frame. Every step is checked forward-backward:
+    flowing the new corners back must land within fb_max_px of where they
+    started, and the quad must keep a plausible shape. Any failure drops
+    the track and needs_detection() asks for the detector again.
+
+    Corners are in raw (distorted) pixels of whatever image start() and
+    propagate() are given.
+    """
+
+    def __init__(self, detect_interval=5, win_size=(15, 15), max_level=2, fb_max_px=1.0,
+                 max_area_change=0.3):
+        self.detect_interval = detect_interval
+        self.win_size = win_size
+        self.max_level = max_level
+        self.fb_max_px = fb_max_px
+        self.max_area_change = max_area_change
+        self.criteria = (cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 20, 0.03)
+        self.reset()
+
+    def reset(self):
+        self.corners = None
+        self.prev_patch = None
+        self.window = None
+        self.frames_since_detection = 0
+        self.last_fb_error = None
+
+    @property
+    def tracking(self):
+        return self.corners is not None
+
+    def needs_detection(self):
+        return not self.tracking or self.frames_since_detection + 1 >= self.detect_interval
+
+    def _window(self, image_shape, corners):
+        # Room for the tag, the LK window at the coarsest level, and some motion
+        size = float(np.max(np.ptp(corners, axis=0)))
+        pad = int(size * 0.5 + self.win_size[0] * (2 ** self.max_level) / 2)
+        x0, y0 = np.floor(corners.min(axis=0)).astype(int) - pad
+        x1, y1 = np.ceil(corners.max(axis=0)).astype(int) + pad
+        h, w = image_shape[:2]
+        return max(x0, 0), max(y0, 0), min(x1, w), min(y1, h)
+
+    @staticmethod
+    def _patch(image, window):
+        x0, y0, x1, y1 = window
+        patch = image[y0:y1, x0:x1]
+        # Only the window is converted, never the whole frame
+        return cv2.cvtColor(patch, cv2.COLOR_BGR2GRAY) if patch.ndim == 3 else patch
+
+    def start(self, image, corners):
+        """Begin tracking from detector corners (4, 2) found in image."""
+        self.corners = np.asarray(corners, dtype=np.float32).reshape(4, 2)
+        self.window = self._window(image.shape, self.corners)
+        self.prev_patch = self._patch(image, self.window)
+        self.frames_since_detection = 0
+
+    def propagate(self, image):
+        """Corners (4, 2) in the new image, or None if the track failed the checks."""
+        if not self.tracking:
+            return None
+        x0, y0, _, _ = self.window
+        patch = self._patch(image, self.window)
+        offset = np.array([x0, y0], dtype=np.float32)
+        p0 = (self.corners - offset).reshape(-1, 1, 2)
+
+        lk = dict(winSize=self.win_size, maxLevel=self.max_level, criteria=self.criteria)
+        p1, status, _ = cv2.calcOpticalFlowPyrLK(self.prev_patch, patch, p0, None, **lk)
+        if p1 is None or not status.all():
+            self.reset()
+            return None
+        back, status_back, _ = cv2.calcOpticalFlowPyrLK(patch, self.prev_patch, p1, None, **lk)
+        if back is None or not status_back.all():
+            self.reset()
+            return None
+
+        self.last_fb_error = float(np.linalg.norm((back - p0).reshape(-1, 2), axis=1).max())
+        corners = p1.reshape(4, 2) + offset
+        area_before = cv2.contourArea(self.corners)
+        area_after = cv2.contourArea(corners)
+        if (self.last_fb_error > self.fb_max_px
+                or not cv2.isContourConvex(corners.reshape(-1, 1, 2))
+                or abs(area_after - area_before) > self.max_area_change * area_before):
+            self.reset()
+            return None
+
+        self.corners = corners
+        self.window = self._window(image.shape, corners)
+        self.prev_patch = self._patch(image, self.window)
+        self.frames_since_detection += 1
+        return corners.astype(np.float64)
+
+
+# -----------------------------
+# BENCHMARK
+# -----------------------------
+if __name__ == "__main__":
+    import os
+    from pupil_apriltags import Detector
+
+    BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+    image = cv2.imread(os.path.join(BASE_DIR, "..", "..", "TopoTag", "test-images", "IMG_6397.png"),
+                       cv2.IMREAD_GRAYSCALE)
+    scale = 720 / image.shape[0]
+    image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+    # The scene panning 2 px/frame right and 1 px/frame down
+    frames = []
+    for i in range(60):
+        M = np.float32([[1, 0, 2.0 * i], [0, 1, 1.0 * i]])
+        frames.append(cv2.warpAffine(image, M, (1280, 720), borderValue=128))
+
+    detector = Detector(families="tag36h11", nthreads=2, quad_decimate=1.0, refine_edges=1)
+    truth = [{d.tag_id: d for d in detector.detect(f)} for f in frames]
+    target_id = sorted(truth[0])[0]
+
+    t0 = time.perf_counter()
+    for f in frames:
+        detector.detect(f)
+    t_detect = (time.perf_counter() - t0) * 1000.0 / len(frames)
+
+    for interval in (1, 3, 5, 10):
+        tracker = CornerFlowTracker(detect_interval=interval)
+        errors, detections = [], 0
+        t0 = time.perf_counter()
+        for i, f in enumerate(frames):
+            if tracker.needs_detection():
+                detections += 1
+                found = [d for d in detector.detect(f) if d.tag_id == target_id]
+                corners = found[0].corners if found else None
+                if corners is not None:
+                    tracker.start(f, corners)
+            else:
+                corners = tracker.propagate(f)
+            if corners is not None and target_id in truth[i]:
+                errors.append(np.abs(corners - truth[i][target_id].corners).max())
+        t_track = (time.perf_counter() - t0) * 1000.0 / len(frames)
+        print(f"detect every {interval:>2}: {t_track:6.2f} ms/frame ({detections} detections, "
+              f"full detector {t_detect:.2f} ms), max corner error {max(errors):.2f} px")
@@ -0,0 +1,157 @@
+import time
+import cv2
+import numpy as np
+
+
+class FrameGate:
+    """
+    Cheap check, before detection, of whether a frame is worth detecting on.
+
+    Both measures are taken on a small grayscale copy of the frame:
+    - sharpness: variance of the Laplacian, compared with the recent peak
+      (which decays a little every frame). Motion blur (rotating in S1)
+      drops it well below the sharp frames in between.
+    - change: mean absolute difference from the last frame that was let
+      through. Parked in S5, it stays at the sensor noise level.
+
+    Thresholds are per NavState. After max_skip frames skipped in a row the
+    next one is let through regardless, so the detector never goes blind
+    for long; a caller with a deadline of its own (e.g. a coasting target)
+    can also force a frame through. Skipped and processed frames are
+    counted per state.
+    """
+
+    # state -> (min sharpness as a fraction of the recent peak, min change in gray levels)
+    STATE_THRESHOLDS = {
+        "S1_ROTATE_LEFT": (0.35, 0.0),
+        "S2_CENTER_TAG": (0.3, 0.0),
+        "S3_MOVE_FORWARD": (0.3, 0.0),
+        "S5_STOP": (0.0, 1.5),
+    }
+    DEFAULT_THRESHOLDS = (0.0, 0.0)  # no gating (e.g. S4, or no state set)
+
+    def __init__(self, size=(320, 180), max_skip=10, sharpness_decay=0.97):
+        self.size = size
+        self.max_skip = max_skip
+        self.sharpness_decay = sharpness_decay
+        self.state = None
+        self.reference_sharpness = None
+        self.last_kept = None
+        self.skipped_in_row = 0
+        self.last_sharpness = None
+        self.last_change = None
+        self.last_reason = None
+        self.counts = {}  # state -> {"processed": n, "blurred": n, "unchanged": n}
+
+    def set_state(self, state):
+        self.state = state
+
+    def _small_gray(self, frame):
+        small = cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if small.ndim == 3 else small
+
+    def check(self, frame, force=False):
+        """
+        True if the frame should go to the detector. The reason for a skip is
+        in last_reason. force=True lets it through but still updates the
+        sharpness reference and the last kept frame.
+        """
+        small = self._small_gray(frame)
+        sharpness = float(cv2.Laplacian(small, cv2.CV_32F).var())
+        change = np.inf if self.last_kept is None else float(cv2.absdiff(small, self.last_kept).mean())
+        self.last_sharpness, self.last_change = sharpness, change
+
+        min_ratio, min_change = self.STATE_THRESHOLDS.get(self.state, self.DEFAULT_THRESHOLDS)
+        reason = None
+        if self.reference_sharpness is not None and sharpness < min_ratio * self.reference_sharpness:
+            reason = "blurred"
+        elif change < min_change:
+            reason = "unchanged"
+
+        # The peak decays, so a scene that is blurred or plain for a long
+        # time is eventually accepted as normal
+        if self.reference_sharpness is None:
+            self.reference_sharpness = sharpness
+        else:
+            self.reference_sharpness = max(sharpness, self.reference_sharpness * self.sharpness_decay)
+
+        if reason is not None and (force or self.skipped_in_row >= self.max_skip):
+            reason = None
+        self.last_reason = reason
+
+        counts = self.counts.setdefault(self.state, {"processed": 0, "blurred": 0, "unchanged": 0})
+        if reason is None:
+            counts["processed"] += 1
+            self.skipped_in_row = 0
+            self.last_kept = small
+            return True
+        counts[reason] += 1
+        self.skipped_in_row += 1
+        return False
+
+    def summary(self):
+        """One line per state: processed / blurred / unchanged counts."""
+        return "\n".join(
+            f"{state}: processed {c['processed']}, skipped blurred {c['blurred']}, unchanged {c['unchanged']}"
+            for state, c in self.counts.items()
+        )
+
+
+# -----------------------------
+# BENCHMARK
+# -----------------------------
+if __name__ == "__main__":
+    import os
+    from pupil_apriltags import Detector
+
+    BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+    image = cv2.imread(os.path.join(BASE_DIR, "..", "..", "TopoTag", "test-images", "IMG_6397.png"))
+    scale = 720 / image.shape[0]
+    image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    canvas = np.full((720, 1280, 3), 128, dtype=np.uint8)
+    canvas[:, :image.shape[1]] = image[:, :1280]
+    rng = np.random.default_rng(0)
+
+    def noisy(img):
+        return np.clip(img + rng.normal(0, 2, img.shape), 0, 255).astype(np.uint8)
+
+    def motion_blur(img, length):
+        kernel = np.zeros((1, length), dtype=np.float32)
+        kernel[:] = 1.0 / length
+        return cv2.filter2D(img, -1, kernel)
+
+    # Rotating: mostly blurred frames with a few sharp ones where the turn
+    # pauses. Parked: the same view with sensor noise, and one change.
+    def rotating(length):
+        return [noisy(canvas) if i % 5 == 0 else noisy(motion_blur(canvas, length)) for i in range(60)]
+
+    parked = [noisy(canvas) for _ in range(59)] + [noisy(np.roll(canvas, 40, axis=1))]
+    scenarios = (
+        ("S1_ROTATE_LEFT", "25 px blur", rotating(25)),
+        ("S1_ROTATE_LEFT", "40 px blur", rotating(40)),
+        ("S5_STOP", "parked", parked),
+    )
+
+    detector = Detector(families="tag36h11", nthreads=2, quad_decimate=1.0, refine_edges=1)
+
+    for state, label, frames in scenarios:
+        gate = FrameGate()
+        gate.set_state(state)
+        t_gate = t_detect = 0.0
+        found_in_skipped = 0
+        for f in frames:
+            gray = cv2.cvtColor(f, cv2.COLOR_BGR2GRAY)
+            t0 = time.perf_counter()
+            keep = gate.check(f)
+            t_gate += time.perf_counter() - t0
+            t0 = time.perf_counter()
+            dets = detector.detect(gray)
+            t_detect += time.perf_counter() - t0
+            if not keep and dets and gate.last_reason == "blurred":
+                found_in_skipped += 1
+        c = gate.counts[state]
+        skipped = c["blurred"] + c["unchanged"]
+        print(f"{state} ({label}): {c} | gate {t_gate * 1000 / len(frames):.2f} ms/frame, "
+              f"detector {t_detect * 1000 / len(frames):.1f} ms/frame -> "
+              f"{skipped / len(frames):.0%} of detector calls skipped, "
+              f"tags still detectable in {found_in_skipped} blurred-skipped frames")
@@ -0,0 +1,81 @@
+import threading
+import time
+import cv2
+
+
+class FrameGrabber:
+    """
+    Reads a cv2.VideoCapture on its own thread and keeps only the newest frame.
+
+    cap.read() blocks for a frame interval and, because of driver buffering,
+    can hand back frames that are several intervals old. Draining the camera
+    continuously into a single slot means read() never waits and always gets
+    the most recent frame, together with the time it was captured.
+    """
+
+    def __init__(self, camera_index=0, image_width=1280, image_height=720):
+        self.camera_index = camera_index
+        self.image_width = image_width
+        self.image_height = image_height
+
+        self.cap = None
+        self.lock = threading.Lock()
+        self.frame = None
+        self.frame_time = None
+        self.frame_id = 0
+
+        self.running = False
+        self.thread = None
+
+    def _open(self):
+        cap = cv2.VideoCapture(self.camera_index)
+        cap.set(cv2.CAP_PROP_FRAME_WIDTH, self.image_width)
+        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.image_height)
+        # Not every backend honours this, the thread drains the queue anyway
+        cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        return cap
+
+    def _capture_loop(self):
+        while self.running:
+            ret, frame = self.cap.read()
+            stamp = time.monotonic()
+            if not ret:
+                print("[WARN] Camera read failed")
+                time.sleep(0.05)
+                continue
+
+            with self.lock:
+                self.frame = frame
+                self.frame_time = stamp
+                self.frame_id += 1
+
+    def start(self):
+        if self.running:
+            return
+        self.cap = self._open()
+        if not self.cap.isOpened():
+            print(f"[FATAL] Could not open camera {self.camera_index}")
+        self.running = True
+        self.thread = threading.Thread(target=self._capture_loop, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread:
+            self.thread.join(timeout=1.0)
+        if self.cap is not None:
+            self.cap.release()
+
+    def read(self):
+        """
+        Newest frame without blocking.
+
+        Returns (frame, frame_id, age_s); frame is None until the first
+        capture arrives. frame_id increases by one per captured frame, so a
+        caller can tell whether it has already processed this one.
+        """
+        with self.lock:
+            frame, frame_id, stamp = self.frame, self.frame_id, self.frame_time
+        if frame is None:
+            return None, frame_id, None
+        return frame, frame_id, time.monotonic() - stamp
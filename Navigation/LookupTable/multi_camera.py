@@ -0,0 +1,268 @@
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+import cv2
+import numpy as np
+from pupil_apriltags import Detector
+from frame_grabber import FrameGrabber
+from adaptive_detector import DetectorPool
+from pose_ekf import tag_measurement_covariance
+
+NUM_WORKERS = os.cpu_count() or 1
+
+# Camera optical axes (x right, y down, z out of the lens) in the robot frame
+# (x forward, y left, z up, as in scan_matcher) for a level, forward camera
+ROBOT_FROM_OPTICAL = np.array([
+    [0.0, 0.0, 1.0],
+    [-1.0, 0.0, 0.0],
+    [0.0, -1.0, 0.0],
+])
+
+
+def camera_extrinsics(yaw_deg=0.0, position=(0.0, 0.0, 0.0)):
+    """
+    (R_robot_cam, t_robot_cam) of a level camera at position (m, robot
+    frame), turned yaw_deg to the left of straight ahead (90 = left side).
+    """
+    a = np.radians(yaw_deg)
+    yaw = np.array([
+        [np.cos(a), -np.sin(a), 0.0],
+        [np.sin(a), np.cos(a), 0.0],
+        [0.0, 0.0, 1.0],
+    ])
+    return yaw @ ROBOT_FROM_OPTICAL, np.asarray(position, dtype=float).reshape(3)
+
+
+def tag_in_camera(det, camera_params, tag_size):
+    """Tag centre (m, camera frame) from its pixel centre and size, with covariance; None if degenerate."""
+    fx, fy, cx, cy = camera_params
+    pixel_width = np.linalg.norm(det.corners[0] - det.corners[1])
+    pixel_height = np.linalg.norm(det.corners[1] - det.corners[2])
+    if pixel_width <= 0 or pixel_height <= 0:
+        return None
+
+    u, v = det.center
+    ray = np.array([(u - cx) / fx, (v - cy) / fy, 1.0])
+    position = ray / np.linalg.norm(ray) * (fx * tag_size / pixel_width)
+    # A tag seen at an angle is narrower than it is tall
+    cos_view = min(pixel_width / pixel_height, 1.0)
+    position_cov, _ = tag_measurement_covariance(position, fx, tag_size, cos_view)
+    return position, position_cov
+
+
+class Camera:
+    """
+    One camera on the robot: capture index, intrinsics (an Undistorter) and
+    extrinsics (R, t of the camera in the robot frame, see camera_extrinsics).
+    """
+
+    def __init__(self, name, camera_index, extrinsics=None, undistorter=None,
+                 image_width=1280, image_height=720, decimate=1.0):
+        """
+        undistorter: None = filled in by the owner (e.g. the navigator's own)
+        decimate:    quad_decimate used on this camera's frames
+        """
+        self.name = name
+        self.camera_index = camera_index
+        self.R, self.t = extrinsics if extrinsics is not None else camera_extrinsics()
+        self.undistorter = undistorter
+        self.image_width = image_width
+        self.image_height = image_height
+        self.decimate = decimate
+
+    def to_robot(self, position, position_cov):
+        """Camera-frame position / covariance into the robot frame."""
+        return self.R @ position + self.t, self.R @ position_cov @ self.R.T
+
+    def from_robot(self, position, position_cov):
+        """Robot-frame position / covariance into this camera's frame."""
+        return self.R.T @ (position - self.t), self.R.T @ position_cov @ self.R
+
+
+class _PooledDetector:
+    """Detector-like handle that runs detect() on a DetectorWorkers thread and waits for it."""
+
+    def __init__(self, workers, decimate):
+        self.workers = workers
+        self.decimate = decimate
+
+    def detect(self, gray, **detect_kwargs):
+        return self.workers.submit(gray, self.decimate, **detect_kwargs).result()
+
+
+class DetectorWorkers:
+    """
+    A pool of detector threads shared by every camera.
+
+    pupil_apriltags calls the C library through ctypes, which releases the
+    GIL, so frames from different cameras are detected in parallel on
+    threads without copying images between processes. A Detector must not
+    be used by two threads at once, so each thread builds its own
+    DetectorPool (nthreads=1: the pool is the parallelism, and detectors
+    with different nthreads in one process corrupt the heap, see
+    vision_benchmark.py).
+
+    get(decimate) returns a blocking detector handle, so an AdaptiveDetector
+    can run on the pool in place of a DetectorPool.
+    """
+
+    def __init__(self, num_workers=NUM_WORKERS, decimations=(1.0, 1.5, 2.0, 3.0, 4.0),
+                 families="tag36h11", **detector_kwargs):
+        self.num_workers = max(1, int(num_workers))
+        self.decimations = tuple(sorted(decimations))
+        self.families = families
+        self.detector_kwargs = detector_kwargs
+        self._local = threading.local()
+        self.executor = ThreadPoolExecutor(
+            max_workers=self.num_workers, thread_name_prefix="detector", initializer=self._init_thread
+        )
+
+    def _init_thread(self):
+        self._local.pool = DetectorPool(self.decimations, self.families, nthreads=1, **self.detector_kwargs)
+
+    def _detect(self, gray, decimate, detect_kwargs):
+        return self._local.pool.get(decimate).detect(gray, **detect_kwargs)
+
+    def submit(self, gray, decimate=1.0, **detect_kwargs):
+        """Future of Detector.detect(gray, **detect_kwargs) at this quad_decimate."""
+        return self.executor.submit(self._detect, gray, decimate, detect_kwargs)
+
+    def get(self, decimate):
+        return _PooledDetector(self, decimate)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+
+
+class MultiCameraRig:
+    """
+    Captures several cameras concurrently (one FrameGrabber thread each) and
+    detects their newest frames on a shared DetectorWorkers pool.
+
+    Frames are detected raw and only the tag corners are undistorted, so a
+    camera costs one detect() per new frame and nothing else. submit()
+    hands the frames to the pool and returns at once; collect() waits for
+    the results. In between, the caller can do its own work (e.g. detect
+    the main camera on the same pool).
+    """
+
+    def __init__(self, cameras, workers):
+        self.cameras = list(cameras)
+        self.workers = workers
+        self.grabbers = {
+            cam.name: FrameGrabber(cam.camera_index, cam.image_width, cam.image_height) for cam in self.cameras
+        }
+        self.last_frame_id = {cam.name: 0 for cam in self.cameras}
+
+    def start(self):
+        for grabber in self.grabbers.values():
+            grabber.start()
+
+    def stop(self):
+        for grabber in self.grabbers.values():
+            grabber.stop()
+
+    def submit(self):
+        """Start detection on every camera with a frame not seen yet; the pending jobs."""
+        now = time.monotonic()
+        pending = []
+        for cam in self.cameras:
+            frame, frame_id, age = self.grabbers[cam.name].read()
+            if frame is None or frame_id == self.last_frame_id[cam.name]:
+                continue
+            self.last_frame_id[cam.name] = frame_id
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            pending.append((cam, now - age, self.workers.submit(gray, cam.decimate)))
+        return pending
+
+    def collect(self, pending):
+        """[(camera, detections with undistorted corners / centre, capture time)] for the pending jobs."""
+        results = []
+        for cam, stamp, future in pending:
+            detections = cam.undistorter.undistort_detections(future.result())
+            results.append((cam, detections, stamp))
+        return results
+
+
+def merge_detections(observations, tag_size):
+    """
+    One detection set in the robot frame from [(camera, detections, stamp)].
+
+    Each tag is ranged in its camera's frame (tag_in_camera) and moved into
+    the robot frame with the camera's extrinsics. A tag seen by more than
+    one camera is fused by inverse-covariance weighting.
+
+    Returns SimpleNamespace(stamp, tags) where stamp is the newest capture
+    time and tags maps tag_id -> SimpleNamespace(position, position_cov,
+    stamp, cameras).
+    """
+    seen = {}
+    stamp = None
+    for cam, detections, cam_stamp in observations:
+        stamp = cam_stamp if stamp is None else max(stamp, cam_stamp)
+        for det in detections:
+            measured = tag_in_camera(det, cam.undistorter.camera_params(), tag_size)
+            if measured is None:
+                continue
+            seen.setdefault(det.tag_id, []).append((cam, cam_stamp) + cam.to_robot(*measured))
+
+    tags = {}
+    for tag_id, views in seen.items():
+        info = sum(np.linalg.inv(cov) for _, _, _, cov in views)
+        position_cov = np.linalg.inv(info)
+        position = position_cov @ sum(np.linalg.solve(cov, p) for _, _, p, cov in views)
+        tags[tag_id] = SimpleNamespace(
+            position=position,
+            position_cov=position_cov,
+            stamp=max(s for _, s, _, _ in views),
+            cameras=[cam.name for cam, _, _, _ in views],
+        )
+    return SimpleNamespace(stamp=stamp, tags=tags)
+
+
+# -----------------------------
+# BENCHMARK
+# -----------------------------
+def benchmark(num_cameras=3, width=1280, repeats=5):
+    """Detection time for one frame per camera: one detector in turn vs the shared pool."""
+    BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+    path = os.path.join(BASE_DIR, "..", "..", "TopoTag", "test-images", "IMG_6397.png")
+    image = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+    image = cv2.resize(image, (width, image.shape[0] * width // image.shape[1]), interpolation=cv2.INTER_AREA)
+    # Stand-ins for different views: the photo turned by 0 / 90 / 180 / 270 degrees
+    frames = [np.ascontiguousarray(np.rot90(image, k % 4)) for k in range(num_cameras)]
+
+    def timed(fn):
+        best = float("inf")
+        for _ in range(repeats):
+            t0 = time.perf_counter()
+            found = fn()
+            best = min(best, time.perf_counter() - t0)
+        return best * 1000.0, found
+
+    detector = Detector(families="tag36h11", nthreads=1, quad_decimate=1.0, refine_edges=1)
+    ms_serial, serial = timed(lambda: [{d.tag_id for d in detector.detect(f)} for f in frames])
+
+    workers = DetectorWorkers(refine_edges=1)
+    timed(lambda: [f.result() for f in [workers.submit(g) for g in frames]])  # warm up every thread
+    ms_pool, pooled = timed(lambda: [{d.tag_id for d in f.result()} for f in [workers.submit(g) for g in frames]])
+    workers.shutdown()
+
+    print(f"{num_cameras} cameras at {width} px, {workers.num_workers} detector workers ({NUM_WORKERS} cores)")
+    print(f"{'':<22} {'ms / round':>10}  ids per camera")
+    print(f"{'one detector in turn':<22} {ms_serial:>10.1f}  {[sorted(s) for s in serial]}")
+    print(f"{'shared worker pool':<22} {ms_pool:>10.1f}  {[sorted(s) for s in pooled]}")
+
+    # A tag straight ahead of the front camera and one beside the left camera,
+    # both 1 m from the robot, come out in the robot frame (x forward, y left)
+    front = Camera("front", 0, camera_extrinsics(0.0, (0.10, 0.0, 0.20)))
+    left = Camera("left", 1, camera_extrinsics(90.0, (0.0, 0.08, 0.20)))
+    for cam, expected in ((front, (1.10, 0.0, 0.20)), (left, (0.0, 1.08, 0.20))):
+        p, _ = cam.to_robot(np.array([0.0, 0.0, 1.0]), np.eye(3))
+        print(f"{cam.name:<6} camera, tag 1 m ahead -> robot {np.round(p, 3)} (expected {expected})")
+
+
+if __name__ == "__main__":
+    benchmark()
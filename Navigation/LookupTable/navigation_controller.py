@@ -94,13 +94,16 @@ class NavigationController:
                 aligned = False
                 distance = None
 
+                self.nav.set_nav_state(self.state.name)
+
                 # 2) state machine
                 if self.state == NavState.S1_ROTATE_LEFT:
                     # Search: rotate left until tag is detected
                     at_cmd, aligned, distance, frame = self.nav.step()
 
-                    # We force LEFT here to satisfy “rotate to search”
-                    cmd = "LEFT"
+                    # We force LEFT here to satisfy “rotate to search”, unless
+                    # another camera already has the tag: then turn towards it
+                    cmd = "LEFT" if distance is None else at_cmd
                     self.motor.apply(cmd)
 
                     # transition: S1->S2 when tag identified (distance not None)
@@ -157,6 +160,10 @@ class NavigationController:
                     if distance is not None:
                         cv2.putText(frame, f"DIST: {distance:.2f}m", (20, 130),
                                     cv2.FONT_HERSHEY_SIMPLEX, 0.9, (255, 255, 255), 2)
+                    frame_age = self.nav.get_frame_age()
+                    if frame_age is not None:
+                        cv2.putText(frame, f"AGE: {frame_age * 1000:.0f}ms", (20, 170),
+                                    cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
                     cv2.imshow("Navigation", frame)
 
                 if cv2.waitKey(1) & 0xFF == ord("q"):
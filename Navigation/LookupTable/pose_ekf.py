@@ -0,0 +1,280 @@
+import cv2
+import numpy as np
+
+# 99% chi-square quantiles for the Mahalanobis gate, by measurement dimension
+CHI2_99 = {3: 11.345, 6: 16.812}
+
+
+def _exp(w):
+    R, _ = cv2.Rodrigues(np.asarray(w, dtype=float).reshape(3, 1))
+    return R
+
+
+def _log(R):
+    w, _ = cv2.Rodrigues(np.asarray(R, dtype=float))
+    return w.ravel()
+
+
+def viewing_cosine(R_cam_tag, t_cam_tag):
+    """|cos| of the angle between the line of sight and the tag normal."""
+    t = np.asarray(t_cam_tag, dtype=float).reshape(3)
+    normal = np.asarray(R_cam_tag, dtype=float)[:, 2]
+    return abs(float(normal @ t)) / max(float(np.linalg.norm(t)), 1e-9)
+
+
+def tag_measurement_covariance(t_cam_tag, focal_px, tag_size, cos_view=1.0, corner_sigma_px=1.0):
+    """
+    (3, 3) position and (3, 3) rotation covariance of one tag pose, in the
+    camera frame.
+
+    Across the line of sight the error is a pixel's worth of angle, d * s / f.
+    Along it, range comes from the tag's apparent size, so it grows with d^2
+    and with foreshortening (1 / cos of the viewing angle). Orientation error
+    grows the same way with distance and obliquity.
+    """
+    t = np.asarray(t_cam_tag, dtype=float).reshape(3)
+    d = max(float(np.linalg.norm(t)), 1e-6)
+    ray = t / d
+    cos_view = max(cos_view, 0.2)
+
+    sigma_lateral = d * corner_sigma_px / focal_px
+    sigma_range = d * d * corner_sigma_px / (focal_px * tag_size * cos_view)
+    sigma_angle = 2.0 * d * corner_sigma_px / (focal_px * tag_size * cos_view)
+
+    # Build the covariance in a frame whose z axis is the line of sight
+    helper = np.array([1.0, 0.0, 0.0]) if abs(ray[0]) < 0.9 else np.array([0.0, 1.0, 0.0])
+    e1 = np.cross(ray, helper)
+    e1 /= np.linalg.norm(e1)
+    basis = np.column_stack((e1, np.cross(ray, e1), ray))
+    position_cov = basis @ np.diag([sigma_lateral ** 2, sigma_lateral ** 2, sigma_range ** 2]) @ basis.T
+    return position_cov, np.eye(3) * sigma_angle ** 2
+
+
+class PoseEKF:
+    """
+    Constant-velocity extended Kalman filter on a 6-DoF pose.
+
+    State: position p and velocity v, orientation R and angular velocity w
+    (both in the world frame). Orientation error is a small rotation applied
+    on the left, R_true = exp(dtheta) R, so the filter covariance is 12x12
+    over (dp, dv, dtheta, dw).
+
+    update() takes timestamped position (and optionally orientation)
+    measurements with their own covariance and rejects any whose
+    Mahalanobis distance fails the chi-square gate. Because the covariance
+    grows between measurements, the gate widens by itself after a gap
+    instead of rejecting the first measurement that follows it. After
+    max_rejections consecutive rejections the filter restarts from the
+    measurement (the track was lost, not the measurements wrong).
+
+    predict(t) gives the pose at any time without changing the filter, so
+    callers can ask for a pose between detections.
+    """
+
+    def __init__(self, accel_noise=1.0, angular_accel_noise=2.0, gate_chi2=CHI2_99,
+                 max_rejections=5, initial_speed_sigma=0.5, initial_spin_sigma=1.0):
+        """
+        accel_noise:         m/s^2, white-noise acceleration spectral density (sqrt)
+        angular_accel_noise: rad/s^2, the same for rotation
+        """
+        self.accel_noise = accel_noise
+        self.angular_accel_noise = angular_accel_noise
+        self.gate = gate_chi2
+        self.max_rejections = max_rejections
+        self.initial_speed_sigma = initial_speed_sigma
+        self.initial_spin_sigma = initial_spin_sigma
+        self.reset()
+
+    def reset(self):
+        self.t = None
+        self.p = np.zeros(3)
+        self.v = np.zeros(3)
+        self.R = np.eye(3)
+        self.w = np.zeros(3)
+        self.P = np.eye(12)
+        self.has_rotation = False
+        self.rejections = 0
+        self.last_nis = None       # normalised innovation squared of the last update
+        self.last_update_t = None  # time of the last accepted measurement
+
+    @property
+    def initialized(self):
+        return self.t is not None
+
+    # --- MODEL ---
+    def _transition(self, dt):
+        F = np.eye(12)
+        F[0:3, 3:6] = np.eye(3) * dt
+        F[6:9, 9:12] = np.eye(3) * dt
+        return F
+
+    def _process_noise(self, dt):
+        Q = np.zeros((12, 12))
+        block = np.array([[dt ** 3 / 3.0, dt ** 2 / 2.0], [dt ** 2 / 2.0, dt]])
+        for (i, j), q in (((0, 3), self.accel_noise ** 2), ((6, 9), self.angular_accel_noise ** 2)):
+            I3 = np.eye(3) * q
+            Q[i:i + 3, i:i + 3] = block[0, 0] * I3
+            Q[i:i + 3, j:j + 3] = block[0, 1] * I3
+            Q[j:j + 3, i:i + 3] = block[1, 0] * I3
+            Q[j:j + 3, j:j + 3] = block[1, 1] * I3
+        return Q
+
+    def _propagate(self, t):
+        dt = max(t - self.t, 0.0)
+        p = self.p + self.v * dt
+        R = _exp(self.w * dt) @ self.R
+        F = self._transition(dt)
+        P = F @ self.P @ F.T + self._process_noise(dt)
+        return p, R, P
+
+    # --- API ---
+    def predict(self, t):
+        """(position, R_world_cam, position covariance) at time t, None before the first update."""
+        if not self.initialized:
+            return None
+        p, R, P = self._propagate(t)
+        return p, R, P[0:3, 0:3]
+
+    def update(self, t, position, position_cov, R=None, rotation_cov=None):
+        """
+        Fuse one measurement taken at time t (seconds, any monotonic clock).
+        R / rotation_cov are optional; without them only position is used.
+        Returns True if the measurement was accepted.
+        """
+        position = np.asarray(position, dtype=float).reshape(3)
+        position_cov = np.asarray(position_cov, dtype=float)
+        use_rotation = R is not None and rotation_cov is not None
+
+        if not self.initialized:
+            self._start(t, position, position_cov, R if use_rotation else None, rotation_cov)
+            return True
+
+        p, R_pred, P = self._propagate(t)
+
+        if use_rotation:
+            H = np.zeros((6, 12))
+            H[0:3, 0:3] = np.eye(3)
+            H[3:6, 6:9] = np.eye(3)
+            y = np.concatenate((position - p, _log(np.asarray(R, dtype=float) @ R_pred.T)))
+            M = np.zeros((6, 6))
+            M[0:3, 0:3] = position_cov
+            M[3:6, 3:6] = rotation_cov
+        else:
+            H = np.zeros((3, 12))
+            H[0:3, 0:3] = np.eye(3)
+            y = position - p
+            M = position_cov
+
+        S = H @ P @ H.T + M
+        S_inv = np.linalg.inv(S)
+        self.last_nis = float(y @ S_inv @ y)
+
+        if self.last_nis > self.gate[len(y)]:
+            self.rejections += 1
+            if self.rejections >= self.max_rejections:
+                print(f"[WARN] PoseEKF: {self.rejections} measurements rejected in a row, restarting")
+                self._start(t, position, position_cov, R if use_rotation else None, rotation_cov)
+                return True
+            return False
+
+        K = P @ H.T @ S_inv
+        dx = K @ y
+        I_KH = np.eye(12) - K @ H
+        # Joseph form keeps P symmetric positive definite
+        self.P = I_KH @ P @ I_KH.T + K @ M @ K.T
+
+        self.t = max(self.t, t)
+        self.p = p + dx[0:3]
+        self.v = self.v + dx[3:6]
+        self.R = _exp(dx[6:9]) @ R_pred
+        self.w = self.w + dx[9:12]
+        self.has_rotation = self.has_rotation or use_rotation
+        self.rejections = 0
+        self.last_update_t = t
+        return True
+
+    def _start(self, t, position, position_cov, R, rotation_cov):
+        self.reset()
+        self.t = t
+        self.last_update_t = t
+        self.p = position.copy()
+        self.P = np.zeros((12, 12))
+        self.P[0:3, 0:3] = position_cov
+        self.P[3:6, 3:6] = np.eye(3) * self.initial_speed_sigma ** 2
+        if R is not None:
+            self.R = np.asarray(R, dtype=float).copy()
+            self.P[6:9, 6:9] = rotation_cov
+            self.has_rotation = True
+        else:
+            self.P[6:9, 6:9] = np.eye(3) * np.pi ** 2
+        self.P[9:12, 9:12] = np.eye(3) * self.initial_spin_sigma ** 2
+
+
+# -----------------------------
+# BENCHMARK
+# -----------------------------
+def _ema_gate(measurements, max_speed=0.6, alpha=0.2):
+    """The speed gate + EMA from TopoTag/main.py (without its start-up buffer)."""
+    out = []
+    last_pos = last_t = ema = None
+    for t, z in measurements:
+        if last_pos is not None and np.linalg.norm(z - last_pos) / max(t - last_t, 1e-6) > max_speed:
+            out.append((t, ema))
+            continue
+        last_pos, last_t = z, t
+        ema = z.copy() if ema is None else alpha * z + (1.0 - alpha) * ema
+        out.append((t, ema))
+    return out
+
+
+if __name__ == "__main__":
+    import time
+
+    rng = np.random.default_rng(0)
+    fps = 30.0
+    times = np.arange(0, 20, 1.0 / fps)
+    # A robot driving a 2 m circle at 0.4 m/s, camera 1.5 m above the floor
+    truth = np.column_stack((2 * np.cos(0.2 * times), 2 * np.sin(0.2 * times), np.full_like(times, 1.5)))
+
+    sigma = 0.03
+    measurements = []
+    for i, t in enumerate(times):
+        if 200 <= i < 260 or rng.random() < 0.3:  # a 2 s occlusion plus dropped frames
+            continue
+        z = truth[i] + rng.normal(0, sigma, 3)
+        if rng.random() < 0.05:
+            z += rng.normal(0, 0.5, 3)  # tag misread / bad pose flip
+        measurements.append((t, z))
+
+    t0 = time.perf_counter()
+    ema = _ema_gate(measurements)
+    t_ema = (time.perf_counter() - t0) * 1e6 / len(measurements)
+
+    ekf = PoseEKF(accel_noise=0.5)
+    t0 = time.perf_counter()
+    filtered = [(t, ekf.update(t, z, np.eye(3) * sigma ** 2) and ekf.p.copy()) for t, z in measurements]
+    t_ekf = (time.perf_counter() - t0) * 1e6 / len(measurements)
+
+    def error(estimates):
+        index = {t: i for i, t in enumerate(times)}
+        e = [np.linalg.norm(p - truth[index[t]]) for t, p in estimates if p is not None and p is not False]
+        return np.mean(e) * 1000.0, np.percentile(e, 95) * 1000.0
+
+    ekf_accepted = [(t, p) for t, p in filtered if p is not False]
+    print(f"{len(measurements)} measurements, {sigma * 1000:.0f} mm noise, 5% outliers, 2 s gap")
+    print(f"  EMA + speed gate: error mean {error(ema)[0]:5.1f} mm, 95% {error(ema)[1]:6.1f} mm, "
+          f"{t_ema:.1f} us/update")
+    print(f"  EKF:              error mean {error(ekf_accepted)[0]:5.1f} mm, 95% {error(ekf_accepted)[1]:6.1f} mm, "
+          f"{t_ekf:.1f} us/update, {len(measurements) - len(ekf_accepted)} rejected")
+
+    # Pose between detections: predict at every frame time, including the gap
+    ekf = PoseEKF(accel_noise=0.5)
+    k = 0
+    predicted = []
+    for i, t in enumerate(times):
+        while k < len(measurements) and measurements[k][0] <= t:
+            ekf.update(*measurements[k], np.eye(3) * sigma ** 2)
+            k += 1
+        if ekf.initialized:
+            predicted.append(np.linalg.norm(ekf.predict(t)[0] - truth[i]))
+    print(f"  EKF predict() at every frame (incl. the gap): error mean {np.mean(predicted) * 1000:.1f} mm")
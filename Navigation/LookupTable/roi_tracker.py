@@ -0,0 +1,124 @@
+import time
+import numpy as np
+
+
+class RoiTracker:
+    """
+    Predicts where the target tag will be in the next frame so detection can
+    run on a padded crop instead of the whole image.
+
+    The prediction is constant velocity on the tag centre from the last two
+    hits; the crop is the tag size times pad_factor, grown by the predicted
+    motion. After max_misses missed crops, or every full_frame_interval
+    steps, region() returns None and the caller searches the full frame.
+
+    All coordinates are pixels of whichever image the detector runs on.
+    """
+
+    def __init__(self, image_width, image_height, pad_factor=1.5, min_half_size=48,
+                 max_misses=3, full_frame_interval=30):
+        self.image_width = image_width
+        self.image_height = image_height
+        self.pad_factor = pad_factor
+        self.min_half_size = min_half_size
+        self.max_misses = max_misses
+        self.full_frame_interval = full_frame_interval
+        self.reset()
+
+    def reset(self):
+        self.centre = None
+        self.velocity = np.zeros(2)
+        self.size = 0.0
+        self.misses = 0
+        self.steps_since_full = 0
+
+    @property
+    def tracking(self):
+        return self.centre is not None
+
+    def region(self):
+        """(x0, y0, x1, y1) crop for the next detection, or None for a full-frame search."""
+        if not self.tracking or self.steps_since_full >= self.full_frame_interval:
+            return None
+
+        # every miss widens the search a bit more
+        centre = self.centre + self.velocity * (self.misses + 1)
+        half = max(self.size * self.pad_factor, self.min_half_size)
+        half_x = half + abs(self.velocity[0]) * (self.misses + 1)
+        half_y = half + abs(self.velocity[1]) * (self.misses + 1)
+
+        x0 = int(max(0, centre[0] - half_x))
+        y0 = int(max(0, centre[1] - half_y))
+        x1 = int(min(self.image_width, centre[0] + half_x))
+        y1 = int(min(self.image_height, centre[1] + half_y))
+        if x1 - x0 < 2 * self.min_half_size or y1 - y0 < 2 * self.min_half_size:
+            # prediction has left the image
+            return None
+        return x0, y0, x1, y1
+
+    def update(self, corners, full_frame):
+        """Feed the target's full-frame corners (4, 2), or None if it was not found."""
+        self.steps_since_full = 0 if full_frame else self.steps_since_full + 1
+
+        if corners is None:
+            if self.tracking:
+                self.misses += 1
+                if self.misses > self.max_misses:
+                    self.reset()
+            return
+
+        centre = np.mean(corners, axis=0)
+        if self.tracking:
+            self.velocity = centre - self.centre
+        self.centre = centre
+        self.size = float(np.max(np.ptp(corners, axis=0)))
+        self.misses = 0
+
+
+def offset_detections(detections, x0, y0):
+    """Shift detections made on a crop back to full-frame coordinates."""
+    shift = np.array([x0, y0], dtype=np.float64)
+    for det in detections:
+        det.corners = det.corners + shift
+        det.center = det.center + shift
+    return detections
+
+
+# -----------------------------
+# BENCHMARK
+# -----------------------------
+if __name__ == "__main__":
+    import os
+    import cv2
+    from pupil_apriltags import Detector
+
+    BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+    image = cv2.imread(os.path.join(BASE_DIR, "..", "..", "TopoTag", "test-images", "IMG_6397.png"),
+                       cv2.IMREAD_GRAYSCALE)
+    scale = 720 / image.shape[0]
+    image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    frame = np.full((720, 1280), 128, dtype=np.uint8)
+    frame[:, :image.shape[1]] = image[:, :1280]
+
+    detector = Detector(families="tag36h11", nthreads=2, quad_decimate=1.0, refine_edges=1)
+    full = detector.detect(frame)
+    target_id = full[0].tag_id
+    tracker = RoiTracker(1280, 720)
+    tracker.update(full[0].corners, full_frame=True)
+
+    def timed(fn, repeats=30):
+        t0 = time.perf_counter()
+        for _ in range(repeats):
+            result = fn()
+        return (time.perf_counter() - t0) * 1000.0 / repeats, result
+
+    def roi_step():
+        x0, y0, x1, y1 = tracker.region()
+        dets = offset_detections(detector.detect(np.ascontiguousarray(frame[y0:y1, x0:x1])), x0, y0)
+        return [d for d in dets if d.tag_id == target_id]
+
+    t_full, _ = timed(lambda: detector.detect(frame))
+    t_roi, dets = timed(roi_step)
+    error = np.abs(dets[0].corners - full[0].corners).max() if dets else float("nan")
+    print(f"full frame: {t_full:.2f} ms ({1000 / t_full:.0f} Hz)")
+    print(f"ROI {tracker.region()}: {t_roi:.2f} ms ({1000 / t_roi:.0f} Hz), max corner diff {error:.3f} px")
@@ -0,0 +1,173 @@
+import os
+import time
+import hashlib
+import cv2
+import numpy as np
+
+# -----------------------------
+# DEFAULT PATHS
+# -----------------------------
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CALIBRATION = os.path.join(BASE_DIR, "..", "..", "camera_calibration.npz")
+DEFAULT_CACHE_DIR = os.path.join(BASE_DIR, "undistort_cache")
+
+
+class Undistorter:
+    """
+    Undistortion with precomputed remap tables.
+
+    cv2.undistort rebuilds its maps on every call. Here the fixed-point
+    (CV_16SC2) maps from initUndistortRectifyMap are built once per frame
+    size, kept in memory, and cached on disk keyed by a hash of the
+    intrinsics and the resolution, so later runs only load them.
+
+    alpha=None keeps the original camera matrix (like cv2.undistort(img, K, d));
+    otherwise getOptimalNewCameraMatrix(alpha) is used and new_camera_matrix
+    must be passed to the detector.
+    """
+
+    def __init__(self, camera_matrix, dist_coeffs, alpha=None, cache_dir=DEFAULT_CACHE_DIR):
+        self.camera_matrix = np.asarray(camera_matrix, dtype=np.float64).reshape(3, 3)
+        self.dist_coeffs = np.asarray(dist_coeffs, dtype=np.float64).ravel()
+        self.alpha = alpha
+        self.cache_dir = cache_dir
+
+        self._maps = {}  # (w, h) -> (map1, map2, new_camera_matrix)
+        self.new_camera_matrix = self.camera_matrix.copy()
+
+    @classmethod
+    def from_file(cls, calibration_path=DEFAULT_CALIBRATION, **kwargs):
+        """Load camera_matrix / dist_coeffs from a calibrate_camera.py .npz."""
+        calib = np.load(calibration_path)
+        return cls(calib["camera_matrix"], calib["dist_coeffs"], **kwargs)
+
+    def _cache_key(self, size):
+        h = hashlib.sha1()
+        h.update(self.camera_matrix.tobytes())
+        h.update(self.dist_coeffs.tobytes())
+        h.update(repr(self.alpha).encode())
+        return f"undistort_{h.hexdigest()[:16]}_{size[0]}x{size[1]}.npz"
+
+    def _build_maps(self, size):
+        if self.alpha is None:
+            new_k = self.camera_matrix
+        else:
+            new_k, _ = cv2.getOptimalNewCameraMatrix(self.camera_matrix, self.dist_coeffs, size, self.alpha, size)
+        map1, map2 = cv2.initUndistortRectifyMap(
+            self.camera_matrix, self.dist_coeffs, None, new_k, size, cv2.CV_16SC2
+        )
+        return map1, map2, new_k
+
+    def maps_for(self, size):
+        """(map1, map2, new_camera_matrix) for a (width, height) frame size."""
+        size = (int(size[0]), int(size[1]))
+        if size in self._maps:
+            return self._maps[size]
+
+        path = os.path.join(self.cache_dir, self._cache_key(size)) if self.cache_dir else None
+        maps = None
+        if path and os.path.exists(path):
+            try:
+                cached = np.load(path)
+                maps = (cached["map1"], cached["map2"], cached["new_camera_matrix"])
+            except Exception as e:
+                print(f"[WARN] Ignoring unreadable undistort cache {path}: {e}")
+
+        if maps is None:
+            maps = self._build_maps(size)
+            if path:
+                try:
+                    os.makedirs(self.cache_dir, exist_ok=True)
+                    np.savez(path, map1=maps[0], map2=maps[1], new_camera_matrix=maps[2])
+                except OSError as e:
+                    print(f"[WARN] Could not write undistort cache {path}: {e}")
+
+        self._maps[size] = maps
+        return maps
+
+    def undistort(self, image):
+        h, w = image.shape[:2]
+        map1, map2, new_k = self.maps_for((w, h))
+        self.new_camera_matrix = new_k
+        return cv2.remap(image, map1, map2, cv2.INTER_LINEAR)
+
+    def undistort_region(self, image, x0, y0, x1, y1):
+        """
+        Only the [y0:y1, x0:x1] window of undistort(image), sampling the
+        cached maps for that window so the rest of the frame is never remapped.
+        """
+        h, w = image.shape[:2]
+        map1, map2, new_k = self.maps_for((w, h))
+        self.new_camera_matrix = new_k
+        return cv2.remap(image, map1[y0:y1, x0:x1], map2[y0:y1, x0:x1], cv2.INTER_LINEAR)
+
+    def undistort_points(self, points):
+        """
+        Undistort pixel coordinates (..., 2) of the raw image into the same
+        pixel frame undistort() produces, without touching the image.
+        """
+        points = np.asarray(points, dtype=np.float64)
+        corrected = cv2.undistortPoints(
+            points.reshape(-1, 1, 2), self.camera_matrix, self.dist_coeffs, P=self.new_camera_matrix
+        )
+        return corrected.reshape(points.shape)
+
+    def distort_points(self, points):
+        """Inverse of undistort_points: undistorted pixel coordinates back to the raw image."""
+        points = np.asarray(points, dtype=np.float64)
+        k = self.new_camera_matrix
+        flat = points.reshape(-1, 2)
+        normalised = np.column_stack((
+            (flat[:, 0] - k[0, 2]) / k[0, 0],
+            (flat[:, 1] - k[1, 2]) / k[1, 1],
+            np.ones(len(flat)),
+        ))
+        raw, _ = cv2.projectPoints(normalised, np.zeros(3), np.zeros(3), self.camera_matrix, self.dist_coeffs)
+        return raw.reshape(points.shape)
+
+    def undistort_detections(self, detections, image_size=None):
+        """Replace corners / center of pupil_apriltags detections with undistorted ones."""
+        if image_size is not None and self.alpha is not None:
+            self.new_camera_matrix = self.maps_for(image_size)[2]
+        for det in detections:
+            det.corners = self.undistort_points(det.corners)
+            det.center = self.undistort_points(det.center)
+        return detections
+
+    def camera_params(self):
+        """(fx, fy, cx, cy) of the undistorted image, for pupil_apriltags."""
+        k = self.new_camera_matrix
+        return (k[0, 0], k[1, 1], k[0, 2], k[1, 2])
+
+
+# -----------------------------
+# BENCHMARK
+# -----------------------------
+def benchmark(width=1280, height=720, repeats=50):
+    undistorter = Undistorter.from_file(cache_dir=None)
+    k, d = undistorter.camera_matrix, undistorter.dist_coeffs
+    gray = np.random.default_rng(0).integers(0, 255, (height, width), dtype=np.uint8)
+
+    def timed(fn):
+        fn()
+        t0 = time.perf_counter()
+        for _ in range(repeats):
+            fn()
+        return (time.perf_counter() - t0) * 1000.0 / repeats
+
+    def per_frame_optimal():
+        new_k, _ = cv2.getOptimalNewCameraMatrix(k, d, (width, height), 1, (width, height))
+        cv2.undistort(gray, k, d, None, new_k)
+
+    t_build = time.perf_counter()
+    undistorter.maps_for((width, height))
+    t_build = (time.perf_counter() - t_build) * 1000.0
+
+    print(f"Frame {width}x{height}, {repeats} runs")
+    print(f"  cv2.undistort per frame (AprilTagNavigator): {timed(lambda: cv2.undistort(gray, k, d)):.2f} ms")
+    print(f"  getOptimalNewCameraMatrix + undistort (main.py): {timed(per_frame_optimal):.2f} ms")
+    print(f"  cached remap (one-off build {t_build:.1f} ms): {timed(lambda: undistorter.undistort(gray)):.2f} ms")
+
+
+if __name__ == "__main__":
+    benchmark()
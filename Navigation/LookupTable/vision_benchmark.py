@@ -0,0 +1,247 @@
+"""
+Headless benchmark of the detection pipeline used by AprilTagNavigator and
+TopoTag/main.py: grayscale -> undistort -> detect -> per-tag pose.
+
+Images: TopoTag/test-images, a few TopoTag/calibration/calibration_images
+(no tags: latency and false positives only) and rescaled / rotated
+variants of the test images, all brought to the navigator's frame width.
+
+Every detector configuration in CONFIGS runs over every image REPEATS
+times. For each configuration and stage it reports latency percentiles,
+pipeline throughput and detection recall against reference tag ids
+(union of a few slow, thorough detector settings on the original image).
+Results are written to RESULTS_PATH as CSV and summarised on stdout.
+
+Each configuration runs in a fresh process: pupil_apriltags can corrupt
+the heap when detectors with different nthreads are created and freed in
+one process, and a crash then only loses that configuration.
+
+Run: python vision_benchmark.py
+"""
+
+import os
+import csv
+import glob
+import time
+import platform
+import multiprocessing as mp
+import cv2
+import numpy as np
+from pupil_apriltags import Detector
+from undistorter import Undistorter, DEFAULT_CALIBRATION
+
+# --- CONFIGURATION ---
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.join(BASE_DIR, "..", "..")
+TEST_IMAGES = os.path.join(REPO_DIR, "TopoTag", "test-images", "*.png")
+CALIBRATION_IMAGES = os.path.join(REPO_DIR, "TopoTag", "calibration", "calibration_images", "*.jpg")
+RESULTS_PATH = os.path.join(BASE_DIR, "vision_benchmark_results.csv")
+
+FRAME_WIDTH = 1280             # AprilTagNavigator image_width; the calibration is for this width
+MAX_CALIBRATION_IMAGES = 4
+VARIANT_SCALES = (1.0, 0.5)
+VARIANT_ROTATIONS = (0, 30, 90)  # degrees
+REPEATS = 3
+TAG_SIZE = 0.09                # m, AprilTagNavigator.TAG_SIZE
+FAMILIES = "tag36h11"
+
+# Navigator settings, then one parameter changed at a time
+BASELINE = dict(nthreads=2, quad_decimate=1.0, quad_sigma=0.0, refine_edges=1, decode_sharpening=0.25)
+SWEEP = {
+    "nthreads": (1, 4),
+    "quad_decimate": (1.5, 2.0, 3.0),
+    "quad_sigma": (0.8,),
+    "refine_edges": (0,),
+    "decode_sharpening": (0.0, 0.5),
+}
+CONFIGS = [BASELINE] + [dict(BASELINE, **{k: v}) for k, values in SWEEP.items() for v in values]
+
+# Thorough settings whose union of ids is taken as ground truth
+REFERENCE_SETTINGS = ((1.0, 1.0), (2.0, 1.0), (1.0, 0.5))  # (quad_decimate, image scale)
+
+STAGES = ("gray", "undistort", "detect", "pose", "total")
+
+
+# --- IMAGES ---
+def _to_width(image, width):
+    scale = width / image.shape[1]
+    interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR
+    return cv2.resize(image, None, fx=scale, fy=scale, interpolation=interpolation)
+
+
+def _rotate(image, degrees):
+    """Rotate about the centre, growing the canvas so nothing is cut off."""
+    if degrees == 0:
+        return image
+    h, w = image.shape[:2]
+    M = cv2.getRotationMatrix2D((w / 2, h / 2), degrees, 1.0)
+    cos, sin = abs(M[0, 0]), abs(M[0, 1])
+    new_w, new_h = int(h * sin + w * cos), int(h * cos + w * sin)
+    M[0, 2] += new_w / 2 - w / 2
+    M[1, 2] += new_h / 2 - h / 2
+    return cv2.warpAffine(image, M, (new_w, new_h), borderValue=(255, 255, 255))
+
+
+def reference_ids(image):
+    ids = set()
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    for decimate, scale in REFERENCE_SETTINGS:
+        detector = Detector(families=FAMILIES, nthreads=1, quad_decimate=decimate, refine_edges=1)
+        scaled = gray if scale == 1.0 else cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        ids.update(d.tag_id for d in detector.detect(scaled))
+    return ids
+
+
+def load_images():
+    """[(name, BGR image, reference ids or None for tag-free images)]"""
+    images = []
+    for path in sorted(glob.glob(TEST_IMAGES)):
+        original = cv2.imread(path)
+        if original is None:
+            print(f"[WARN] Cannot read {path}")
+            continue
+        truth = reference_ids(original)
+        base = _to_width(original, FRAME_WIDTH)
+        name = os.path.splitext(os.path.basename(path))[0]
+        for scale in VARIANT_SCALES:
+            for degrees in VARIANT_ROTATIONS:
+                variant = base if scale == 1.0 else cv2.resize(base, None, fx=scale, fy=scale,
+                                                               interpolation=cv2.INTER_AREA)
+                # Rescaled variants are pasted back on a full-width frame
+                if scale != 1.0:
+                    canvas = np.full((base.shape[0], FRAME_WIDTH, 3), 255, dtype=np.uint8)
+                    canvas[:variant.shape[0], :variant.shape[1]] = variant
+                    variant = canvas
+                variant = _rotate(variant, degrees)
+                images.append((f"{name}_s{scale:g}_r{degrees}", variant, truth))
+
+    for path in sorted(glob.glob(CALIBRATION_IMAGES))[:MAX_CALIBRATION_IMAGES]:
+        image = cv2.imread(path)
+        if image is None:
+            print(f"[WARN] Cannot read {path}")
+            continue
+        images.append((os.path.splitext(os.path.basename(path))[0], _to_width(image, FRAME_WIDTH), None))
+    return images
+
+
+# --- PIPELINE ---
+def run_config(config, images, camera_matrix, dist_coeffs, object_points):
+    undistorter = Undistorter(camera_matrix, dist_coeffs, cache_dir=None)
+    detector = Detector(families=FAMILIES, debug=False, **config)
+    samples = {stage: [] for stage in STAGES}
+    found = expected = false_positives = 0
+
+    for _, image, truth in images:
+        for repeat in range(REPEATS + 1):  # the first pass builds remap tables / warms caches
+            t0 = time.perf_counter()
+            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+            t1 = time.perf_counter()
+            undistorted = undistorter.undistort(gray)
+            t2 = time.perf_counter()
+            detections = detector.detect(undistorted)
+            t3 = time.perf_counter()
+            K = undistorter.new_camera_matrix
+            for d in detections:
+                cv2.solvePnP(object_points, d.corners, K, None, flags=cv2.SOLVEPNP_IPPE_SQUARE)
+            t4 = time.perf_counter()
+            if repeat == 0:
+                continue
+            for stage, dt in zip(STAGES, (t1 - t0, t2 - t1, t3 - t2, t4 - t3, t4 - t0)):
+                samples[stage].append(dt * 1000.0)
+
+        ids = {d.tag_id for d in detections}
+        if truth is None:
+            false_positives += len(ids)
+        else:
+            found += len(ids & truth)
+            expected += len(truth)
+            false_positives += len(ids - truth)
+
+    recall = found / expected if expected else float("nan")
+    return samples, recall, false_positives
+
+
+def _config_process(result_queue, *args):
+    result_queue.put(run_config(*args))
+
+
+def run_isolated(*args):
+    """run_config in a child process; None if it crashed."""
+    result_queue = mp.Queue()
+    process = mp.Process(target=_config_process, args=(result_queue, *args))
+    process.start()
+    result = None
+    while process.is_alive() or not result_queue.empty():
+        try:
+            result = result_queue.get(timeout=0.5)
+            break
+        except Exception:
+            continue
+    process.join()
+    if result is None:
+        print(f"[WARN] Configuration {args[0]} crashed (exit code {process.exitcode})")
+    return result
+
+
+def main():
+    images = load_images()
+    if not images:
+        print("[FATAL] No images found")
+        return
+
+    # Calibration is for FRAME_WIDTH; images keep that width, so K applies as is
+    if os.path.exists(DEFAULT_CALIBRATION):
+        calib = np.load(DEFAULT_CALIBRATION)
+        camera_matrix, dist_coeffs = calib["camera_matrix"], calib["dist_coeffs"]
+    else:
+        print(f"[WARN] {DEFAULT_CALIBRATION} not found, undistorting with zero distortion")
+        camera_matrix, dist_coeffs = np.array([[1411.9, 0, 640], [0, 1411.3, 360], [0, 0, 1]]), np.zeros(5)
+    s = TAG_SIZE / 2.0
+    object_points = np.array([[-s, s, 0], [s, s, 0], [s, -s, 0], [-s, -s, 0]], dtype=np.float64)
+
+    tagged = sum(truth is not None for _, _, truth in images)
+    print(f"{len(images)} images ({tagged} with tags, {len(images) - tagged} tag-free), "
+          f"{REPEATS} repeats, {len(CONFIGS)} configurations, {platform.processor() or platform.machine()}, "
+          f"{os.cpu_count()} CPUs")
+
+    rows = []
+    header = f"{'config':<28} {'detect p50':>10} {'p90':>7} {'p99':>7} {'total p50':>10} {'fps':>6} {'recall':>7} {'FP':>4}"
+    print(header)
+    for config in CONFIGS:
+        result = run_isolated(config, images, camera_matrix, dist_coeffs, object_points)
+        if result is None:
+            continue
+        samples, recall, false_positives = result
+        total = np.array(samples["total"])
+        fps = 1000.0 / total.mean()
+        changed = {k: v for k, v in config.items() if BASELINE[k] != v}
+        label = "baseline" if not changed else ", ".join(f"{k}={v}" for k, v in changed.items())
+
+        for stage in STAGES:
+            ms = np.array(samples[stage])
+            rows.append({
+                "config": label, **config, "stage": stage, "samples": len(ms),
+                "mean_ms": f"{ms.mean():.3f}",
+                "p50_ms": f"{np.percentile(ms, 50):.3f}",
+                "p90_ms": f"{np.percentile(ms, 90):.3f}",
+                "p99_ms": f"{np.percentile(ms, 99):.3f}",
+                "max_ms": f"{ms.max():.3f}",
+                "throughput_fps": f"{fps:.2f}",
+                "recall": f"{recall:.3f}",
+                "false_positives": false_positives,
+            })
+
+        detect = np.array(samples["detect"])
+        print(f"{label:<28} {np.percentile(detect, 50):>10.1f} {np.percentile(detect, 90):>7.1f} "
+              f"{np.percentile(detect, 99):>7.1f} {np.percentile(total, 50):>10.1f} {fps:>6.1f} "
+              f"{recall:>7.1%} {false_positives:>4}")
+
+    with open(RESULTS_PATH, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+    print(f"Results -> {RESULTS_PATH}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+"""
+Offline camera localisation for a recorded video, without a GUI.
+
+A reader process decodes the video and hands grayscale frames to a pool of
+worker processes. Each worker has its own Detector (and undistortion maps)
+and runs the same per-frame pose maths as main.py: undistort, detect, then
+either one joint PnP over all mapped tags or per-tag poses averaged.
+Results are put back into frame order and appended to the CSV as they
+arrive, so a long recording never sits in memory and a partial run still
+leaves a usable file.
+
+Run: python batch_localize.py [video] [output.csv]
+"""
+
+import os
+import sys
+import csv
+import time
+import queue
+import multiprocessing as mp
+import cv2
+import numpy as np
+from pupil_apriltags import Detector
+
+# --- CONFIGURATION ---
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+VIDEO_PATH = os.path.join(BASE_DIR, "test-videos", "video_3.MOV")
+MAP_PATH = os.path.join(BASE_DIR, "maps", "125-lab.json")
+OUTPUT_PATH = os.path.join(BASE_DIR, "camera_path_batch.csv")
+
+TAG_SIZE = 0.05          # m
+UNDISTORT = True         # main.py behaviour; False = raw frames like room-basic-detector.py
+JOINT_PNP = True         # one solvePnP over all tags (multi_tag_pnp.py) instead of per-tag poses
+NUM_WORKERS = os.cpu_count() or 1
+QUEUE_DEPTH = 2          # frames in flight per worker
+POLL_S = 1.0             # result wait before checking whether the processes are still alive
+
+# --- CAMERA INTRINSICS (same as main.py) ---
+fx, fy = 3074.20762, 3067.80082
+cx, cy = 1512.0512, 2008.5982
+dist_coeffs = np.array([0.212998004, -1.22270810, -0.00290084, -0.00057276, 1.92609281], dtype=float)
+
+sys.path.append(os.path.join(BASE_DIR, "..", "Navigation", "LookupTable"))
+from undistorter import Undistorter  # noqa: E402
+from multi_tag_pnp import MultiTagLocalizer  # noqa: E402
+from world_transform import camera_positions_in_world  # noqa: E402
+from tag_map import load_tag_map  # noqa: E402
+
+
+def camera_position(detections, tag_map):
+    """Mean world position of the camera over all mapped tags (None if none)."""
+    _, positions = camera_positions_in_world(detections, tag_map)
+    if len(positions) == 0:
+        return None, 0
+    return positions.mean(axis=0), len(positions)
+
+
+# --- READER PROCESS ---
+def read_frames(video_path, frame_queue, num_workers):
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        print(f"[FATAL] Cannot open video file: {video_path}")
+    else:
+        index = 0
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            # Gray is all the workers need, and a third of the bytes to pickle
+            frame_queue.put((index, cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)))
+            index += 1
+        cap.release()
+
+    for _ in range(num_workers):
+        frame_queue.put(None)
+
+
+# --- WORKER PROCESSES ---
+def localize_frames(frame_queue, result_queue, map_path, tag_size, undistort, joint_pnp):
+    tag_map = load_tag_map(map_path)
+    world_positions = tag_map.world_positions
+    detector = Detector(
+        families="tag36h11",
+        nthreads=1,           # parallelism comes from the process pool
+        quad_decimate=1.0,
+        quad_sigma=0.0,
+        refine_edges=True,
+        decode_sharpening=0.25,
+        debug=False,
+    )
+    mtx = np.array([[fx, 0, cx], [0, fy, cy], [0, 0, 1]], dtype=float)
+    undistorter = Undistorter(mtx, dist_coeffs, alpha=1)
+    camera_params = (fx, fy, cx, cy)
+    localizer = MultiTagLocalizer(world_positions, tag_size, mtx, None if undistort else dist_coeffs,
+                                  world_rotations=tag_map.world_rotations)
+
+    while True:
+        item = frame_queue.get()
+        if item is None:
+            break
+        index, gray = item
+
+        if undistort:
+            gray = undistorter.undistort(gray)
+            camera_params = undistorter.camera_params()
+            localizer.camera_matrix = undistorter.new_camera_matrix
+
+        detections = detector.detect(
+            gray,
+            estimate_tag_pose=not joint_pnp,
+            camera_params=camera_params,
+            tag_size=tag_size
+        )
+        if joint_pnp:
+            pose = localizer.solve(detections)
+            position, n_tags = (None, 0) if pose is None else (pose["position"], pose["tags"])
+        else:
+            position, n_tags = camera_position(detections, tag_map)
+        result_queue.put((index, position, n_tags))
+
+    result_queue.put(None)
+
+
+# --- PIPELINE ---
+def run(video_path=VIDEO_PATH, output_path=OUTPUT_PATH, map_path=MAP_PATH,
+        num_workers=NUM_WORKERS, tag_size=TAG_SIZE, undistort=UNDISTORT, joint_pnp=JOINT_PNP):
+    cap = cv2.VideoCapture(video_path)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    size = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+    cap.release()
+
+    if undistort and size[0] > 0:
+        # Build the remap tables once here, so the workers only load them from
+        # the disk cache instead of all writing it at the same time
+        mtx = np.array([[fx, 0, cx], [0, fy, cy], [0, 0, 1]], dtype=float)
+        Undistorter(mtx, dist_coeffs, alpha=1).maps_for(size)
+
+    # Same for the compiled map
+    load_tag_map(map_path)
+
+    frame_queue = mp.Queue(maxsize=QUEUE_DEPTH * num_workers)
+    result_queue = mp.Queue()
+
+    reader = mp.Process(target=read_frames, args=(video_path, frame_queue, num_workers), daemon=True)
+    workers = [
+        mp.Process(target=localize_frames,
+                   args=(frame_queue, result_queue, map_path, tag_size, undistort, joint_pnp), daemon=True)
+        for _ in range(num_workers)
+    ]
+    reader.start()
+    for w in workers:
+        w.start()
+
+    t_start = time.perf_counter()
+    pending = {}
+    next_index = 0
+    frames = located = missing = 0
+    finished = 0
+    dead = set()
+    reader_failed = False
+
+    def write_row(writer, index, position, n_tags):
+        nonlocal located
+        if position is not None:
+            writer.writerow([index, f"{index / fps:.4f}", *position, n_tags])
+            located += 1
+
+    with open(output_path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["frame", "t", "x", "y", "z", "tags"])
+
+        while finished + len(dead) < num_workers:
+            try:
+                item = result_queue.get(timeout=POLL_S)
+            except queue.Empty:
+                # A process that crashed (pupil_apriltags segfault, OOM) never
+                # sends its end marker, so look instead of waiting forever
+                for i, w in enumerate(workers):
+                    if i not in dead and w.exitcode not in (None, 0):
+                        print(f"[WARN] Worker {i} died (exit code {w.exitcode}), its frames are missing")
+                        dead.add(i)
+                if not reader_failed and reader.exitcode not in (None, 0):
+                    print(f"[WARN] Reader died (exit code {reader.exitcode}), finishing the frames already read")
+                    reader_failed = True
+                    # The end markers it never sent
+                    for _ in range(num_workers - len(dead)):
+                        try:
+                            frame_queue.put(None, timeout=POLL_S)
+                        except queue.Full:
+                            break
+                continue
+            if item is None:
+                finished += 1
+                continue
+            pending[item[0]] = item[1:]
+
+            # Write everything that is now contiguous
+            while next_index in pending:
+                write_row(writer, next_index, *pending.pop(next_index))
+                next_index += 1
+                frames += 1
+            f.flush()
+
+        # Frames a dead worker took leave gaps; write what came after them
+        for index in sorted(pending):
+            missing += index - next_index
+            write_row(writer, index, *pending.pop(index))
+            next_index = index + 1
+            frames += 1
+
+    for p in [reader] + workers:
+        p.join(timeout=POLL_S)
+        if p.is_alive():
+            p.terminate()
+
+    elapsed = time.perf_counter() - t_start
+    print(f"Processed {frames} frames with {num_workers} workers in {elapsed:.1f} s "
+          f"({frames / max(elapsed, 1e-9):.1f} fps), {located} located -> {output_path}")
+    if dead or reader_failed:
+        print(f"[WARN] Run incomplete: {len(dead)} worker(s) died, {missing} frame(s) missing"
+              f"{', reader died' if reader_failed else ''}")
+    return frames, located, elapsed
+
+
+if __name__ == "__main__":
+    run(*sys.argv[1:3])
@@ -0,0 +1,636 @@
+"""
+Survey a tag map from a recorded video (or a folder of frames).
+
+Every tag's 6-DoF pose and the camera pose of every frame used are
+estimated together by bundle adjustment of the detected tag corners:
+
+1. detect tags in every FRAME_STEP-th frame, undistort the corners
+2. initialise: anchor tags are fixed (poses from an existing map, or the
+   most-seen tag at the origin); then, repeatedly, every frame that sees
+   two posed tags gets a camera pose (PnP on their corners) and every tag
+   seen by two posed frames gets a pose from its views (one of each only
+   when nothing else can grow). A few adjustment iterations run on the
+   partial map each time it grows by a quarter, so chaining errors do not
+   pile up across a large venue; after each, tags and frames re-choose
+   between their IPPE solutions against the adjusted poses.
+3. Levenberg-Marquardt on the corner reprojection error (Huber loss).
+   The normal equations are block sparse: each frame's 6x6 block couples
+   only to the tags it sees. The frame blocks are eliminated (Schur
+   complement), the reduced tags-only system is solved densely and the
+   frame updates are back-substituted, so the cost is dominated by the
+   6T x 6T tag system however many frames there are.
+
+The map is written in the maps/*.json schema with each tag's rotation
+(tag -> world, as tag_map.py reads it), and the camera path next to it
+as a .traj (trajectory.py).
+
+Give at least three anchors that are not on one line: a small tag's
+orientation is only known to a degree or so, and with two anchors the
+whole map can tilt about the line through them.
+
+Run: python build_tag_map.py <video or frame folder> <out.json> [anchor map.json]
+     python build_tag_map.py --benchmark
+"""
+
+import os
+import sys
+import glob
+import json
+import time
+import cv2
+import numpy as np
+from multi_tag_pnp import tag_object_points
+from tag_map import read_json_map
+from trajectory import TrajectoryRecorder
+
+# --- CONFIGURATION ---
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CALIBRATION_PATH = os.path.join(BASE_DIR, "calibration", "camera_calibration.npz")  # calibrate_camera.py
+
+TAG_SIZE = 0.05          # m
+FRAME_STEP = 2           # detect in every n-th video frame
+MIN_TAG_PX = 20          # ignore detections with a shorter side (their corners are too noisy)
+MIN_DECISION_MARGIN = 20.0
+ANCHOR_IDS = None        # tags fixed to the anchor map; None = all of its tags that were seen
+HUBER_PX = 2.0
+MAX_ITERATIONS = 50
+REFINE_ITERATIONS = 5    # per intermediate adjustment while the map grows
+
+# --- CAMERA INTRINSICS (same as main.py, when there is no calibration file) ---
+fx, fy = 3074.20762, 3067.80082
+cx, cy = 1512.0512, 2008.5982
+dist_coeffs = np.array([0.212998004, -1.22270810, -0.00290084, -0.00057276, 1.92609281], dtype=float)
+
+
+# --- SE(3) HELPERS ---
+def _skew(v):
+    """(..., 3) -> (..., 3, 3) cross-product matrices."""
+    z = np.zeros(v.shape[:-1])
+    return np.stack((
+        np.stack((z, -v[..., 2], v[..., 1]), axis=-1),
+        np.stack((v[..., 2], z, -v[..., 0]), axis=-1),
+        np.stack((-v[..., 1], v[..., 0], z), axis=-1),
+    ), axis=-2)
+
+
+def _exp_so3(w):
+    """Rotation matrices (N, 3, 3) for rotation vectors (N, 3)."""
+    theta = np.linalg.norm(w, axis=-1)[..., None, None]
+    K = _skew(w)
+    small = theta < 1e-9
+    safe = np.where(small, 1.0, theta)
+    a = np.where(small, 1.0, np.sin(safe) / safe)
+    b = np.where(small, 0.5, (1.0 - np.cos(safe)) / safe ** 2)
+    return np.eye(3) + a * K + b * (K @ K)
+
+
+def _pose(R, t):
+    T = np.eye(4)
+    T[:3, :3], T[:3, 3] = R, np.ravel(t)
+    return T
+
+
+def _quad_area(corners):
+    """Area in px^2 of quads (..., 4, 2), from the diagonals."""
+    d1, d2 = corners[..., 2, :] - corners[..., 0, :], corners[..., 3, :] - corners[..., 1, :]
+    return np.abs(d1[..., 0] * d2[..., 1] - d1[..., 1] * d2[..., 0]) / 2.0
+
+
+def _inverse(T):
+    R, t = T[:3, :3], T[:3, 3]
+    return _pose(R.T, -R.T @ t)
+
+
+# --- OBSERVATIONS ---
+def iter_frames(source, step=FRAME_STEP):
+    """Yield (frame index, grayscale frame) from a video file or a folder of images."""
+    if os.path.isdir(source):
+        paths = sorted(glob.glob(os.path.join(source, "*.png")) + glob.glob(os.path.join(source, "*.jpg")))
+        for index, path in enumerate(paths[::step]):
+            gray = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+            if gray is None:
+                print(f"[WARN] Cannot read {path}")
+                continue
+            yield index * step, gray
+        return
+
+    cap = cv2.VideoCapture(source)
+    if not cap.isOpened():
+        print(f"[FATAL] Cannot open video file: {source}")
+        return
+    index = 0
+    while True:
+        # grab() skips decoding the frames in between
+        if index % step and cap.grab():
+            index += 1
+            continue
+        ret, frame = cap.read()
+        if not ret:
+            break
+        yield index, cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        index += 1
+    cap.release()
+
+
+def collect_observations(frames, detector, camera_matrix, dist_coeffs):
+    """
+    Detect tags in (index, gray) frames. Returns frame (M,), tag (M,) and
+    undistorted corners (M, 4, 2) in pixels of camera_matrix.
+    """
+    frame_ids, tag_ids, corners = [], [], []
+    for index, gray in frames:
+        for d in detector.detect(gray):
+            if d.decision_margin < MIN_DECISION_MARGIN:
+                continue
+            c = np.asarray(d.corners, dtype=np.float64)
+            if np.linalg.norm(np.diff(np.vstack((c, c[:1])), axis=0), axis=1).min() < MIN_TAG_PX:
+                continue
+            frame_ids.append(index)
+            tag_ids.append(d.tag_id)
+            corners.append(c)
+    if not corners:
+        return np.empty(0, np.int64), np.empty(0, np.int64), np.empty((0, 4, 2))
+    corners = np.array(corners)
+    undistorted = cv2.undistortPoints(corners.reshape(-1, 1, 2), camera_matrix, dist_coeffs, P=camera_matrix)
+    return np.array(frame_ids), np.array(tag_ids), undistorted.reshape(-1, 4, 2)
+
+
+# --- INITIALISATION ---
+def _ippe_candidates(obj, corners, camera_matrix):
+    """Both IPPE solutions (4x4 T_cam_tag) for one detection, best first."""
+    _, rvecs, tvecs, _ = cv2.solvePnPGeneric(obj, corners, camera_matrix, None, flags=cv2.SOLVEPNP_IPPE_SQUARE)
+    return [_pose(cv2.Rodrigues(r)[0], t) for r, t in zip(rvecs, tvecs)]
+
+
+def _reprojection(T_cw, T_wt, obj, corners, camera_matrix):
+    """
+    Squared corner errors (..., 4), capped at 10 px, of tags T_wt (..., 4, 4)
+    seen from T_cw (..., 4, 4) against corners (..., 4, 2); all broadcast.
+    """
+    T = T_cw @ T_wt
+    p = np.einsum("...ij,kj->...ki", T[..., :3, :3], obj) + T[..., None, :3, 3]
+    z = np.maximum(p[..., 2:3], 1e-6)
+    uv = p[..., :2] / z * camera_matrix[[0, 1], [0, 1]] + camera_matrix[:2, 2]
+    return np.minimum(np.sum((uv - corners) ** 2, axis=-1), 100.0)
+
+
+def initialise(frames, tags, corners, anchors, camera_matrix, tag_size=TAG_SIZE, max_views=20,
+               refine=None, refine_growth=1.25):
+    """
+    Chain PnP outwards from the anchors. anchors: {tag_id: 4x4 T_world_tag}.
+    Returns ({tag_id: T_world_tag}, {frame: T_cam_world}); tags and frames
+    never reached are left out.
+
+    Chaining drifts, so refine(tag_poses, cam_poses), if given, is called to
+    adjust the poses so far (in place) whenever the posed tags have grown by
+    refine_growth since the last call.
+
+    A single small tag's pose is ambiguous (IPPE's two solutions flip under
+    noise), so frames are posed from two or more posed tags and tags from
+    two or more posed frames where possible, taking whichever IPPE solution
+    best explains all of them. After each refine every tag and frame makes
+    that choice again, as the adjustment cannot undo a flipped start.
+    """
+    obj = tag_object_points(tag_size)
+    K = np.asarray(camera_matrix, dtype=float)
+    candidates = [_ippe_candidates(obj, c, K) for c in corners]
+    # Larger in the image = closer = more trustworthy single-tag pose
+    area = _quad_area(corners)
+
+    tag_poses = dict(anchors)
+    cam_poses = {}
+    by_frame, by_tag = {}, {}
+    for m, (f, t) in enumerate(zip(frames, tags)):
+        by_frame.setdefault(int(f), []).append(m)
+        by_tag.setdefault(int(t), []).append(m)
+
+    def pose_frame(known, current=None):
+        """Best T_cam_world for a frame from its detections of posed tags."""
+        T_wt = np.array([tag_poses[int(tags[m])] for m in known])
+        seen = corners[known]
+        guesses = [c @ _inverse(tag_poses[int(tags[m])]) for m in known for c in candidates[m]]
+        if current is not None:
+            guesses.append(current)
+        errors = _reprojection(np.array(guesses)[:, None], T_wt[None], obj, seen[None], K).sum(axis=(1, 2))
+        T_cw = guesses[int(np.argmin(errors))]
+        if len(known) > 1:
+            # Refine on every posed tag's corners at once
+            world = np.concatenate([(T[:3, :3] @ obj.T).T + T[:3, 3] for T in T_wt])
+            rvec, _ = cv2.Rodrigues(T_cw[:3, :3])
+            ok, rvec, tvec = cv2.solvePnP(world, seen.reshape(-1, 2), K, None, rvec.copy(), T_cw[:3, 3].copy(),
+                                          useExtrinsicGuess=True, flags=cv2.SOLVEPNP_ITERATIVE)
+            if ok:
+                T_cw = _pose(cv2.Rodrigues(rvec)[0], tvec)
+        return T_cw
+
+    def pose_tag(views, current=None):
+        """(best T_world_tag, its score, score of current) over a tag's posed views."""
+        views = sorted(views, key=lambda m: -area[m])[:max_views]
+        T_cw = np.array([cam_poses[int(frames[m])] for m in views])
+        options = [_inverse(T_cw[i]) @ c for i, m in enumerate(views) for c in candidates[m]]
+        if current is not None:
+            options.append(current)
+        scores = _reprojection(T_cw[None], np.array(options)[:, None], obj, corners[views][None], K).sum(axis=(1, 2))
+        best = int(np.argmin(scores))
+        return options[best], scores[best], scores[-1]
+
+    min_known = 2
+    refined_at = len(tag_poses)
+    while True:
+        new_frames = 0
+        for f, members in by_frame.items():
+            if f in cam_poses:
+                continue
+            known = [m for m in members if int(tags[m]) in tag_poses]
+            if len(known) >= min_known:
+                cam_poses[f] = pose_frame(known)
+                new_frames += 1
+
+        new_tags = 0
+        for tag_id, members in by_tag.items():
+            if tag_id in tag_poses:
+                continue
+            views = [m for m in members if int(frames[m]) in cam_poses]
+            if len(views) >= min_known:
+                tag_poses[tag_id] = pose_tag(views)[0]
+                new_tags += 1
+
+        if refine is not None and len(tag_poses) >= max(refined_at * refine_growth, refined_at + 5):
+            refine(tag_poses, cam_poses)
+            refined_at = len(tag_poses)
+            # Re-choose against the refined poses; keep the current pose if it still explains best
+            for tag_id, T_wt in tag_poses.items():
+                if tag_id in anchors:
+                    continue
+                views = [m for m in by_tag[tag_id] if int(frames[m]) in cam_poses]
+                best, score, current = pose_tag(views, T_wt)
+                if score < current:
+                    tag_poses[tag_id] = best
+            for f, T_cw in cam_poses.items():
+                known = [m for m in by_frame[f] if int(tags[m]) in tag_poses]
+                cam_poses[f] = pose_frame(known, T_cw)
+        if new_frames or new_tags:
+            min_known = 2
+        elif min_known == 2:
+            min_known = 1  # stuck: allow a single posed tag per frame / posed frame per tag
+        else:
+            return tag_poses, cam_poses
+
+
+# --- BUNDLE ADJUSTMENT ---
+class BundleAdjuster:
+    """
+    Camera poses T_cam_world (per frame) and tag poses T_world_tag (per
+    tag) refined on the corner reprojection error. Anchor tags stay fixed.
+    Updates are left-multiplied: R <- exp(dw) R, t <- t + dt.
+    """
+
+    def __init__(self, frames, tags, corners, tag_poses, cam_poses, anchors, camera_matrix,
+                 tag_size=TAG_SIZE, huber_px=HUBER_PX):
+        # Only observations whose frame and tag were both initialised
+        keep = np.array([int(f) in cam_poses and int(t) in tag_poses for f, t in zip(frames, tags)], dtype=bool)
+        self.frame_ids = np.array(sorted({int(f) for f in frames[keep]}))
+        self.tag_ids = np.array(sorted({int(t) for t in tags[keep]}))
+        self.frame = np.searchsorted(self.frame_ids, frames[keep])
+        self.tag = np.searchsorted(self.tag_ids, tags[keep])
+        self.observed = corners[keep]
+        self.K = np.asarray(camera_matrix, dtype=float)
+        self.obj = tag_object_points(tag_size)
+        self.huber_px = huber_px
+
+        self.R_cw = np.array([cam_poses[f][:3, :3] for f in self.frame_ids])
+        self.t_cw = np.array([cam_poses[f][:3, 3] for f in self.frame_ids])
+        self.R_wt = np.array([tag_poses[t][:3, :3] for t in self.tag_ids])
+        self.t_wt = np.array([tag_poses[t][:3, 3] for t in self.tag_ids])
+
+        # Free tags get consecutive indices in the reduced system; anchors get -1
+        anchored = np.isin(self.tag_ids, list(anchors))
+        self.free_index = np.full(len(self.tag_ids), -1)
+        self.free_index[~anchored] = np.arange(int((~anchored).sum()))
+        self.n_free = int((~anchored).sum())
+
+        # Every ordered pair of observations of free tags in the same frame:
+        # the blocks the Schur complement adds to the reduced system
+        order = np.argsort(self.frame, kind="stable")
+        order = order[self.free_index[self.tag[order]] >= 0]
+        _, start, count = np.unique(self.frame[order], return_index=True, return_counts=True)
+        reps = np.repeat(count, count)
+        firsts = np.repeat(start, count)
+        self.pair_a = np.repeat(order, reps)
+        group_start = np.repeat(firsts, reps)
+        within = np.arange(len(self.pair_a)) - np.repeat(np.cumsum(reps) - reps, reps)
+        self.pair_b = order[group_start + within]
+
+    @property
+    def n_observations(self):
+        return len(self.frame)
+
+    def residuals(self, R_cw=None, t_cw=None, R_wt=None, t_wt=None):
+        """Projected minus observed corners (M, 4, 2) and the camera-frame points (M, 4, 3)."""
+        R_cw = self.R_cw if R_cw is None else R_cw
+        t_cw = self.t_cw if t_cw is None else t_cw
+        R_wt = self.R_wt if R_wt is None else R_wt
+        t_wt = self.t_wt if t_wt is None else t_wt
+        q = np.einsum("mij,kj->mki", R_wt[self.tag], self.obj)           # R_wt X
+        p_world = q + t_wt[self.tag][:, None, :]
+        p_cam = np.einsum("mij,mkj->mki", R_cw[self.frame], p_world) + t_cw[self.frame][:, None, :]
+        z = p_cam[..., 2:3]
+        uv = p_cam[..., :2] / z * self.K[[0, 1], [0, 1]] + self.K[:2, 2]
+        return uv - self.observed, p_cam, q
+
+    def _weights(self, r):
+        """Huber IRLS weights per corner, and the robust cost."""
+        e = np.linalg.norm(r, axis=-1)
+        w = np.where(e <= self.huber_px, 1.0, self.huber_px / np.maximum(e, 1e-12))
+        cost = np.where(e <= self.huber_px, 0.5 * e ** 2, self.huber_px * (e - 0.5 * self.huber_px))
+        return w, float(cost.sum())
+
+    def cost(self, *state):
+        return self._weights(self.residuals(*state)[0])[1]
+
+    def _linearise(self):
+        r, p_cam, q = self.residuals()
+        w, cost = self._weights(r)
+        x, y, z = p_cam[..., 0], p_cam[..., 1], p_cam[..., 2]
+        f = self.K[[0, 1], [0, 1]]
+        # d(uv)/d(p_cam), (M, 4, 2, 3)
+        P = np.zeros(p_cam.shape[:2] + (2, 3))
+        P[..., 0, 0] = f[0] / z
+        P[..., 0, 2] = -f[0] * x / z ** 2
+        P[..., 1, 1] = f[1] / z
+        P[..., 1, 2] = -f[1] * y / z ** 2
+
+        R_cw = self.R_cw[self.frame][:, None]
+        rotated = p_cam - self.t_cw[self.frame][:, None, :]                  # R_cw p_world
+        J_cam = np.concatenate((P @ -_skew(rotated), P), axis=-1)            # (M, 4, 2, 6)
+        P_R = P @ R_cw
+        J_tag = np.concatenate((P_R @ -_skew(q), P_R), axis=-1)
+
+        sw = np.sqrt(w)[..., None, None]
+        J_cam, J_tag, r_w = (J_cam * sw).reshape(-1, 8, 6), (J_tag * sw).reshape(-1, 8, 6), \
+            (r * np.sqrt(w)[..., None]).reshape(-1, 8)
+        A_cc = np.einsum("mki,mkj->mij", J_cam, J_cam)
+        A_ct = np.einsum("mki,mkj->mij", J_cam, J_tag)
+        A_tt = np.einsum("mki,mkj->mij", J_tag, J_tag)
+        g_c = np.einsum("mki,mk->mi", J_cam, r_w)
+        g_t = np.einsum("mki,mk->mi", J_tag, r_w)
+
+        def block_sum(index, blocks, n):
+            size = int(np.prod(blocks.shape[1:]))
+            flat = (index[:, None] * size + np.arange(size)).ravel()
+            return np.bincount(flat, weights=blocks.reshape(-1), minlength=n * size).reshape((n,) + blocks.shape[1:])
+
+        U = block_sum(self.frame, A_cc, len(self.frame_ids))
+        gc = block_sum(self.frame, g_c, len(self.frame_ids))
+        free = self.free_index[self.tag]
+        mask = free >= 0
+        V = block_sum(free[mask], A_tt[mask], self.n_free)
+        gt = block_sum(free[mask], g_t[mask], self.n_free)
+        return cost, U, V, A_ct, gc, gt, block_sum
+
+    def _solve(self, U, V, A_ct, gc, gt, block_sum, lam):
+        """Damped step (d_cam (F, 6), d_tag (T_free, 6)) by eliminating the frame blocks."""
+        eye = np.eye(6)
+        U_d = U + lam * U * eye + 1e-9 * eye
+        V_d = V + lam * V * eye + 1e-9 * eye
+        U_inv = np.linalg.inv(U_d)
+
+        free = self.free_index[self.tag]
+        n = self.n_free * 6
+        S = np.zeros((n, n))
+        S_blocks = S.reshape(self.n_free, 6, self.n_free, 6)
+        idx = np.arange(self.n_free)
+        S_blocks[idx, :, idx, :] = V_d
+
+        # S -= sum over frames of W^T U^-1 W, one 6x6 block per pair of tags seen together
+        a, b = self.pair_a, self.pair_b
+        Y = U_inv[self.frame[b]] @ A_ct[b]
+        C = np.einsum("pji,pjk->pik", A_ct[a], Y)
+        rows = free[a][:, None, None] * 6 + np.arange(6)[None, :, None]
+        cols = free[b][:, None, None] * 6 + np.arange(6)[None, None, :]
+        S -= np.bincount((rows * n + cols).ravel(), weights=C.reshape(-1), minlength=n * n).reshape(n, n)
+
+        # rhs = -gt + W^T U^-1 gc
+        mask = free >= 0
+        Ug = np.einsum("mij,mj->mi", U_inv[self.frame], gc[self.frame])
+        rhs = -gt + block_sum(free[mask], np.einsum("mji,mj->mi", A_ct[mask], Ug[mask]), self.n_free)
+        d_tag = np.linalg.solve(S, rhs.reshape(-1)).reshape(-1, 6) if n else np.zeros((0, 6))
+
+        # d_cam = U^-1 (-gc - W d_tag)
+        Wd = np.zeros((len(self.tag), 6))
+        Wd[mask] = np.einsum("mij,mj->mi", A_ct[mask], d_tag[free[mask]])
+        d_cam = np.einsum("fij,fj->fi", U_inv, -gc - block_sum(self.frame, Wd, len(self.frame_ids)))
+        return d_cam, d_tag
+
+    def _apply(self, d_cam, d_tag):
+        R_cw = _exp_so3(d_cam[:, :3]) @ self.R_cw
+        t_cw = self.t_cw + d_cam[:, 3:]
+        R_wt, t_wt = self.R_wt.copy(), self.t_wt.copy()
+        free = self.free_index >= 0
+        R_wt[free] = _exp_so3(d_tag[:, :3]) @ R_wt[free]
+        t_wt[free] += d_tag[:, 3:]
+        return R_cw, t_cw, R_wt, t_wt
+
+    def run(self, max_iterations=MAX_ITERATIONS, tolerance=1e-6, verbose=True):
+        """Levenberg-Marquardt; returns the final RMS reprojection error in px."""
+        lam = 1e-3
+        for iteration in range(max_iterations):
+            cost, U, V, A_ct, gc, gt, block_sum = self._linearise()
+            while True:
+                d_cam, d_tag = self._solve(U, V, A_ct, gc, gt, block_sum, lam)
+                state = self._apply(d_cam, d_tag)
+                new_cost = self.cost(*state)
+                if new_cost < cost:
+                    self.R_cw, self.t_cw, self.R_wt, self.t_wt = state
+                    lam = max(lam / 3.0, 1e-9)
+                    break
+                lam *= 4.0
+                if lam > 1e8:
+                    break
+            if verbose:
+                print(f"  iteration {iteration + 1}: cost {cost:.1f} -> {min(new_cost, cost):.1f}, lambda {lam:.1e}")
+            if lam > 1e8 or (cost - new_cost) < tolerance * cost:
+                break
+        r = self.residuals()[0]
+        return float(np.sqrt(np.mean(np.sum(r ** 2, axis=-1))))
+
+    def tag_poses(self):
+        return {int(t): _pose(R, p) for t, R, p in zip(self.tag_ids, self.R_wt, self.t_wt)}
+
+    def camera_from_world(self):
+        """{frame: T_cam_world}, as initialise() keeps them."""
+        return {int(f): _pose(R, t) for f, R, t in zip(self.frame_ids, self.R_cw, self.t_cw)}
+
+    def camera_poses(self):
+        """{frame: T_world_cam}"""
+        return {int(f): _inverse(_pose(R, t)) for f, R, t in zip(self.frame_ids, self.R_cw, self.t_cw)}
+
+
+# --- OUTPUT ---
+def write_map(path, tag_poses):
+    tags = [{"id": tag_id,
+             "position": [round(float(v), 4) for v in T[:3, 3]],
+             "rotation": [[round(float(v), 5) for v in row] for row in T[:3, :3]]}
+            for tag_id, T in sorted(tag_poses.items())]
+    with open(path, "w") as f:
+        json.dump({"tags": tags}, f, indent=2)
+
+
+def write_trajectory(path, camera_poses, fps=30.0):
+    with TrajectoryRecorder(path) as recorder:
+        for frame, T in sorted(camera_poses.items()):
+            recorder.append(frame / fps, T[:3, 3], T[:3, :3], frame=frame)
+
+
+def load_anchors(map_path, ids=ANCHOR_IDS):
+    """{tag_id: T_world_tag} from an existing map, all tags or just ids."""
+    tag_ids, positions, rotations = read_json_map(map_path)
+    return {int(i): _pose(R, p) for i, p, R in zip(tag_ids, positions, rotations) if ids is None or i in ids}
+
+
+def build(frames, tags, corners, camera_matrix, anchors=None, tag_size=TAG_SIZE):
+    """Initialise and bundle adjust. Returns (BundleAdjuster, RMS px)."""
+    if anchors:
+        anchors = {i: T for i, T in anchors.items() if i in set(tags.tolist())}
+    if not anchors:
+        # No reference: put the most-seen tag at the origin, facing -z
+        ids, counts = np.unique(tags, return_counts=True)
+        anchors = {int(ids[np.argmax(counts)]): np.eye(4)}
+        print(f"[WARN] No anchor tag seen; tag {next(iter(anchors))} defines the world frame")
+
+    def refine(tag_poses, cam_poses):
+        partial = BundleAdjuster(frames, tags, corners, tag_poses, cam_poses, anchors, camera_matrix, tag_size)
+        partial.run(max_iterations=REFINE_ITERATIONS, verbose=False)
+        tag_poses.update(partial.tag_poses())
+        cam_poses.update(partial.camera_from_world())
+
+    t0 = time.perf_counter()
+    tag_poses, cam_poses = initialise(frames, tags, corners, anchors, camera_matrix, tag_size, refine=refine)
+    print(f"Initialised {len(tag_poses)} tags and {len(cam_poses)} frames "
+          f"from {len(anchors)} anchor(s) in {time.perf_counter() - t0:.1f} s")
+    unreached = sorted(set(tags.tolist()) - set(tag_poses))
+    if unreached:
+        print(f"[WARN] Tags {unreached} are not connected to the anchors and are left out")
+
+    adjuster = BundleAdjuster(frames, tags, corners, tag_poses, cam_poses, anchors, camera_matrix, tag_size)
+    t0 = time.perf_counter()
+    rms = adjuster.run()
+    print(f"Bundle adjustment: {len(adjuster.tag_ids)} tags, {len(adjuster.frame_ids)} frames, "
+          f"{adjuster.n_observations} detections, RMS {rms:.2f} px in {time.perf_counter() - t0:.1f} s")
+    return adjuster, rms
+
+
+def main(source, out_path, anchor_map=None):
+    from pupil_apriltags import Detector
+
+    if os.path.exists(CALIBRATION_PATH):
+        calib = np.load(CALIBRATION_PATH)
+        camera_matrix, dist = calib["camera_matrix"], calib["dist_coeffs"]
+    else:
+        camera_matrix = np.array([[fx, 0, cx], [0, fy, cy], [0, 0, 1]])
+        dist = dist_coeffs
+    detector = Detector(families="tag36h11", nthreads=4, quad_decimate=1.0, refine_edges=True)
+
+    t0 = time.perf_counter()
+    frames, tags, corners = collect_observations(iter_frames(source), detector, camera_matrix, dist)
+    print(f"{len(frames)} detections of {len(set(tags.tolist()))} tags in "
+          f"{len(set(frames.tolist()))} frames ({time.perf_counter() - t0:.1f} s)")
+    if len(frames) == 0:
+        print("[FATAL] No tags detected")
+        return
+
+    anchors = load_anchors(anchor_map) if anchor_map else None
+    adjuster, _ = build(frames, tags, corners, camera_matrix, anchors)
+    write_map(out_path, adjuster.tag_poses())
+    traj_path = os.path.splitext(out_path)[0] + ".traj"
+    write_trajectory(traj_path, adjuster.camera_poses())
+    print(f"Map -> {out_path}, camera path -> {traj_path}")
+
+
+# --- BENCHMARK ---
+def simulate_survey(n_tags, n_frames, noise_px, seed=0):
+    """
+    A planar grid of tags (like maps/*.json) surveyed by a camera sweeping
+    back and forth over it. Returns (frames, tags, corners, K, tag_size,
+    {tag_id: true T_world_tag}, {frame: true T_cam_world}, anchor ids).
+    """
+    rng = np.random.default_rng(seed)
+    K = np.array([[1400.0, 0, 640], [0, 1400.0, 360], [0, 0, 1]])
+    size = (1280, 720)
+    tag_size = 0.1
+    cols = int(np.ceil(np.sqrt(n_tags * 4 / 3)))
+    spacing = 0.3
+
+    # Tags on the z = 0 plane facing -z, placed and tilted by hand (a few cm, a few degrees)
+    truth = {}
+    for i in range(n_tags):
+        position = [spacing * (i % cols), spacing * (i // cols), 0.0] + rng.normal(0, [0.03, 0.03, 0.01])
+        truth[i] = _pose(_exp_so3(rng.normal(0, 0.05, (1, 3)))[0], position)
+    rows = (n_tags - 1) // cols + 1
+    width, depth = spacing * (cols - 1), spacing * (rows - 1)
+
+    # Lawnmower sweeps 1.2 m off the plane, 0.5 m apart, with the view wandering
+    lanes = int(np.ceil(depth / 0.5)) + 1
+    s = np.linspace(0, lanes, n_frames, endpoint=False)
+    lane = np.floor(s).astype(int)
+    along = s - lane
+    cam_x = np.where(lane % 2 == 0, along, 1 - along) * width
+    cam_y = np.minimum(lane * 0.5, depth)
+    frames, tags, corners, cameras = [], [], [], {}
+    obj = tag_object_points(tag_size)
+    for f in range(n_frames):
+        tilt = _exp_so3(np.array([[0.3 * np.sin(f * 0.05), 0.3 * np.cos(f * 0.037), f * 0.002]]))[0]
+        T_cw = cameras[f] = _inverse(_pose(tilt, [cam_x[f], cam_y[f], -1.2 + 0.2 * np.sin(f * 0.01)]))
+        for i, T_wt in truth.items():
+            T = T_cw @ T_wt
+            p = (T[:3, :3] @ obj.T).T + T[:3, 3]
+            if (p[:, 2] < 0.2).any() or T[:3, 2] @ T[:3, 3] < 0.3 * np.linalg.norm(T[:3, 3]):
+                continue  # behind the camera or seen too edge-on
+            uv = (p[:, :2] / p[:, 2:]) * K[[0, 1], [0, 1]] + K[:2, 2]
+            if (uv < 0).any() or (uv[:, 0] >= size[0]).any() or (uv[:, 1] >= size[1]).any():
+                continue
+            if _quad_area(uv) < MIN_TAG_PX ** 2:
+                continue  # too small to decode
+            frames.append(f)
+            tags.append(i)
+            corners.append(uv + rng.normal(0, noise_px, uv.shape))
+    frames, tags, corners = np.array(frames), np.array(tags), np.array(corners)
+    return frames, tags, corners, K, tag_size, truth, cameras, (0, cols - 1, (rows - 1) * cols)
+
+
+def benchmark(n_tags=300, n_frames=3000, noise_px=0.5):
+    frames, tags, corners, K, tag_size, truth, _, anchor_ids = simulate_survey(n_tags, n_frames, noise_px)
+    print(f"{n_tags} tags, {n_frames} frames, {len(frames)} detections "
+          f"({len(frames) / n_frames:.1f} per frame), {noise_px} px corner noise")
+
+    anchors = {i: truth[i] for i in anchor_ids}
+    t0 = time.perf_counter()
+    adjuster, rms = build(frames, tags, corners, K, anchors, tag_size)
+    t_total = time.perf_counter() - t0
+
+    estimated = adjuster.tag_poses()
+    init, _ = initialise(frames, tags, corners, anchors, K, tag_size)
+
+    def errors(poses):
+        ids = [i for i in poses if i not in anchors]
+        dp = np.array([np.linalg.norm(poses[i][:3, 3] - truth[i][:3, 3]) for i in ids])
+        dR = np.array([np.degrees(np.arccos(np.clip((np.trace(poses[i][:3, :3].T @ truth[i][:3, :3]) - 1) / 2,
+                                                    -1, 1))) for i in ids])
+        return dp, dR
+
+    dp0, dR0 = errors(init)
+    dp, dR = errors(estimated)
+    print(f"  chained PnP only:   position error median {np.median(dp0) * 1000:.1f} mm, "
+          f"max {dp0.max() * 1000:.1f} mm, rotation median {np.median(dR0):.2f} deg")
+    print(f"  incremental + BA:   position error median {np.median(dp) * 1000:.1f} mm, "
+          f"max {dp.max() * 1000:.1f} mm, rotation median {np.median(dR):.2f} deg "
+          f"(RMS {rms:.2f} px, {t_total:.1f} s total)")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["--benchmark"]:
+        benchmark()
+    elif len(sys.argv) >= 3:
+        main(*sys.argv[1:4])
+    else:
+        print(__doc__)
@@ -1,46 +1,209 @@
+"""
+Checkerboard calibration from a folder of photos.
+
+1. HEIC photos in calibration_images_heic are converted to JPEG
+   (prepare_calibration_images.py, skipped when up to date or when
+   pillow_heif is missing).
+2. Corners are found in a process pool. findChessboardCorners runs on a
+   copy scaled to DETECT_WIDTH and cornerSubPix refines on the full image.
+   Results (found or not) are cached in corner_cache/ under a hash of the
+   file contents and the board settings, so a re-run only looks at new or
+   changed images.
+3. calibrateCamera, then the RMS reprojection error of every image. Images
+   above OUTLIER_FACTOR x the median error are dropped and the camera is
+   calibrated again.
+4. camera_matrix / dist_coeffs (plus image_size, rms and the images used)
+   are saved in the .npz format Undistorter.from_file reads.
+
+Run: python calibrate_camera.py [image_dir] [output.npz]
+"""
+
+import os
+import sys
+import glob
+import time
+import hashlib
+import multiprocessing as mp
 import cv2
 import numpy as np
-import glob
+
+try:
+    from prepare_calibration_images import convert_all
+except ImportError:
+    convert_all = None
 
 # --- Parameters ---
 CHECKERBOARD = (10, 7)  # number of inner corners per row/column
 SQUARE_SIZE = 0.025  # 25 mm per square
 
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+IMAGE_DIR = os.path.join(BASE_DIR, "calibration_images")
+HEIC_DIR = os.path.join(BASE_DIR, "calibration_images_heic")
+CACHE_DIR = os.path.join(BASE_DIR, "corner_cache")
+# The navigation code reads ../../camera_calibration.npz (robot camera);
+# these phone photos get their own file unless an output path is given
+OUTPUT_PATH = os.path.join(BASE_DIR, "camera_calibration.npz")
+
+DETECT_WIDTH = 1000      # px, width findChessboardCorners runs at
+OUTLIER_FACTOR = 2.0     # drop images whose error is above this x the median
+NUM_WORKERS = os.cpu_count() or 1
+
+criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 30, 0.001)
+
 # --- Prepare object points (3D) ---
 objp = np.zeros((CHECKERBOARD[0] * CHECKERBOARD[1], 3), np.float32)
 objp[:, :2] = np.mgrid[0:CHECKERBOARD[0], 0:CHECKERBOARD[1]].T.reshape(-1, 2)
 objp *= SQUARE_SIZE
 
-# --- Arrays to store points ---
-objpoints = []
-imgpoints = []
 
-images = glob.glob('calibration_images/*.jpg')
+# --- CORNER CACHE ---
+def cache_key(path):
+    """Hash of the file contents and everything that changes the corners."""
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    h.update(repr((CHECKERBOARD, DETECT_WIDTH, criteria)).encode())
+    return h.hexdigest()[:20]
+
+
+def load_cached(key):
+    """(found, corners, image_size) from the cache, or None."""
+    path = os.path.join(CACHE_DIR, f"{key}.npz")
+    if not os.path.exists(path):
+        return None
+    try:
+        cached = np.load(path)
+        return bool(cached["found"]), cached["corners"], tuple(int(v) for v in cached["image_size"])
+    except Exception as e:
+        print(f"[WARN] Ignoring unreadable corner cache {path}: {e}")
+        return None
+
+
+def save_cached(key, found, corners, image_size):
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        np.savez(os.path.join(CACHE_DIR, f"{key}.npz"), found=found, corners=corners, image_size=image_size)
+    except OSError as e:
+        print(f"[WARN] Could not write corner cache: {e}")
+
+
+# --- WORKER PROCESSES ---
+def find_corners(path):
+    """(found, corners (N, 1, 2) float32, (width, height)) for one image."""
+    gray = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+    if gray is None:
+        return False, np.empty((0, 1, 2), np.float32), (0, 0)
+    h, w = gray.shape
+    image_size = (w, h)
+
+    # Coarse search on a small copy, sub-pixel refinement at full resolution
+    scale = min(1.0, DETECT_WIDTH / w)
+    small = gray if scale == 1.0 else cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    flags = cv2.CALIB_CB_ADAPTIVE_THRESH + cv2.CALIB_CB_NORMALIZE_IMAGE
+    found, corners = cv2.findChessboardCorners(small, CHECKERBOARD, flags)
+    if not found:
+        return False, np.empty((0, 1, 2), np.float32), image_size
+
+    corners = (corners / scale).astype(np.float32)
+    win = max(5, int(round(5 / scale)))
+    corners = cv2.cornerSubPix(gray, corners, (win, win), (-1, -1), criteria)
+    return True, corners.reshape(-1, 1, 2), image_size
+
+
+def _corner_job(job):
+    path, key = job
+    return path, key, find_corners(path)
+
+
+def detect_all(paths, num_workers=NUM_WORKERS):
+    """{path: (found, corners, image_size)}, from the cache where possible."""
+    results, jobs = {}, []
+    for path in paths:
+        key = cache_key(path)
+        cached = load_cached(key)
+        if cached is None:
+            jobs.append((path, key))
+        else:
+            results[path] = cached
+    print(f"{len(paths)} images: {len(paths) - len(jobs)} cached, {len(jobs)} to process")
+
+    if jobs:
+        with mp.Pool(min(num_workers, len(jobs))) as pool:
+            for path, key, result in pool.imap_unordered(_corner_job, jobs):
+                save_cached(key, *result)
+                results[path] = result
+                print(f"  {os.path.basename(path)}: {'found' if result[0] else 'NOT found'}")
+    return results
+
+
+# --- CALIBRATION ---
+def calibrate(imgpoints, image_size):
+    """(rms, camera_matrix, dist_coeffs, per-image RMS errors (N,))"""
+    objpoints = [objp] * len(imgpoints)
+    rms, mtx, dist, rvecs, tvecs = cv2.calibrateCamera(objpoints, imgpoints, image_size, None, None)
+    errors = np.empty(len(imgpoints))
+    for i, (corners, rvec, tvec) in enumerate(zip(imgpoints, rvecs, tvecs)):
+        projected, _ = cv2.projectPoints(objp, rvec, tvec, mtx, dist)
+        errors[i] = np.sqrt(np.mean(np.sum((projected.reshape(-1, 2) - corners.reshape(-1, 2)) ** 2, axis=1)))
+    return rms, mtx, dist, errors
+
+
+def run(image_dir=IMAGE_DIR, output_path=OUTPUT_PATH):
+    if image_dir == IMAGE_DIR and os.path.isdir(HEIC_DIR):
+        if convert_all is None:
+            print("[WARN] pillow_heif not installed, using the existing JPEGs only")
+        else:
+            convert_all(HEIC_DIR, IMAGE_DIR)
+
+    paths = sorted(glob.glob(os.path.join(image_dir, "*.jpg")) + glob.glob(os.path.join(image_dir, "*.png")))
+    if not paths:
+        print(f"[FATAL] No images in {image_dir}")
+        return None
+
+    t0 = time.perf_counter()
+    results = detect_all(paths)
+    t_detect = time.perf_counter() - t0
+
+    used = [p for p in paths if results[p][0]]
+    sizes = {results[p][2] for p in used}
+    if len(sizes) > 1:
+        print(f"[FATAL] Images of different sizes {sorted(sizes)}; calibrate each camera separately")
+        return None
+    if len(used) < 3:
+        print(f"[FATAL] Checkerboard found in only {len(used)} images")
+        return None
+    image_size = sizes.pop()
 
-for fname in images:
-    img = cv2.imread(fname)
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    rms, mtx, dist, errors = calibrate([results[p][1] for p in used], image_size)
+    limit = OUTLIER_FACTOR * np.median(errors)
+    print(f"\nCorners in {len(used)}/{len(paths)} images ({t_detect:.1f} s), RMS {rms:.3f} px")
+    print(f"{'image':<24} {'error px':>9}")
+    for p, e in zip(used, errors):
+        print(f"{os.path.basename(p):<24} {e:>9.3f}{'  <- dropped' if e > limit else ''}")
 
-    ret, corners = cv2.findChessboardCorners(gray, CHECKERBOARD, None)
+    keep = errors <= limit
+    if not keep.all() and keep.sum() >= 3:
+        used = [p for p, k in zip(used, keep) if k]
+        rms, mtx, dist, errors = calibrate([results[p][1] for p in used], image_size)
+        print(f"Recalibrated without {int((~keep).sum())} outlier images: RMS {rms:.3f} px")
 
-    if ret:
-        objpoints.append(objp)
-        corners2 = cv2.cornerSubPix(
-            gray, corners, (11, 11), (-1, -1),
-            criteria=(cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 30, 0.001)
-        )
-        imgpoints.append(corners2)
-        cv2.drawChessboardCorners(img, CHECKERBOARD, corners2, ret)
-        cv2.imshow('Corners', img)
-        cv2.waitKey(200)
+    print("\nCalibration successful!")
+    print("Camera Matrix (K):\n", mtx)
+    print("\nDistortion Coefficients:\n", dist.ravel())
 
-cv2.destroyAllWindows()
+    np.savez(
+        output_path,
+        camera_matrix=mtx,
+        dist_coeffs=dist,
+        image_size=np.array(image_size),
+        rms=rms,
+        images=np.array([os.path.basename(p) for p in used]),
+        image_errors=errors,
+    )
+    print(f"\nSaved calibration to {output_path}")
+    return mtx, dist
 
-# --- Calibrate ---
-ret, mtx, dist, rvecs, tvecs = cv2.calibrateCamera(
-    objpoints, imgpoints, gray.shape[::-1], None, None
-)
 
-print("\nCalibration successful!")
-print("Camera Matrix (K):\n", mtx)
-print("\nDistortion Coefficients:\n", dist.ravel())
+if __name__ == "__main__":
+    run(*sys.argv[1:3])
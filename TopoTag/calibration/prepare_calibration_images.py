@@ -1,35 +1,66 @@
 import os
+import multiprocessing as mp
 from PIL import Image
 import pillow_heif
 
 # --- CONFIGURATION ---
-input_folder = "calibration_images_heic"
-output_folder = "calibration_images"
-
-# Ensure output directory exists
-os.makedirs(output_folder, exist_ok=True)
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+input_folder = os.path.join(BASE_DIR, "calibration_images_heic")
+output_folder = os.path.join(BASE_DIR, "calibration_images")
+NUM_WORKERS = os.cpu_count() or 1
 
 # Supported HEIC extensions
 heic_exts = (".heic", ".HEIC")
 
+
+def convert_one(heif_path, jpg_path):
+    """Convert one HEIC file to JPEG. Returns an error message or None."""
+    try:
+        heif_file = pillow_heif.read_heif(heif_path)
+        image = Image.frombytes(
+            heif_file.mode, heif_file.size, heif_file.data, "raw"
+        )
+        image = image.convert("RGB")  # ensure color
+        image.save(jpg_path, "JPEG", quality=95)
+        return None
+    except Exception as e:
+        return str(e)
+
+
+def _convert_job(paths):
+    return paths, convert_one(*paths)
+
+
 # --- CONVERT ALL HEIC FILES TO JPG ---
-count = 0
-for filename in os.listdir(input_folder):
-    if filename.endswith(heic_exts):
-        heif_path = os.path.join(input_folder, filename)
-        base_name = os.path.splitext(filename)[0]
-        jpg_path = os.path.join(output_folder, f"{base_name}.jpg")
-
-        try:
-            heif_file = pillow_heif.read_heif(heif_path)
-            image = Image.frombytes(
-                heif_file.mode, heif_file.size, heif_file.data, "raw"
-            )
-            image = image.convert("RGB")  # ensure color
-            image.save(jpg_path, "JPEG", quality=95)
-            count += 1
-            print(f"Converted: {filename} → {jpg_path}")
-        except Exception as e:
-            print(f"Failed to convert {filename}: {e}")
-
-print(f"\nConversion complete — {count} images saved to '{output_folder}'")
+def convert_all(input_folder=input_folder, output_folder=output_folder, num_workers=NUM_WORKERS):
+    """
+    Convert every HEIC in input_folder whose JPEG is missing or older, in a
+    process pool. Returns the number of files converted.
+    """
+    os.makedirs(output_folder, exist_ok=True)
+    jobs = []
+    for filename in sorted(os.listdir(input_folder)):
+        if filename.endswith(heic_exts):
+            heif_path = os.path.join(input_folder, filename)
+            base_name = os.path.splitext(filename)[0]
+            jpg_path = os.path.join(output_folder, f"{base_name}.jpg")
+            if os.path.exists(jpg_path) and os.path.getmtime(jpg_path) >= os.path.getmtime(heif_path):
+                continue
+            jobs.append((heif_path, jpg_path))
+
+    count = 0
+    if not jobs:
+        return count
+    with mp.Pool(min(num_workers, len(jobs))) as pool:
+        for (heif_path, jpg_path), error in pool.imap_unordered(_convert_job, jobs):
+            if error is None:
+                count += 1
+                print(f"Converted: {os.path.basename(heif_path)} → {jpg_path}")
+            else:
+                print(f"Failed to convert {os.path.basename(heif_path)}: {error}")
+    return count
+
+
+if __name__ == "__main__":
+    count = convert_all()
+    print(f"\nConversion complete — {count} images saved to '{output_folder}'")
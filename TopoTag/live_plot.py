@@ -0,0 +1,276 @@
+"""
+Live 3D camera-path plot whose per-frame cost does not grow with the run.
+
+- TrajectoryBuffer: preallocated (N, 3) array that doubles when full, up to
+  max_points. Past that, the older part is thinned to every other point, so
+  the newest keep_recent points stay at full rate while an hour of history
+  costs a bounded number of points. Bounds are kept as running min/max.
+- PathArtists: the Line3D / scatter artists, created once and updated in
+  place (set_data / set_3d_properties / _offsets3d), never ax.cla().
+- LivePathPlot: the figure lives in a child process (this file with
+  --serve), redrawn at refresh_hz. The capture loop only writes 24 bytes
+  per frame to a non-blocking pipe, so neither drawing nor the GUI event
+  loop ever stalls it. A plain subprocess rather than multiprocessing,
+  because a spawned child would re-run main.py's top-level loop.
+
+Run: python live_plot.py   (benchmark against the ax.cla() redraw)
+"""
+
+import os
+import sys
+import time
+import queue
+import struct
+import threading
+import subprocess
+import numpy as np
+
+RECORD = struct.Struct("<3d")  # one camera position on the pipe
+
+
+class TrajectoryBuffer:
+    def __init__(self, max_points=4000, keep_recent=1000, capacity=256):
+        self.max_points = max_points
+        self.keep_recent = min(keep_recent, max_points // 2)
+        self.data = np.empty((min(capacity, max_points), 3))
+        self.n = 0
+        self.lo = np.full(3, np.inf)
+        self.hi = np.full(3, -np.inf)
+
+    def __len__(self):
+        return self.n
+
+    @property
+    def points(self):
+        """View of the stored points, oldest first (valid until the next append)."""
+        return self.data[:self.n]
+
+    def append(self, point):
+        if self.n == len(self.data):
+            if self.n >= self.max_points:
+                self._decimate()
+            else:
+                grown = np.empty((min(2 * len(self.data), self.max_points), 3))
+                grown[:self.n] = self.data[:self.n]
+                self.data = grown
+        self.data[self.n] = point
+        self.n += 1
+        np.minimum(self.lo, point, out=self.lo)
+        np.maximum(self.hi, point, out=self.hi)
+
+    def _decimate(self):
+        old = self.n - self.keep_recent
+        kept = self.data[:old:2].copy()
+        k = len(kept)
+        self.data[:k] = kept
+        self.data[k:k + self.keep_recent] = self.data[old:self.n].copy()
+        self.n = k + self.keep_recent
+
+
+class PathArtists:
+    def __init__(self, ax, tag_positions=None):
+        ax.set_title("Live Camera Path")
+        ax.set_xlabel("X (m)")
+        ax.set_ylabel("Y (m)")
+        ax.set_zlabel("Z (m)")
+        ax.grid(True)
+
+        # Tags never move, so they are scattered once
+        if tag_positions is not None and len(tag_positions) > 0:
+            ax.scatter(tag_positions[:, 0], tag_positions[:, 1], tag_positions[:, 2],
+                       color='gray', s=40, marker='^', label='AprilTags')
+        self.line, = ax.plot([], [], [], marker='o', markersize=3, label='Path')
+        self.current = ax.scatter([], [], [], s=50, label='Current')
+        ax.legend()
+        self.ax = ax
+
+    def update(self, buffer):
+        path = buffer.points
+        if len(path) == 0:
+            return
+        self.line.set_data(path[:, 0], path[:, 1])
+        self.line.set_3d_properties(path[:, 2])
+        self.current._offsets3d = (path[-1:, 0], path[-1:, 1], path[-1:, 2])
+
+        # Keep roughly equal aspect
+        max_range = max((buffer.hi - buffer.lo).max() / 2.0, 0.05)
+        mid = (buffer.hi + buffer.lo) / 2.0
+        self.ax.set_xlim(mid[0] - max_range, mid[0] + max_range)
+        self.ax.set_ylim(mid[1] - max_range, mid[1] + max_range)
+        self.ax.set_zlim(mid[2] - max_range, mid[2] + max_range)
+
+
+# --- PLOT PROCESS ---
+def _plot_loop(points, tag_positions, max_points, refresh_hz):
+    import matplotlib.pyplot as plt
+    from mpl_toolkits.mplot3d import Axes3D  # noqa: F401
+
+    plt.ion()
+    fig = plt.figure(figsize=(8, 6))
+    artists = PathArtists(fig.add_subplot(111, projection='3d'), tag_positions)
+    buffer = TrajectoryBuffer(max_points)
+    period = 1.0 / refresh_hz
+
+    running = True
+    while running and plt.fignum_exists(fig.number):
+        deadline = time.monotonic() + period
+        received = 0
+        while True:
+            try:
+                item = points.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                running = False
+                break
+            buffer.append(item)
+            received += 1
+
+        if received:
+            artists.update(buffer)
+            fig.canvas.draw_idle()
+        # Also runs the GUI event loop
+        plt.pause(max(deadline - time.monotonic(), 0.001))
+
+    # Leave the final path on screen until the window is closed
+    if plt.fignum_exists(fig.number):
+        plt.ioff()
+        plt.show()
+
+
+def _read_exact(stream, size):
+    data = stream.read(size)
+    return data if data is not None and len(data) == size else None
+
+
+def _serve(max_points, refresh_hz):
+    """Child side: tag positions, then positions until EOF, from stdin."""
+    stdin = sys.stdin.buffer
+    (n_tags,) = struct.unpack("<I", _read_exact(stdin, 4))
+    tag_positions = np.frombuffer(_read_exact(stdin, RECORD.size * n_tags) or b"", dtype="<f8").reshape(-1, 3)
+
+    points = queue.Queue()
+
+    def reader():
+        while True:
+            data = _read_exact(stdin, RECORD.size)
+            if data is None:
+                points.put(None)
+                return
+            points.put(RECORD.unpack(data))
+
+    threading.Thread(target=reader, daemon=True).start()
+    _plot_loop(points, tag_positions, max_points, refresh_hz)
+
+
+class LivePathPlot:
+    def __init__(self, tag_positions=None, max_points=4000, refresh_hz=10.0):
+        self.tag_positions = np.zeros((0, 3)) if tag_positions is None else np.asarray(tag_positions, dtype=float)
+        self.max_points = max_points
+        self.refresh_hz = refresh_hz
+        self.process = None
+        self.dropped = 0
+
+    def start(self):
+        self.process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--serve", str(self.max_points), str(self.refresh_hz)],
+            stdin=subprocess.PIPE,
+        )
+        header = struct.pack("<I", len(self.tag_positions))
+        self.process.stdin.write(header + self.tag_positions.astype("<f8").tobytes())
+        self.process.stdin.flush()
+        # From here on a full pipe drops points instead of blocking the caller
+        os.set_blocking(self.process.stdin.fileno(), False)
+
+    def append(self, position):
+        """Send one camera position; never blocks (dropped if the plot falls behind)."""
+        if self.process is None:
+            return
+        try:
+            os.write(self.process.stdin.fileno(), RECORD.pack(*np.asarray(position, dtype=float).ravel()[:3]))
+        except BlockingIOError:
+            self.dropped += 1
+        except BrokenPipeError:
+            # Plot window was closed
+            self.process = None
+
+    def stop(self, wait=True):
+        """Stop updating; with wait=True, block until the plot window is closed."""
+        if self.process is None:
+            return
+        try:
+            self.process.stdin.close()
+        except BrokenPipeError:
+            pass
+        if wait:
+            self.process.wait()
+        self.process = None
+
+
+# --- BENCHMARK ---
+def _cla_redraw(ax, path, tag_positions):
+    """What main.py did on every accepted frame."""
+    path = np.array(path, dtype=float)
+    ax.cla()
+    ax.set_title("Live Camera Path")
+    ax.set_xlabel("X (m)")
+    ax.set_ylabel("Y (m)")
+    ax.set_zlabel("Z (m)")
+    ax.grid(True)
+    ax.scatter(tag_positions[:, 0], tag_positions[:, 1], tag_positions[:, 2], s=40, marker='^', label='AprilTags')
+    ax.plot(path[:, 0], path[:, 1], path[:, 2], marker='o', markersize=3, label='Path')
+    ax.scatter(path[-1, 0], path[-1, 1], path[-1, 2], s=50, label='Current')
+    ax.legend()
+    max_range = (path.max(axis=0) - path.min(axis=0)).max() / 2.0
+    mid = path.mean(axis=0)
+    ax.set_xlim(mid[0] - max_range, mid[0] + max_range)
+    ax.set_ylim(mid[1] - max_range, mid[1] + max_range)
+    ax.set_zlim(mid[2] - max_range, mid[2] + max_range)
+
+
+def benchmark(session_points=(300, 3000, 30000, 108000), repeats=5, fps=30.0):
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    from mpl_toolkits.mplot3d import Axes3D  # noqa: F401
+
+    rng = np.random.default_rng(0)
+    tag_positions = rng.uniform(-2, 2, (20, 3))
+    n_max = max(session_points)
+    t = np.arange(n_max) / fps
+    path = np.column_stack((np.cos(0.05 * t), np.sin(0.05 * t), 0.01 * rng.normal(size=n_max).cumsum()))
+
+    print(f"{'session':>10} {'points':>8} {'cla ms/frame':>13} {'in-place ms/frame':>18} {'append us':>10}")
+    for n in session_points:
+        fig_old = plt.figure()
+        ax_old = fig_old.add_subplot(111, projection='3d')
+        old_list = [p for p in path[:n]]
+        t0 = time.perf_counter()
+        for _ in range(repeats):
+            _cla_redraw(ax_old, old_list, tag_positions)
+            fig_old.canvas.draw()
+        t_old = (time.perf_counter() - t0) * 1000.0 / repeats
+        plt.close(fig_old)
+
+        fig_new = plt.figure()
+        artists = PathArtists(fig_new.add_subplot(111, projection='3d'), tag_positions)
+        buffer = TrajectoryBuffer()
+        t0 = time.perf_counter()
+        for p in path[:n]:
+            buffer.append(p)
+        t_append = (time.perf_counter() - t0) * 1e6 / n
+        t0 = time.perf_counter()
+        for _ in range(repeats):
+            artists.update(buffer)
+            fig_new.canvas.draw()
+        t_new = (time.perf_counter() - t0) * 1000.0 / repeats
+        plt.close(fig_new)
+
+        print(f"{n / fps / 60:>8.1f} m {len(buffer):>8} {t_old:>13.1f} {t_new:>18.1f} {t_append:>10.2f}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--serve":
+        _serve(int(sys.argv[2]), float(sys.argv[3]))
+    else:
+        benchmark()
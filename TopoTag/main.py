@@ -1,30 +1,39 @@
 import os
+import sys
 import time
 import cv2
-import json
 import numpy as np
-import matplotlib.pyplot as plt
-from mpl_toolkits.mplot3d import Axes3D  # noqa: F401
-from collections import deque
 from pupil_apriltags import Detector
 
 # --- CONFIGURATION ---
 TAG_SIZE = 0.05          # m
 LIVE_MODE = True        # True = live webcam, False = video file
 
-# Motion filtering / smoothing
-MAX_SPEED = 0.6         # m/s (physical max of your rig)
-STAB_FRAMES = 10        # frames needed to stabilise
-STAB_STD_THRESH = 0.02  # m, max std dev across xyz during stabilisation
-EMA_ALPHA = 0.2         # 0..1, higher = more smoothing
+# Motion filtering (constant-velocity EKF, Navigation/LookupTable/pose_ekf.py)
+ACCEL_NOISE = 1.0       # m/s^2, how hard the rig can accelerate
+CORNER_SIGMA_PX = 1.0   # px, corner noise behind the per-tag measurement covariance
+STAB_STD_THRESH = 0.02  # m, filter position std dev needed before tracking starts
+COAST_S = 0.5           # s, keep plotting the predicted pose this long without tags
+
+# One RANSAC + refined solvePnP over all visible tags instead of a pose per tag
+JOINT_PNP = True
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
+# Shared camera helpers live with the navigation code
+sys.path.append(os.path.join(BASE_DIR, "..", "Navigation", "LookupTable"))
+from undistorter import Undistorter  # noqa: E402
+from multi_tag_pnp import MultiTagLocalizer  # noqa: E402
+from pose_ekf import PoseEKF, tag_measurement_covariance, viewing_cosine  # noqa: E402
+from world_transform import camera_positions_in_world  # noqa: E402
+from live_plot import LivePathPlot  # noqa: E402
+from trajectory import TrajectoryRecorder, export_csv  # noqa: E402
+from tag_map import load_tag_map  # noqa: E402
+
 # --- LOAD MAP DEFINITION ---
 map_path = os.path.join(BASE_DIR, "maps", "125-lab.json")
-with open(map_path, "r") as f:
-    tag_map = json.load(f)["tags"]
-world_positions = {t["id"]: np.array(t["position"], dtype=float) for t in tag_map}
+map_array = load_tag_map(map_path)  # compiled + memory-mapped, see tag_map.py
+world_positions = map_array.world_positions
 
 # --- CAMERA INTRINSICS (from calibration) ---
 fx, fy = 3074.20762, 3067.80082
@@ -57,29 +66,19 @@ if not cap.isOpened():
     raise SystemExit
 
 # --- PLOTTING SETUP ---
-plt.ion()
-fig = plt.figure(figsize=(8, 6))
-ax = fig.add_subplot(111, projection='3d')
-ax.set_title("Live Camera Path")
-ax.set_xlabel("X (m)")
-ax.set_ylabel("Y (m)")
-ax.set_zlabel("Z (m)")
-ax.grid(True)
-
+# Drawn in its own process; see live_plot.py
 tag_positions = np.array(list(world_positions.values()), dtype=float)
-if len(tag_positions) > 0:
-    ax.scatter(tag_positions[:, 0], tag_positions[:, 1], tag_positions[:, 2],
-               color='gray', s=40, marker='^', label='AprilTags')
-    ax.legend()
+path_plot = LivePathPlot(tag_positions)
+path_plot.start()
+
+# Filtered poses, spilled to disk in chunks as the run goes (see trajectory.py)
+trajectory_path = os.path.join(BASE_DIR, "camera_path.traj")
+recorder = TrajectoryRecorder(trajectory_path)
+frame_index = -1
 
 # --- RUNTIME STATE ---
-camera_path = []                       # accepted (filtered + smoothed) positions
-stabilisation_buffer = deque(maxlen=STAB_FRAMES)
 tracking_started = False
-
-last_valid_pos = None                  # last accepted (pre-EMA) position
-last_valid_time = None                 # timestamp of last accepted position
-ema_pos = None                         # EMA'd position (what we plot)
+ekf = PoseEKF(accel_noise=ACCEL_NOISE)
 
 # For timing
 t0 = time.time()
@@ -89,127 +88,106 @@ mtx = np.array([[fx, 0, cx],
                 [0, fy, cy],
                 [0,  0,  1]], dtype=float)
 
+# Undistortion remap tables (alpha=1 optimal new camera matrix), built on the
+# first frame and cached on disk
+undistorter = Undistorter(mtx, dist_coeffs, alpha=1)
+
+# Corners are detected on the undistorted image, so no distortion here; the
+# camera matrix is the undistorter's new one, set per frame
+localizer = MultiTagLocalizer(world_positions, TAG_SIZE, mtx, world_rotations=map_array.world_rotations)
+
 # --- MAIN LOOP ---
 while True:
     ret, frame = cap.read()
     if not ret:
         break
+    frame_index += 1
 
-    now = time.time()
+    # Filter time: capture clock when live, the video's own clock otherwise
+    now = time.time() if LIVE_MODE else cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
     gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
 
-    # --- UNDISTORT (once we know frame shape) ---
-    h, w = gray.shape[:2]
-    newcameramtx, _ = cv2.getOptimalNewCameraMatrix(mtx, dist_coeffs, (w, h), 1, (w, h))
-    gray_ud = cv2.undistort(gray, mtx, dist_coeffs, None, newcameramtx)
+    # --- UNDISTORT (remap tables for this frame size) ---
+    gray_ud = undistorter.undistort(gray)
 
     # --- DETECT APRILTAGS ---
+    # The undistorted image follows the new camera matrix, not the raw one
     detections = detector.detect(
         gray_ud,
-        estimate_tag_pose=True,
-        camera_params=camera_params,
+        estimate_tag_pose=not JOINT_PNP,
+        camera_params=undistorter.camera_params(),
         tag_size=TAG_SIZE
     )
 
-    # Compute world-space camera position estimates per visible tag
-    cam_positions_this_frame = []
+    # World-space camera pose measurement(s) for this frame:
+    # (position, position covariance, R_world_cam, rotation covariance)
+    measurements = []
+    frame_tags = 0
+    if JOINT_PNP:
+        localizer.camera_matrix = undistorter.new_camera_matrix
+        pose = localizer.solve(detections)
+        if pose is not None:
+            frame_tags = pose["tags"]
+            R_wc = pose["R_world_cam"]
+            # covariance is of rvec (world -> camera); rotate it into the world frame
+            measurements.append((pose["position"], pose["position_covariance"],
+                                 R_wc, R_wc @ pose["covariance"][:3, :3] @ R_wc.T))
+    else:
+        # Every tag's pose inverted into the world frame in one batch,
+        # through the tag's world rotation from the map
+        ids, positions = camera_positions_in_world(detections, map_array)
+        frame_tags = len(ids)
+        by_id = {d.tag_id: d for d in detections}
+        for tag_id, position in zip(ids, positions):
+            d = by_id[tag_id]
+            R_wc = map_array.rotations[tag_id] @ np.asarray(d.pose_R, dtype=float).T
+            pos_cov, rot_cov = tag_measurement_covariance(d.pose_t, undistorter.camera_params()[0], TAG_SIZE,
+                                                          viewing_cosine(d.pose_R, d.pose_t), CORNER_SIGMA_PX)
+            measurements.append((position, R_wc @ pos_cov @ R_wc.T, R_wc, R_wc @ rot_cov @ R_wc.T))
+
     for d in detections:
         tag_id = d.tag_id
         if tag_id not in world_positions:
             continue
 
-        R_cam_tag = np.array(d.pose_R, dtype=float)
-        t_cam_tag = np.array(d.pose_t, dtype=float).reshape(3)
-
-        # Camera pose wrt tag -> invert to tag->camera frame
-        R_tag_cam = R_cam_tag.T
-        t_tag_cam = -R_cam_tag.T @ t_cam_tag
-
-        # Tag world pose (assumed identity rotation here; extend if you have tag orientations)
-        t_world_tag = world_positions[tag_id]
-        # R_world_tag = I
-        t_world_cam = t_tag_cam + t_world_tag
-
-        cam_positions_this_frame.append(t_world_cam)
-
         # Draw detection
         corners = d.corners.reshape((-1, 1, 2)).astype(int)
         cv2.polylines(frame, [corners], True, (0, 255, 0), 2)
         cv2.putText(frame, f"ID {tag_id}", tuple(corners[0][0]),
                     cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 0), 2, cv2.LINE_AA)
 
-    # --- FRAME POSITION (mean over tags) ---
-    if cam_positions_this_frame:
-        pos_world = np.mean(cam_positions_this_frame, axis=0)
+    # --- POSE FILTER ---
+    # Each tag (or the joint solve) is one measurement; outliers fail the
+    # Mahalanobis gate instead of a fixed speed limit
+    accepted = [ekf.update(now, *m) for m in measurements]
+    if not all(accepted):
+        cv2.putText(frame, "Outlier rejected", (30, 80),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 255), 2, cv2.LINE_AA)
+
+    if ekf.initialized and now - ekf.last_update_t <= COAST_S:
+        pos_world, R_world_cam, pos_cov = ekf.predict(now)
+        sigma = float(np.sqrt(np.linalg.eigvalsh(pos_cov).max()))
 
-        # 1) Stabilisation phase: wait until variance is small
+        # 1) Stabilisation phase: wait until the filter is confident
         if not tracking_started:
-            stabilisation_buffer.append(pos_world)
-            if len(stabilisation_buffer) == STAB_FRAMES:
-                std_dev = np.std(np.stack(stabilisation_buffer, axis=0), axis=0)
-                if float(np.max(std_dev)) < STAB_STD_THRESH:
-                    tracking_started = True
-                    print("✅ Tracking stabilised and started.")
+            if sigma < STAB_STD_THRESH:
+                tracking_started = True
+                print("✅ Tracking stabilised and started.")
             # Show message while stabilising
             cv2.putText(frame, "Stabilising...", (30, 40),
                         cv2.FONT_HERSHEY_SIMPLEX, 1.0, (0, 165, 255), 2, cv2.LINE_AA)
         else:
-            # 2) Velocity gating: reject impossible jumps
-            accept = True
-            if last_valid_pos is not None and last_valid_time is not None:
-                dt = max(now - last_valid_time, 1e-6)
-                speed = np.linalg.norm(pos_world - last_valid_pos) / dt
-                if speed > MAX_SPEED:
-                    accept = False
-                    cv2.putText(frame, "Outlier rejected", (30, 80),
-                                cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 255), 2, cv2.LINE_AA)
-
-            if accept:
-                # Update reference (pre-EMA)
-                last_valid_pos = pos_world
-                last_valid_time = now
-
-                # 3) EMA smoothing on accepted positions
-                if ema_pos is None:
-                    ema_pos = pos_world.copy()
-                else:
-                    ema_pos = EMA_ALPHA * pos_world + (1.0 - EMA_ALPHA) * ema_pos
-
-                camera_path.append(ema_pos.copy())
-
-                # HUD text
-                x, y, z = ema_pos
-                coords_text = f"X={x:.2f}  Y={y:.2f}  Z={z:.2f}"
-                cv2.putText(frame, coords_text, (30, 40),
-                            cv2.FONT_HERSHEY_SIMPLEX, 1.0, (0, 255, 255), 2, cv2.LINE_AA)
-
-                # --- LIVE 3D PLOT UPDATE ---
-                if len(camera_path) > 1:
-                    path = np.array(camera_path, dtype=float)
-                    ax.cla()
-                    ax.set_title("Live Camera Path")
-                    ax.set_xlabel("X (m)")
-                    ax.set_ylabel("Y (m)")
-                    ax.set_zlabel("Z (m)")
-                    ax.grid(True)
-
-                    if len(tag_positions) > 0:
-                        ax.scatter(tag_positions[:, 0], tag_positions[:, 1], tag_positions[:, 2],
-                                   s=40, marker='^', label='AprilTags')
-
-                    ax.plot(path[:, 0], path[:, 1], path[:, 2], marker='o', markersize=3, label='Path')
-                    ax.scatter(path[-1, 0], path[-1, 1], path[-1, 2], s=50, label='Current')
-                    ax.legend()
-
-                    # Keep roughly equal aspect
-                    max_range = (path.max(axis=0) - path.min(axis=0)).max() / 2.0
-                    mid = path.mean(axis=0)
-                    ax.set_xlim(mid[0] - max_range, mid[0] + max_range)
-                    ax.set_ylim(mid[1] - max_range, mid[1] + max_range)
-                    ax.set_zlim(mid[2] - max_range, mid[2] + max_range)
-
-                    plt.draw()
-                    plt.pause(0.001)
+            # 2) Filtered pose, predicted between detections
+            # HUD text
+            x, y, z = pos_world
+            coords_text = f"X={x:.2f}  Y={y:.2f}  Z={z:.2f}"
+            cv2.putText(frame, coords_text, (30, 40),
+                        cv2.FONT_HERSHEY_SIMPLEX, 1.0, (0, 255, 255), 2, cv2.LINE_AA)
+
+            # --- LIVE 3D PLOT UPDATE ---
+            path_plot.append(pos_world)
+            recorder.append(now, pos_world, R_world_cam if ekf.has_rotation else None,
+                            frame=frame_index, tags=frame_tags if any(accepted) else 0, sigma=sigma)
 
     # --- Display frame ---
     cv2.imshow("AprilTag Live Detection", frame)
@@ -218,5 +196,7 @@ while True:
 
 cap.release()
 cv2.destroyAllWindows()
-plt.ioff()
-plt.show()
+recorder.close()
+rows = export_csv(trajectory_path, os.path.join(BASE_DIR, "camera_path.csv"))
+print(f"✅ Saved camera path to camera_path.csv with {rows} entries.")
+path_plot.stop()  # keeps the final path open until its window is closed
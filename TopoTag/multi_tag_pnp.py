@@ -0,0 +1,249 @@
+"""
+Joint camera pose from every visible tag in one PnP solve.
+
+Instead of a pose per tag (estimate_tag_pose=True), inverting each one and
+averaging the positions, the corners of all mapped tags are matched to
+their world coordinates, RANSAC picks the consistent corners and one
+Levenberg-Marquardt solvePnP refinement is run on all of them. The covariance comes from the
+reprojection Jacobian at the solution.
+
+Tags have identity world rotation unless world_rotations is given (e.g.
+TagMap.world_rotations, from a map built by build_tag_map.py). Corner
+order is that of pupil_apriltags, i.e. the SOLVEPNP_IPPE_SQUARE object
+points.
+"""
+
+import time
+import cv2
+import numpy as np
+
+
+def tag_object_points(tag_size):
+    """Corner coordinates in the tag frame, in pupil_apriltags corner order."""
+    s = tag_size / 2.0
+    return np.array([[-s, s, 0], [s, s, 0], [s, -s, 0], [-s, -s, 0]], dtype=np.float64)
+
+
+class MultiTagLocalizer:
+    def __init__(self, world_positions, tag_size, camera_matrix, dist_coeffs=None,
+                 ransac_reprojection_px=3.0, world_rotations=None):
+        """
+        world_positions: {tag_id: (3,) tag centre in the world frame}
+        world_rotations: {tag_id: (3, 3) R_world_tag}, identity for missing ids
+        camera_matrix / dist_coeffs: of the image the corners come from
+        (after undistortion pass the new camera matrix and no distortion)
+        """
+        corners = tag_object_points(tag_size)
+        world_rotations = world_rotations or {}
+        self.world_corners = {
+            tag_id: corners @ np.asarray(world_rotations.get(tag_id, np.eye(3)), dtype=np.float64).T
+            + np.asarray(pos, dtype=np.float64)
+            for tag_id, pos in world_positions.items()
+        }
+        self.camera_matrix = np.asarray(camera_matrix, dtype=np.float64)
+        self.dist_coeffs = None if dist_coeffs is None else np.asarray(dist_coeffs, dtype=np.float64)
+        self.ransac_reprojection_px = ransac_reprojection_px
+        self.last_solve_ms = 0.0
+
+    def correspondences(self, detections):
+        """(N, 3) world / (N, 2) image points for every mapped tag corner."""
+        object_points, image_points = [], []
+        for d in detections:
+            world = self.world_corners.get(d.tag_id)
+            if world is None:
+                continue
+            object_points.append(world)
+            image_points.append(np.asarray(d.corners, dtype=np.float64))
+        if not object_points:
+            return None, None
+        return np.concatenate(object_points), np.concatenate(image_points)
+
+    def solve(self, detections):
+        """
+        Camera pose for one frame, or None with no mapped tag.
+
+        Returns a dict with
+            position            (3,) camera centre in the world frame
+            R_world_cam         (3, 3)
+            rvec, tvec          world -> camera (OpenCV convention)
+            covariance          (6, 6) of (rvec, tvec)
+            position_covariance (3, 3) of position
+            tags, inliers       tags used / inlier corners
+            rmse                reprojection error (px) over the inliers
+        """
+        t_start = time.perf_counter()
+        object_points, image_points = self.correspondences(detections)
+        if object_points is None:
+            return None
+
+        n_tags = len(object_points) // 4
+        if n_tags == 1:
+            # Nothing to vote against; IPPE is already the best square fit
+            ok, rvec, tvec = cv2.solvePnP(object_points, image_points, self.camera_matrix,
+                                          self.dist_coeffs, flags=cv2.SOLVEPNP_IPPE_SQUARE)
+            if not ok:
+                return None
+            inliers = np.arange(4)
+        else:
+            rvec, tvec, inliers = self._ransac(object_points, image_points)
+            if inliers is None or len(inliers) < 4:
+                return None
+
+            # Local optimisation: one small tag's pose extrapolates poorly to
+            # the far tags, so refine while tightening the gate back to the
+            # threshold
+            for widen in (4.0, 2.0, 1.0):
+                wider = self._inliers(object_points, image_points, rvec, tvec, widen)
+                if len(wider) < 4:
+                    break
+                inliers = wider
+                rvec, tvec = cv2.solvePnPRefineLM(object_points[inliers], image_points[inliers],
+                                                  self.camera_matrix, self.dist_coeffs, rvec, tvec)
+        object_points, image_points = object_points[inliers], image_points[inliers]
+
+        result = self._with_covariance(object_points, image_points, rvec, tvec)
+        result["tags"] = n_tags
+        result["inliers"] = len(inliers)
+        self.last_solve_ms = (time.perf_counter() - t_start) * 1000.0
+        return result
+
+    def _ransac(self, object_points, image_points):
+        """
+        RANSAC where every tag is one minimal sample: its IPPE_SQUARE pose is
+        a hypothesis, as is an SQPnP solve over all corners (the right answer
+        whenever every tag agrees with the map). With a handful of tags per
+        frame every sample is tried, so it is deterministic. Hypotheses are
+        scored MSAC-style by truncated reprojection error, so a tag that is
+        misplaced in the map is outvoted rather than averaged in.
+        """
+        hypotheses = []
+        if len(object_points) > 4:
+            ok, rvec, tvec = cv2.solvePnP(object_points, image_points, self.camera_matrix,
+                                          self.dist_coeffs, flags=cv2.SOLVEPNP_SQPNP)
+            if ok:
+                hypotheses.append((rvec, tvec))
+        for k in range(0, len(object_points), 4):
+            ok, rvec, tvec = cv2.solvePnP(object_points[k:k + 4], image_points[k:k + 4], self.camera_matrix,
+                                          self.dist_coeffs, flags=cv2.SOLVEPNP_IPPE_SQUARE)
+            if ok:
+                hypotheses.append((rvec, tvec))
+
+        best, best_cost = (None, None, None), np.inf
+        threshold2 = self.ransac_reprojection_px ** 2
+        for rvec, tvec in hypotheses:
+            error2 = self._errors2(object_points, image_points, rvec, tvec)
+            cost = np.sum(np.minimum(error2, threshold2))
+            if cost < best_cost:
+                best, best_cost = (rvec, tvec, np.flatnonzero(error2 < threshold2)), cost
+        return best
+
+    def _errors2(self, object_points, image_points, rvec, tvec):
+        projected, _ = cv2.projectPoints(object_points, rvec, tvec, self.camera_matrix, self.dist_coeffs)
+        return np.sum((projected.reshape(-1, 2) - image_points) ** 2, axis=1)
+
+    def _inliers(self, object_points, image_points, rvec, tvec, widen=1.0):
+        error2 = self._errors2(object_points, image_points, rvec, tvec)
+        return np.flatnonzero(error2 < (self.ransac_reprojection_px * widen) ** 2)
+
+    def _with_covariance(self, object_points, image_points, rvec, tvec):
+        projected, jacobian = cv2.projectPoints(object_points, rvec, tvec, self.camera_matrix, self.dist_coeffs)
+        residuals = (projected.reshape(-1, 2) - image_points).ravel()
+        J = jacobian[:, :6]
+
+        # sigma^2 from the residuals; floor it so a perfect fit is not overconfident
+        dof = max(len(residuals) - 6, 1)
+        sigma2 = max(float(residuals @ residuals) / dof, 0.25 ** 2)
+        covariance = sigma2 * np.linalg.pinv(J.T @ J)
+
+        R_cam_world, _ = cv2.Rodrigues(rvec)
+        position = (-R_cam_world.T @ tvec).ravel()
+
+        # position = -R(rvec)^T t, linearised numerically around the solution
+        G = np.zeros((3, 6))
+        eps = 1e-6
+        for i in range(6):
+            step = np.zeros(6)
+            step[i] = eps
+            R_i, _ = cv2.Rodrigues(rvec.ravel() + step[:3])
+            G[:, i] = ((-R_i.T @ (tvec.ravel() + step[3:])) - position) / eps
+
+        return {
+            "position": position,
+            "R_world_cam": R_cam_world.T,
+            "rvec": rvec.ravel(),
+            "tvec": tvec.ravel(),
+            "covariance": covariance,
+            "position_covariance": G @ covariance @ G.T,
+            "rmse": float(np.sqrt(np.mean(residuals ** 2) * 2.0)),
+        }
+
+
+# --- BENCHMARK (synthetic corners on a tag map) ---
+def _per_tag_mean(detections, world_positions, tag_size, camera_matrix):
+    """Per-tag pose, invert, average: what main.py does with estimate_tag_pose=True."""
+    obj = tag_object_points(tag_size)
+    positions = []
+    for d in detections:
+        if d.tag_id not in world_positions:
+            continue
+        _, rvec, tvec = cv2.solvePnP(obj, d.corners, camera_matrix, None, flags=cv2.SOLVEPNP_IPPE_SQUARE)
+        R, _ = cv2.Rodrigues(rvec)
+        positions.append(-R.T @ tvec.ravel() + world_positions[d.tag_id])
+    return np.mean(positions, axis=0)
+
+
+def benchmark(map_name="125-lab.json", tag_size=0.05, noise_px=0.7, misplaced_m=0.0, frames=200, seed=0):
+    """misplaced_m: one visible tag per frame is that far from where the map says."""
+    import os
+    import json
+    from types import SimpleNamespace
+
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    with open(os.path.join(base_dir, "maps", map_name)) as f:
+        world_positions = {t["id"]: np.array(t["position"], dtype=float) for t in json.load(f)["tags"]}
+
+    K = np.array([[1400.0, 0, 640], [0, 1400.0, 360], [0, 0, 1]])
+    localizer = MultiTagLocalizer(world_positions, tag_size, K)
+    rng = np.random.default_rng(seed)
+    centre = np.mean(list(world_positions.values()), axis=0)
+
+    errors = {"per-tag mean": [], "joint PnP": []}
+    timings = {"per-tag mean": [], "joint PnP": []}
+    for _ in range(frames):
+        # camera ~1 m in front of the map with some tilt; with identity tag
+        # rotation the tags face -z, so that is where the camera is
+        rvec_true = rng.normal(0, 0.15, 3)
+        R_true, _ = cv2.Rodrigues(rvec_true)
+        cam_pos = centre + np.array([rng.normal(0, 0.1), rng.normal(0, 0.1), -1.0])
+        tvec_true = -R_true @ cam_pos
+
+        detections = []
+        for tag_id, world in localizer.world_corners.items():
+            if misplaced_m and not detections:
+                world = world + np.array([misplaced_m, 0.0, 0.0])
+            pix, _ = cv2.projectPoints(world, rvec_true, tvec_true, K, None)
+            pix = pix.reshape(-1, 2)
+            if np.all((pix >= 0) & (pix < (1280, 720))):
+                detections.append(SimpleNamespace(tag_id=tag_id, corners=pix + rng.normal(0, noise_px, pix.shape)))
+        if not detections:
+            continue
+
+        t0 = time.perf_counter()
+        mean_pos = _per_tag_mean(detections, world_positions, tag_size, K)
+        timings["per-tag mean"].append((time.perf_counter() - t0) * 1000.0)
+        errors["per-tag mean"].append(np.linalg.norm(mean_pos - cam_pos))
+
+        result = localizer.solve(detections)
+        timings["joint PnP"].append(localizer.last_solve_ms)
+        errors["joint PnP"].append(np.linalg.norm(result["position"] - cam_pos))
+
+    print(f"{frames} frames, {noise_px} px corner noise, map {map_name}, one tag misplaced by {misplaced_m} m")
+    for name in errors:
+        e = np.array(errors[name]) * 1000.0
+        print(f"  {name:<13} error mean {e.mean():6.1f} mm, 95% {np.percentile(e, 95):6.1f} mm, "
+              f"{np.median(timings[name]):.3f} ms/frame")
+
+
+if __name__ == "__main__":
+    benchmark()
+    benchmark(misplaced_m=0.15)
@@ -0,0 +1,493 @@
+"""
+Importable tag36h11 detector built from the stages of demo.py.
+
+    1. grayscale, Gaussian blur, adaptive threshold (demo.py steps 1-2)
+    2. contours of the threshold mask -> convex quadrilaterals (step 4),
+       wound the same way as pupil_apriltags' corners
+    3. one homography per quad, solved for all quads at once (step 5)
+    4. the 10 x 10 cell grid of every quad (quiet zone, black border, 6 x 6
+       data) is sampled at 2 x 2 points per cell, all quads in one bilinear
+       gather (a single cv2.remap), instead of a warpPerspective per quad
+       (steps 6-7)
+    5. per quad: threshold halfway between the border and quiet-zone
+       levels, border check, then the data bits of all quads are matched
+       against the codebook in all four rotations with one matrix product
+    6. the corners of the decoded tags are refined on the image gradient
+       across each edge (again one gather for all tags), and poses come from
+       IPPE_SQUARE, as elsewhere in the repo
+
+demo.py's Canny + dilate step is left out: contours of the threshold mask
+itself keep the quads nested inside other shapes (RETR_LIST) and do not
+grow them by the dilation.
+
+Detections have the attributes of pupil_apriltags' Detection (tag_id,
+hamming, decision_margin, homography, center, corners, pose_R, pose_t,
+pose_err) plus a (w, x, y, z) quaternion, the pose test/main.cpp's
+DetectTopotag reports, so QuadDetector can stand in for Detector.
+Corners are in the same order as pupil_apriltags' (tag_object_points),
+but use OpenCV's pixel-centre convention (pupil's are about half a pixel
+further right and down).
+
+Corners are less accurate than pupil_apriltags' on motion-blurred tags:
+in the benchmark the median error is 0.54 px against 0.38 px and the 95th
+percentile 4.30 px against 1.80 px, so pose-sensitive callers on a moving
+robot may still prefer Detector.
+
+The codebook is built from tag-images/tag36h11-*.svg, so only the ids
+printed from there are decoded.
+
+Run: python quad_detector.py   (benchmark against pupil_apriltags)
+"""
+
+import os
+import glob
+import time
+import cv2
+import numpy as np
+from multi_tag_pnp import tag_object_points
+from synthetic_scene import load_tag_cells
+from trajectory import rotation_to_quaternion
+
+# --- CONFIGURATION ---
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+TEST_IMAGES = os.path.join(BASE_DIR, "test-images", "*.png")
+
+BLUR_KSIZE = 5                 # demo.py's Gaussian blur before thresholding
+THRESHOLD_BLOCK = 31           # px, adaptive threshold neighbourhood (demo.py)
+THRESHOLD_OFFSET = 5           # gray levels
+MIN_SIDE_PX = 10               # quads with a shorter side are not sampled
+POLY_EPSILON = 0.03            # approxPolyDP tolerance, fraction of the perimeter
+MAX_HAMMING = 2                # bit errors corrected (tag36h11 codes are >= 11 apart)
+MAX_BORDER_ERRORS = 3          # of the 28 black border cells
+MIN_CONTRAST = 15.0            # gray levels between the quiet zone and the border
+EDGE_SAMPLES = 16              # points per edge for corner refinement
+EDGE_RANGE_PX = 3.0            # searched either side of the rough edge
+MAX_REFINE_SHIFT_PX = 4.0      # corners that would move further keep the contour corner
+
+GRID = 10                      # cells across, quiet zone included
+SUBSAMPLES = (0.25, 0.75)      # sample positions within a cell, in cell units
+REMAP_WIDTH = 1024             # samples per row of a cv2.remap gather
+REMAP_MAX_ROWS = 32766         # remap asserts fewer than SHRT_MAX rows
+
+
+# --- DETECTIONS ---
+class TagDetection:
+    """One decoded tag, with the fields of pupil_apriltags' Detection."""
+
+    tag_family = b"tag36h11"
+
+    def __init__(self, tag_id, hamming, decision_margin, homography, corners):
+        self.tag_id = tag_id
+        self.hamming = hamming
+        self.decision_margin = decision_margin
+        self.homography = homography
+        self.corners = corners
+        self.center = _apply_homography(homography, np.array([[4.0, 4.0]]))[0]
+        self.pose_R = None
+        self.pose_t = None
+        self.pose_err = None
+
+    @property
+    def quaternion(self):
+        """(w, x, y, z) of pose_R (tag -> camera), as DetectTopotag reports it."""
+        return None if self.pose_R is None else rotation_to_quaternion(self.pose_R)
+
+    def __repr__(self):
+        return (f"TagDetection(tag_id={self.tag_id}, hamming={self.hamming}, "
+                f"decision_margin={self.decision_margin:.1f}, center={np.round(self.center, 1).tolist()})")
+
+
+# --- GEOMETRY ---
+# Corner i of the black square in cell units (x along the tag's +x, y along +y),
+# in tag_object_points order
+_CANONICAL = np.array([[0.0, 8.0], [8.0, 8.0], [8.0, 0.0], [0.0, 0.0]])
+
+
+def _homographies(corners):
+    """(N, 3, 3) maps from cell units to the image, one per quad of corners (N, 4, 2)."""
+    n = len(corners)
+    x, y = _CANONICAL[:, 0], _CANONICAL[:, 1]
+    u, v = corners[..., 0], corners[..., 1]
+    A = np.zeros((n, 8, 8))
+    A[:, 0::2, 0], A[:, 0::2, 1], A[:, 0::2, 2] = x, y, 1.0
+    A[:, 1::2, 3], A[:, 1::2, 4], A[:, 1::2, 5] = x, y, 1.0
+    A[:, 0::2, 6], A[:, 0::2, 7] = -u * x, -u * y
+    A[:, 1::2, 6], A[:, 1::2, 7] = -v * x, -v * y
+    b = np.empty((n, 8))
+    b[:, 0::2], b[:, 1::2] = u, v
+    h = np.linalg.solve(A, b[..., None])[..., 0]
+    return np.concatenate((h, np.ones((n, 1))), axis=1).reshape(n, 3, 3)
+
+
+def _apply_homography(H, points):
+    """points (P, 2) through every H (..., 3, 3) -> (..., P, 2)."""
+    x, y = points[:, 0], points[:, 1]
+    H = H[..., None]
+    w = H[..., 2, 0, :] * x + H[..., 2, 1, :] * y + H[..., 2, 2, :]
+    u = (H[..., 0, 0, :] * x + H[..., 0, 1, :] * y + H[..., 0, 2, :]) / w
+    v = (H[..., 1, 0, :] * x + H[..., 1, 1, :] * y + H[..., 1, 2, :]) / w
+    return np.stack((u, v), axis=-1)
+
+
+def _sample(image, points):
+    """
+    Bilinear samples of a float32 image at points (..., 2), NaN outside it.
+
+    The points are laid out REMAP_WIDTH to a row, so one cv2.remap covers
+    them all; remap needs fewer than SHRT_MAX rows, so a very large batch
+    takes one call per REMAP_MAX_ROWS rows.
+    """
+    shape = points.shape[:-1]
+    flat = points.reshape(-1, 2).astype(np.float32)
+    rows = -(-len(flat) // REMAP_WIDTH)
+    # Padding points lie outside the image and are dropped below
+    xy = np.full((rows * REMAP_WIDTH, 2), -1.0, dtype=np.float32)
+    xy[:len(flat)] = flat
+    xy = xy.reshape(rows, REMAP_WIDTH, 2)
+    values = np.empty((rows, REMAP_WIDTH), dtype=np.float32)
+    for r in range(0, rows, REMAP_MAX_ROWS):
+        chunk = xy[r:r + REMAP_MAX_ROWS]
+        values[r:r + REMAP_MAX_ROWS] = cv2.remap(image, chunk[..., 0], chunk[..., 1], cv2.INTER_LINEAR,
+                                                 borderMode=cv2.BORDER_CONSTANT, borderValue=float("nan"))
+    return values.ravel()[:len(flat)].reshape(shape)
+
+
+# --- STAGES ---
+def find_quads(gray, quad_decimate=1.0):
+    """Convex quadrilateral candidates (N, 4, 2) float64, wound like the pupil corners."""
+    small = gray if quad_decimate == 1.0 else cv2.resize(
+        gray, None, fx=1.0 / quad_decimate, fy=1.0 / quad_decimate, interpolation=cv2.INTER_AREA)
+    blur = cv2.GaussianBlur(small, (BLUR_KSIZE, BLUR_KSIZE), 0)
+    mask = cv2.adaptiveThreshold(blur, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY_INV,
+                                 THRESHOLD_BLOCK, THRESHOLD_OFFSET)
+    contours, _ = cv2.findContours(mask, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
+
+    min_side = MIN_SIDE_PX / quad_decimate
+    quads = []
+    for c in contours:
+        if len(c) < 4 or cv2.contourArea(c) < min_side ** 2:
+            continue
+        approx = cv2.approxPolyDP(c, POLY_EPSILON * cv2.arcLength(c, True), True)
+        if len(approx) != 4:
+            # A tag touching a line or a smudge: its convex hull may still be a quad
+            hull = cv2.convexHull(c)
+            approx = cv2.approxPolyDP(hull, POLY_EPSILON * cv2.arcLength(hull, True), True)
+        if len(approx) == 4 and cv2.isContourConvex(approx):
+            quads.append(approx.reshape(4, 2))
+    if not quads:
+        return np.empty((0, 4, 2))
+    quads = np.array(quads, dtype=np.float64)
+
+    sides = np.linalg.norm(quads - np.roll(quads, -1, axis=1), axis=2).min(axis=1)
+    quads = quads[sides >= min_side]
+    # The pupil order (bottom-left, bottom-right, top-right, top-left of a
+    # facing tag) has a negative shoelace sum in image coordinates
+    x, y = quads[..., 0], quads[..., 1]
+    shoelace = np.sum(x * np.roll(y, -1, axis=1) - np.roll(x, -1, axis=1) * y, axis=1)
+    quads[shoelace > 0] = quads[shoelace > 0, ::-1]
+    # Contour pixels are the dark side of the edge: move half a pixel out
+    centre = quads.mean(axis=1, keepdims=True)
+    outward = quads - centre
+    quads += 0.5 * outward / np.maximum(np.linalg.norm(outward, axis=2, keepdims=True), 1e-9)
+    return quads * quad_decimate if quad_decimate != 1.0 else quads
+
+
+# Sample points of the cell grid in cell units, row by row; the quiet zone
+# is the ring of cells just outside the black square
+_xs = ((np.arange(GRID) - 1.0)[:, None] + np.array(SUBSAMPLES)).ravel()
+_GRID_POINTS = np.stack(np.meshgrid(_xs, _xs), axis=-1).reshape(-1, 2).astype(np.float32)
+
+
+def sample_grids(gray, quads):
+    """(homographies (N, 3, 3), mean level of every cell (N, GRID, GRID)), quiet zone included."""
+    H = _homographies(quads)
+    levels = _sample(gray, _apply_homography(H.astype(np.float32), _GRID_POINTS))
+    k = len(SUBSAMPLES)
+    return H, levels.reshape(len(quads), GRID, k, GRID, k).mean(axis=(2, 4))
+
+
+class _Codebook:
+    """Data bits of every known id in all four rotations, for matching by matrix product."""
+
+    def __init__(self, tag_cells):
+        ids, rotations, bits = [], [], []
+        for tag_id, cells in sorted(tag_cells.items()):
+            data = cells[2:8, 2:8] > 127
+            for k in range(4):
+                ids.append(tag_id)
+                rotations.append(k)
+                bits.append(np.rot90(data, k).ravel())
+        self.ids = np.array(ids)
+        self.rotations = np.array(rotations)
+        self.bits = np.array(bits, dtype=np.float32)        # (C, 36)
+
+    def match(self, bits):
+        """(code index, hamming distance) per row of bits (N, 36) bool."""
+        b = bits.astype(np.float32)
+        distance = b @ (1.0 - self.bits).T + (1.0 - b) @ self.bits.T
+        best = np.argmin(distance, axis=1)
+        return best, distance[np.arange(len(bits)), best].astype(int)
+
+
+_RING = np.zeros((GRID, GRID), dtype=bool)
+_RING[[0, -1], :] = _RING[:, [0, -1]] = True
+_BORDER = np.zeros((GRID, GRID), dtype=bool)
+_BORDER[1:-1, 1:-1] = True
+_BORDER[2:-2, 2:-2] = False
+
+
+def decode(levels, codebook, max_hamming=MAX_HAMMING):
+    """
+    Per quad: code index into codebook (-1 if rejected), hamming distance and
+    decision margin, from cell levels (N, GRID, GRID).
+    """
+    n = len(levels)
+    quiet, border, data = levels[:, _RING], levels[:, _BORDER], levels[:, 2:8, 2:8].reshape(n, 36)
+    # Mean of the quiet-zone cells inside the image; NaN if none are
+    inside = np.isfinite(quiet)
+    count = inside.sum(axis=1)
+    white = np.where(count > 0, np.where(inside, quiet, 0.0).sum(axis=1) / np.maximum(count, 1), np.nan)
+    black = np.mean(border, axis=1)
+    threshold = (white + black) / 2.0
+    border_errors = np.sum(border > threshold[:, None], axis=1)
+    ok = (white - black >= MIN_CONTRAST) & (border_errors <= MAX_BORDER_ERRORS) & np.isfinite(data).all(axis=1)
+
+    code, hamming = codebook.match(data > threshold[:, None])
+    margin = np.mean(np.abs(data - threshold[:, None]), axis=1)
+    code = np.where(ok & (hamming <= max_hamming), code, -1)
+    return code, hamming, margin
+
+
+def refine_corners(gray, corners):
+    """
+    Corners (N, 4, 2) moved to the intersections of lines fitted through
+    the gradient peak across each edge; all edges sampled in one gather.
+    """
+    if len(corners) == 0:
+        return corners
+    start, end = corners, np.roll(corners, -1, axis=1)
+    direction = end - start
+    length = np.linalg.norm(direction, axis=2, keepdims=True)
+    direction = direction / np.maximum(length, 1e-9)
+    normal = np.stack((-direction[..., 1], direction[..., 0]), axis=-1)
+
+    t = (np.arange(EDGE_SAMPLES) + 0.5) / EDGE_SAMPLES * 0.8 + 0.1  # keep clear of the corners
+    offsets = np.arange(-EDGE_RANGE_PX, EDGE_RANGE_PX + 0.25, 0.5)
+    base = start[:, :, None, :] + (end - start)[:, :, None, :] * t[:, None]            # (N, 4, S, 2)
+    points = base[:, :, :, None, :] + normal[:, :, None, None, :] * offsets[:, None]  # (N, 4, S, D, 2)
+    profile = _sample(gray, points)
+    gradient = np.abs(np.diff(profile, axis=-1))
+    gradient = np.where(np.isfinite(gradient), gradient, 0.0)
+
+    # Edge position: centroid of the gradient within +-1.5 px of its peak
+    peak = np.argmax(gradient, axis=-1)
+    index = np.arange(gradient.shape[-1])
+    window = np.where(np.abs(index - peak[..., None]) <= 3, gradient, 0.0)
+    strength = window.sum(axis=-1)
+    position = offsets[0] + (np.sum(window * index, axis=-1) / np.maximum(strength, 1e-9) + 0.5) * 0.5
+    edge_points = base + normal[:, :, None, :] * position[..., None]
+    weight = strength / np.maximum(strength.sum(axis=-1, keepdims=True), 1e-9)
+
+    # Weighted total least squares line per edge: centroid and principal direction
+    centroid = np.sum(edge_points * weight[..., None], axis=2)
+    d = edge_points - centroid[:, :, None, :]
+    cov = np.einsum("nes,nesi,nesj->neij", weight, d, d)
+    line_direction = np.linalg.eigh(cov)[1][..., :, 1]
+
+    # Corner i is where edge i - 1 meets edge i
+    p1, v1 = np.roll(centroid, 1, axis=1), np.roll(line_direction, 1, axis=1)
+    p2, v2 = centroid, line_direction
+    A = np.stack((v1, -v2), axis=-1)
+    det = np.linalg.det(A)
+    good = np.abs(det) > 1e-6
+    A[~good] = np.eye(2)
+    s = np.linalg.solve(A, (p2 - p1)[..., None])[..., 0, 0]
+    refined = p1 + v1 * s[..., None]
+    moved = np.linalg.norm(refined - corners, axis=2)
+    keep = good & (moved <= MAX_REFINE_SHIFT_PX) & np.isfinite(refined).all(axis=2)
+    return np.where(keep[..., None], refined, corners)
+
+
+# --- DETECTOR ---
+class QuadDetector:
+    def __init__(self, tag_cells=None, max_hamming=MAX_HAMMING, quad_decimate=1.0, refine_edges=True):
+        """
+        tag_cells:     {tag_id: (10, 10) cells} (synthetic_scene.load_tag_cells
+                       by default, i.e. the tag-images SVGs)
+        quad_decimate: find quads on an image this many times smaller; the
+                       bits and corners are still read at full resolution
+        """
+        self.codebook = _Codebook(load_tag_cells() if tag_cells is None else tag_cells)
+        self.max_hamming = max_hamming
+        self.quad_decimate = quad_decimate
+        self.refine_edges = refine_edges
+        self.timings = {}  # ms per stage of the last detect()
+
+    def detect(self, img, estimate_tag_pose=False, camera_params=None, tag_size=None):
+        """
+        [TagDetection] in a grayscale (or BGR) uint8 image. With
+        estimate_tag_pose, camera_params = (fx, fy, cx, cy) and tag_size (m)
+        give pose_R / pose_t (tag -> camera) and pose_err (mean squared
+        reprojection error, px^2) from IPPE_SQUARE.
+        """
+        t0 = time.perf_counter()
+        gray = img if img.ndim == 2 else cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        quads = find_quads(gray, self.quad_decimate)
+        t1 = time.perf_counter()
+        if len(quads) == 0:
+            self.timings = {"quads": (t1 - t0) * 1000.0, "decode": 0.0, "refine": 0.0, "pose": 0.0}
+            return []
+        image = gray.astype(np.float32)
+        H, levels = sample_grids(image, quads)
+        code, hamming, margin = decode(levels, self.codebook, self.max_hamming)
+        t2 = time.perf_counter()
+
+        found = np.flatnonzero(code >= 0)
+        # The best rotation says which contour corner is the tag's corner 0
+        corners = np.array([np.roll(quads[i], -self.codebook.rotations[code[i]], axis=0) for i in found])
+        corners = corners.reshape(-1, 4, 2)
+        if self.refine_edges:
+            corners = refine_corners(image, corners)
+        t3 = time.perf_counter()
+
+        detections = []
+        if len(found):
+            H = _homographies(corners)
+            for j, i in enumerate(found):
+                detections.append(TagDetection(int(self.codebook.ids[code[i]]), int(hamming[i]), float(margin[i]),
+                                               H[j], corners[j]))
+            detections = _suppress_duplicates(detections)
+
+        if estimate_tag_pose:
+            fx, fy, cx, cy = camera_params
+            K = np.array([[fx, 0, cx], [0, fy, cy], [0, 0, 1]], dtype=np.float64)
+            object_points = tag_object_points(tag_size)
+            for d in detections:
+                ok, rvec, tvec = cv2.solvePnP(object_points, d.corners, K, None, flags=cv2.SOLVEPNP_IPPE_SQUARE)
+                if ok:
+                    d.pose_R, d.pose_t = cv2.Rodrigues(rvec)[0], tvec.reshape(3, 1)
+                    projected, _ = cv2.projectPoints(object_points, rvec, tvec, K, None)
+                    d.pose_err = float(np.mean(np.sum((projected.reshape(4, 2) - d.corners) ** 2, axis=1)))
+        t4 = time.perf_counter()
+        self.timings = {"quads": (t1 - t0) * 1000.0, "decode": (t2 - t1) * 1000.0,
+                        "refine": (t3 - t2) * 1000.0, "pose": (t4 - t3) * 1000.0}
+        return detections
+
+
+def _suppress_duplicates(detections):
+    """One detection per tag seen: nested contours of the same tag decode twice."""
+    kept = []
+    for d in sorted(detections, key=lambda d: -d.decision_margin):
+        side = np.linalg.norm(d.corners[0] - d.corners[2])
+        if all(k.tag_id != d.tag_id or np.linalg.norm(k.center - d.center) > side / 2 for k in kept):
+            kept.append(d)
+    return kept
+
+
+# --- BENCHMARK ---
+def _decode_one_by_one(gray, quads, codebook, tile=40):
+    """demo.py's way, for comparison: a warpPerspective and a sampling pass per quad."""
+    cell = tile // GRID
+    dst = (_CANONICAL + 1.0) * tile / GRID - 0.5  # black square corners in the tile
+    levels = np.empty((len(quads), GRID, GRID))
+    for i, q in enumerate(quads):
+        H = cv2.getPerspectiveTransform(q.astype(np.float32), dst.astype(np.float32))
+        warped = cv2.warpPerspective(gray, H, (tile, tile), flags=cv2.INTER_LINEAR, borderValue=float("nan"))
+        # 2 x 2 pixels per cell, at the SUBSAMPLES positions
+        cells = warped.reshape(GRID, cell, GRID, cell)[:, cell // 4::cell // 2, :, cell // 4::cell // 2]
+        levels[i] = cells.mean(axis=(1, 3))
+    return decode(levels, codebook)
+
+
+def _benchmark_images():
+    """[(name, gray, truth or None)]: the test images and their variants, then synthetic frames."""
+    from tag_map import load_tag_map
+    from synthetic_scene import SceneRenderer, fly_past, MAP_PATH, CALIBRATION_PATH
+
+    images = []
+    for path in sorted(glob.glob(TEST_IMAGES)):
+        gray = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+        if gray is None:
+            print(f"[WARN] Cannot read {path}")
+            continue
+        name = os.path.splitext(os.path.basename(path))[0]
+        small = cv2.resize(gray, None, fx=1280 / gray.shape[1], fy=1280 / gray.shape[1], interpolation=cv2.INTER_AREA)
+        images += [(name, gray, None), (f"{name}_1280", small, None),
+                   (f"{name}_1280_r90", np.ascontiguousarray(np.rot90(small)), None)]
+
+    tag_map = load_tag_map(MAP_PATH)
+    calib = np.load(CALIBRATION_PATH)
+    renderer = SceneRenderer(tag_map, calib["camera_matrix"], calib["dist_coeffs"])
+    # Every frame is rendered so the motion blur is that of the real frame rate
+    for n, (t, frame, truth) in enumerate(renderer.render_sequence(fly_past(tag_map, 300))):
+        if n % 5 == 0:
+            images.append((f"synthetic_{t:.2f}", frame, truth))
+    return images
+
+
+def benchmark():
+    from pupil_apriltags import Detector
+
+    images = _benchmark_images()
+    pupil = Detector(families="tag36h11", nthreads=1, quad_decimate=1.0, refine_edges=1)
+    detector = QuadDetector()
+    print(f"{len(images)} images ({sum(t is not None for *_, t in images)} synthetic with ground truth), 1 thread")
+
+    results = {"pupil_apriltags": [], "quad_detector": []}
+    stages, batched, looped, n_quads = [], [], [], []
+    for name, gray, truth in images:
+        for label, detect in (("pupil_apriltags", pupil.detect), ("quad_detector", detector.detect)):
+            times = []
+            for _ in range(3):
+                t0 = time.perf_counter()
+                detections = detect(gray)
+                times.append((time.perf_counter() - t0) * 1000.0)
+            results[label].append((name, min(times), detections, truth))
+        stages.append(detector.timings)
+
+        # Decoding every candidate quad: one batch against one warp per quad
+        quads = find_quads(gray)
+        image = gray.astype(np.float32)
+        timings = []
+        for _ in range(3):
+            t0 = time.perf_counter()
+            decode(sample_grids(image, quads)[1], detector.codebook)
+            t1 = time.perf_counter()
+            _decode_one_by_one(image, quads, detector.codebook)
+            timings.append(((t1 - t0) * 1000.0, (time.perf_counter() - t1) * 1000.0))
+        batched.append(min(t[0] for t in timings))
+        looped.append(min(t[1] for t in timings))
+        n_quads.append(len(quads))
+
+    print(f"\n{'detector':<16} {'test images ms':>15} {'synthetic ms':>13} {'recall':>7} "
+          f"{'corner err p50':>15} {'p95':>6} {'ids on test images'}")
+    for label, rows in results.items():
+        real = [r for r in rows if r[3] is None]
+        synthetic = [r for r in rows if r[3] is not None]
+        found = expected = 0
+        errors = []
+        # pupil_apriltags reports corners half a pixel right and down of OpenCV's convention
+        offset = 0.5 if label == "pupil_apriltags" else 0.0
+        for _, _, detections, truth in synthetic:
+            by_id = {d.tag_id: d for d in detections}
+            for n, tag_id in enumerate(truth["ids"]):
+                if not truth["inside"][n]:
+                    continue
+                expected += 1
+                d = by_id.get(int(tag_id))
+                if d is not None:
+                    found += 1
+                    errors.append(np.linalg.norm(d.corners - offset - truth["corners"][n], axis=1).max())
+        ids = " ".join(f"{name}:{sorted(d.tag_id for d in detections)}" for name, _, detections, _ in real)
+        print(f"{label:<16} {np.median([r[1] for r in real]):>15.1f} {np.median([r[1] for r in synthetic]):>13.1f} "
+              f"{found / max(expected, 1):>7.1%} {np.median(errors):>13.2f} px {np.percentile(errors, 95):>6.2f} {ids}")
+
+    print("\nquad_detector stages (ms, median): " +
+          ", ".join(f"{k} {np.median([s[k] for s in stages]):.1f}" for k in stages[0]))
+    print(f"Decoding all candidate quads ({np.median(n_quads):.0f} per image, median): "
+          f"batched {np.median(batched):.2f} ms, one warpPerspective per quad {np.median(looped):.2f} ms "
+          f"({np.median(looped) / np.median(batched):.1f}x)")
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -5,6 +5,7 @@ import json
 import numpy as np
 import matplotlib.pyplot as plt
 from pupil_apriltags import Detector
+from trajectory import TrajectoryRecorder, export_csv, read_positions
 
 # --- CONFIGURATION ---
 TAG_SIZE = 0.1  # Tag size in meters
@@ -47,7 +48,10 @@ frame_delay = int(1000 / fps)
 print(f"🎥 Video FPS: {fps:.2f}")
 
 # --- STORAGE FOR CAMERA POSITIONS ---
-camera_path = []
+# Recent poses in memory, the rest appended to disk in chunks
+trajectory_path = os.path.join(BASE_DIR, "camera_path.traj")
+recorder = TrajectoryRecorder(trajectory_path)
+frame_index = -1
 
 # --- MAIN LOOP ---
 while True:
@@ -55,6 +59,7 @@ while True:
     if not ret:
         print("Finished processing video.")
         break
+    frame_index += 1
 
     gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
     detections = detector.detect(
@@ -93,7 +98,8 @@ while True:
     # --- AVERAGE POSITION PER FRAME ---
     if camera_positions:
         camera_pos_world = np.mean(camera_positions, axis=0)
-        camera_path.append(camera_pos_world)  # store for later
+        recorder.append(frame_index / fps, camera_pos_world, frame=frame_index,
+                        tags=len(camera_positions))  # store for later
         x, y, z = camera_pos_world
 
         coords_text = f"Camera: X={x:.2f}m  Y={y:.2f}m  Z={z:.2f}m"
@@ -116,11 +122,11 @@ cap.release()
 cv2.destroyAllWindows()
 
 # --- SAVE & PLOT PATH ---
-if camera_path:
-    camera_path = np.array(camera_path)
-    np.savetxt(os.path.join(BASE_DIR, "camera_path.csv"), camera_path, delimiter=",",
-               header="x,y,z", comments='')
-    print(f"✅ Saved camera path to camera_path.csv with {len(camera_path)} entries.")
+recorder.close()
+if len(recorder):
+    rows = export_csv(trajectory_path, os.path.join(BASE_DIR, "camera_path.csv"))
+    print(f"✅ Saved camera path to camera_path.csv with {rows} entries.")
+    camera_path = read_positions(trajectory_path)
 
     # --- 3D PLOT ---
     fig = plt.figure(figsize=(8, 6))
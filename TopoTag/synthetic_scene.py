@@ -0,0 +1,479 @@
+"""
+Synthetic AprilTag scenes with exact ground truth.
+
+Renders what the calibrated camera would see from any pose in a tag map:
+grayscale frames with lens distortion, defocus and motion blur and sensor
+noise, plus the true camera pose and, for every tag in view, its id,
+distorted corner pixels (pupil_apriltags corner order) and R_cam_tag /
+t_cam_tag as the detector reports them.
+
+Per frame:
+    1. each tag in view is warped into an undistorted, padded canvas with
+       one cv2.warpPerspective over its bounding box only (homography
+       K [r1 r2 t] from a texture of the right mip level, so far tags do
+       not alias), far tags first
+    2. optional motion blur around the tags, along their image motion since
+       the previous pose
+    3. one cv2.remap with fixed-point tables built once applies the lens
+       distortion (camera_calibration.npz)
+    4. optional Gaussian defocus, then Gaussian noise from a precomputed bank
+
+Corners follow OpenCV's convention (pixel centres on integers);
+pupil_apriltags reports them about half a pixel further right and down.
+
+Tag bitmaps come from tag-images/tag36h11-<id>.svg (the 10 x 10 cell
+layout with the white quiet zone); tag_size is the black square, as for
+the detector. Tags face their -z axis, as in tag_map.py.
+
+Run: python synthetic_scene.py   (render a fly-past of a map, time it and
+                                  check pupil_apriltags against the truth)
+"""
+
+import os
+import re
+import glob
+import time
+import cv2
+import numpy as np
+from tag_map import load_tag_map
+from multi_tag_pnp import tag_object_points
+from trajectory import read_trajectory
+
+# --- CONFIGURATION ---
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+TAG_IMAGES = os.path.join(BASE_DIR, "..", "tag-images", "tag36h11-*.svg")
+CALIBRATION_PATH = os.path.join(BASE_DIR, "..", "camera_calibration.npz")
+MAP_PATH = os.path.join(BASE_DIR, "maps", "design-centre.json")
+CAMERA_PATH = None             # camera_path.csv / .traj to render; None = fly past every tag of the map
+
+IMAGE_SIZE = (1280, 720)
+TAG_SIZE = 0.05                # m, main.py's TAG_SIZE
+FRAMES = 600
+FPS = 30.0
+
+TAG_CELLS = 10                 # tag36h11 SVGs: 6x6 data, black border, white quiet zone
+BLACK_CELLS = 8                # the part tag_size measures
+MIP_LEVELS = (10, 20, 40, 80, 160, 320)  # texture widths, px
+MAX_BLUR_PX = 40               # longest motion-blur streak
+MAX_TURN_DEG = 3.0             # per frame, for poses that only give a position
+TAG_SWITCH_MARGIN = 1.25       # another tag sets "up" once it is this many times nearer
+
+
+# --- TAG BITMAPS ---
+def _svg_cells(path):
+    """(TAG_CELLS, TAG_CELLS) uint8 0/255 from an axis-aligned tag SVG."""
+    with open(path) as f:
+        svg = f.read()
+    view = [float(v) for v in re.search(r'viewBox="([^"]+)"', svg).group(1).split()]
+    scale = 10.0 * TAG_CELLS / view[2]
+    canvas = np.zeros((10 * TAG_CELLS, 10 * TAG_CELLS), dtype=np.uint8)
+    for style, d in re.findall(r'<path[^>]*style="([^"]*)"[^>]*d="([^"]*)"', svg):
+        colour = 255 if "#ffffff" in style.lower() else 0
+        # Sub-paths are outlines and holes: fill them even-odd
+        mask = np.zeros_like(canvas)
+        for sub in re.split(r"[Mm]", d)[1:]:
+            xy = np.array([float(v) for v in re.findall(r"-?[\d.]+", sub)]).reshape(-1, 2)
+            poly = np.round((xy - view[:2]) * scale).astype(np.int32)
+            layer = np.zeros_like(canvas)
+            cv2.fillPoly(layer, [poly], 1)
+            mask ^= layer
+        canvas[mask > 0] = colour
+    # Sample the middle of each cell, away from the polygon edges
+    centres = np.arange(TAG_CELLS) * 10 + 5
+    return canvas[np.ix_(centres, centres)]
+
+
+def load_tag_cells(pattern=TAG_IMAGES):
+    """{tag_id: (TAG_CELLS, TAG_CELLS) uint8} from the tag SVGs."""
+    cells = {}
+    for path in glob.glob(pattern):
+        match = re.search(r"-(\d+)\.svg$", path)
+        if match:
+            cells[int(match.group(1))] = _svg_cells(path)
+    return cells
+
+
+def _mip_chain(cells):
+    """Texture per MIP_LEVELS width: nearest-upscaled cells, area-downscaled from the largest."""
+    top = cv2.resize(cells, (MIP_LEVELS[-1],) * 2, interpolation=cv2.INTER_NEAREST)
+    return [cv2.resize(top, (w, w), interpolation=cv2.INTER_AREA) for w in MIP_LEVELS[:-1]] + [top]
+
+
+# --- CAMERA POSES ---
+def look_at(position, target, down=(0.0, 0.0, -1.0)):
+    """R_world_cam for a camera at position looking at target (x right, y down, z forward)."""
+    z = np.asarray(target, dtype=float) - np.asarray(position, dtype=float)
+    z /= np.linalg.norm(z)
+    x = np.cross(down, z)
+    if np.linalg.norm(x) < 1e-9:  # looking along down: any right vector will do
+        x = np.cross((1.0, 0.0, 0.0) if abs(z[0]) < 0.9 else (0.0, 1.0, 0.0), z)
+    x /= np.linalg.norm(x)
+    return np.column_stack((x, np.cross(z, x), z))
+
+
+def _quaternion_to_rotation(q):
+    w, x, y, z = q / np.linalg.norm(q)
+    return np.array([
+        [1 - 2 * (y * y + z * z), 2 * (x * y - w * z), 2 * (x * z + w * y)],
+        [2 * (x * y + w * z), 1 - 2 * (x * x + z * z), 2 * (y * z - w * x)],
+        [2 * (x * z - w * y), 2 * (y * z + w * x), 1 - 2 * (x * x + y * y)],
+    ])
+
+
+def _facing_target(tag_map, position, k=4, keep=None):
+    """
+    Point to look at: the nearby tags facing position, weighted by 1 / d^8 so
+    the nearest dominates but the view turns smoothly between tags. Also
+    returns the nearest one's y axis, to keep it upright in the image, and
+    its id. keep (the previous frame's id) stays the upright reference until
+    another tag is TAG_SWITCH_MARGIN times nearer.
+    """
+    ids = tag_map.nearest(position, k=min(len(tag_map), 4 * k))
+    if len(ids) == 0:
+        raise ValueError("The tag map has no tags to look at; give the poses an orientation")
+    offsets = position - tag_map.positions[ids]
+    cam_in_tag = np.einsum("nji,nj->ni", tag_map.rotations[ids], offsets)
+    facing = cam_in_tag[:, 2] < 0
+    ids = ids[facing][:k] if facing.any() else ids[:1]
+    distance = np.maximum(np.linalg.norm(position - tag_map.positions[ids], axis=1), 1e-3)
+    weights = 1.0 / distance ** 8
+    target = weights @ tag_map.positions[ids] / weights.sum()
+    reference = ids[0]
+    if keep is not None and keep in ids and distance[list(ids).index(keep)] <= TAG_SWITCH_MARGIN * distance[0]:
+        reference = keep
+    return target, tag_map.rotations[reference][:, 1], int(reference)
+
+
+def _look_along(tag_map, positions):
+    """
+    R_world_cam per position, looking at the nearby facing tags. The chosen
+    tags change abruptly as the camera crosses tag planes, so the camera
+    turns at most MAX_TURN_DEG per frame towards each new view.
+    """
+    max_angle = np.radians(MAX_TURN_DEG)
+    rotations, R, keep = [], None, None
+    for p in positions:
+        target, down, keep = _facing_target(tag_map, p, keep=keep)
+        desired = look_at(p, target, down)
+        if R is not None:
+            w, _ = cv2.Rodrigues(R.T @ desired)
+            angle = float(np.linalg.norm(w))
+            if angle > max_angle:
+                desired = R @ cv2.Rodrigues(w * (max_angle / angle))[0]
+        R = desired
+        rotations.append(R)
+    return rotations
+
+
+def load_camera_poses(path, tag_map, fps=FPS):
+    """
+    [(t, R_world_cam, position)] from a camera_path.csv (x,y,z; t if present)
+    or a .traj recording. Poses without an orientation look at the nearest
+    tags facing them.
+    """
+    if path.endswith(".traj"):
+        records = np.concatenate(list(read_trajectory(path)))
+        t = records["t"]
+        positions = np.column_stack((records["x"], records["y"], records["z"]))
+        quats = np.column_stack((records["qw"], records["qx"], records["qy"], records["qz"])).astype(float)
+    else:
+        data = np.genfromtxt(path, delimiter=",", names=True)
+        positions = np.column_stack((data["x"], data["y"], data["z"]))
+        t = data["t"] if "t" in data.dtype.names else np.arange(len(positions)) / fps
+        quats = np.full((len(positions), 4), np.nan)
+
+    oriented = np.all(np.isfinite(quats), axis=1)
+    looking = iter(_look_along(tag_map, positions[~oriented]))
+    poses = []
+    for ti, p, q, has_q in zip(t, positions, quats, oriented):
+        R = _quaternion_to_rotation(q) if has_q else next(looking)
+        poses.append((float(ti), R, p))
+    return poses
+
+
+def fly_past(tag_map, frames=FRAMES, standoff=0.8, fps=FPS):
+    """
+    [(t, R_world_cam, position)] of a smooth pass in front of every tag in
+    id order, standoff metres off each face, looking at the nearest tags.
+    """
+    ids = tag_map.ids
+    stops = tag_map.positions[ids] - standoff * tag_map.rotations[ids][:, :, 2]
+    # Closed Catmull-Rom spline through the stops
+    s = np.linspace(0, len(stops), frames, endpoint=False)
+    i = np.floor(s).astype(int)
+    u = (s - i)[:, None]
+    p0, p1, p2, p3 = (stops[(i + k) % len(stops)] for k in (-1, 0, 1, 2))
+    positions = 0.5 * (2 * p1 + (p2 - p0) * u + (2 * p0 - 5 * p1 + 4 * p2 - p3) * u ** 2
+                       + (3 * p1 - p0 - 3 * p2 + p3) * u ** 3)
+    return [(n / fps, R, p) for n, (R, p) in enumerate(zip(_look_along(tag_map, positions), positions))]
+
+
+# --- RENDERER ---
+class SceneRenderer:
+    def __init__(self, tag_map, camera_matrix, dist_coeffs, image_size=IMAGE_SIZE, tag_size=TAG_SIZE,
+                 noise_sigma=2.0, blur_sigma=0.0, exposure=0.5, max_range=8.0, tag_cells=None, seed=0):
+        """
+        tag_map:     TagMap (tag_map.load_tag_map)
+        noise_sigma: gray levels of Gaussian sensor noise (0 = none)
+        blur_sigma:  px of Gaussian defocus (0 = none)
+        exposure:    fraction of the frame interval the shutter is open, for
+                     motion blur between consecutive poses (0 = none)
+        """
+        self.tag_map = tag_map
+        self.camera_matrix = np.asarray(camera_matrix, dtype=np.float64).reshape(3, 3)
+        self.dist_coeffs = np.asarray(dist_coeffs, dtype=np.float64).ravel()
+        self.image_size = tuple(image_size)
+        self.tag_size = tag_size
+        self.blur_sigma = blur_sigma
+        self.exposure = exposure
+        self.max_range = max_range
+        self.rng = np.random.default_rng(seed)
+
+        cells = load_tag_cells() if tag_cells is None else tag_cells
+        self.textures = {tag_id: _mip_chain(c) for tag_id, c in cells.items()}
+        missing = sorted(set(int(i) for i in tag_map.ids) - set(self.textures))
+        if missing:
+            print(f"[WARN] No tag image for ids {missing}, they will not be rendered")
+
+        # Quiet-zone quad and black-square corners in the tag frame
+        outer = tag_size * TAG_CELLS / BLACK_CELLS
+        self.outer_size = outer
+        self.outer_corners = tag_object_points(outer)
+        self.corners = tag_object_points(tag_size)
+
+        self._build_distortion(seed)
+        self.noise_sigma = noise_sigma
+        self._noise_bank = None
+        if noise_sigma > 0:
+            w, h = self.image_size
+            bank = self.rng.normal(0.0, noise_sigma, (h + 64, 2 * w))
+            self._noise_bank = np.round(bank).astype(np.int16)
+        self.previous = None  # (R_world_cam, position) of the last frame, for motion blur
+
+    def _build_distortion(self, seed):
+        """Remap tables from distorted output pixels into an undistorted, padded canvas."""
+        w, h = self.image_size
+        u, v = np.meshgrid(np.arange(w, dtype=np.float64), np.arange(h, dtype=np.float64))
+        pixels = np.stack((u, v), axis=-1).reshape(-1, 1, 2)
+        ideal = cv2.undistortPoints(pixels, self.camera_matrix, self.dist_coeffs,
+                                    P=self.camera_matrix).reshape(h, w, 2)
+        lo = np.floor(ideal.reshape(-1, 2).min(axis=0)) - 2
+        hi = np.ceil(ideal.reshape(-1, 2).max(axis=0)) + 2
+        pad = np.maximum(-lo, 0).astype(int)
+        self.canvas_size = tuple(int(v) for v in np.maximum(hi + pad + 1, (w + pad[0], h + pad[1])))
+        self.canvas_matrix = self.camera_matrix.copy()
+        self.canvas_matrix[:2, 2] += pad
+
+        map_xy = (ideal + pad).astype(np.float32)
+        self.map1, self.map2 = cv2.convertMaps(map_xy[..., 0], map_xy[..., 1], cv2.CV_16SC2)
+
+        # Static low-frequency background, mid grey so tag edges keep their contrast
+        cw, ch = self.canvas_size
+        noise = np.random.default_rng(seed + 1).normal(0.0, 1.0, (ch // 48 + 2, cw // 48 + 2))
+        texture = cv2.resize(noise, (cw, ch), interpolation=cv2.INTER_CUBIC)
+        self.background = np.clip(128 + 25 * texture / max(texture.std(), 1e-6), 60, 200).astype(np.uint8)
+
+    # --- Geometry ---
+    def tag_poses(self, R_world_cam, position):
+        """ids, R_cam_tag (N, 3, 3) and t_cam_tag (N, 3) of every tag in view."""
+        position = np.asarray(position, dtype=float)
+        ids = self.tag_map.within(position, self.max_range)
+        ids = np.array([i for i in ids if int(i) in self.textures], dtype=np.int64)
+        if len(ids) == 0:
+            return ids, np.empty((0, 3, 3)), np.empty((0, 3))
+        R_world_tag = self.tag_map.rotations[ids]
+        R_cam_tag = np.einsum("ji,njk->nik", R_world_cam, R_world_tag)
+        t_cam_tag = (self.tag_map.positions[ids] - position) @ R_world_cam
+
+        # Whole quiet-zone quad in front of the camera, face towards it, and on the canvas
+        quad = np.einsum("nij,kj->nki", R_cam_tag, self.outer_corners) + t_cam_tag[:, None, :]
+        in_front = (quad[:, :, 2] > 0.05).all(axis=1)
+        facing = np.einsum("nji,nj->ni", R_cam_tag, -t_cam_tag)[:, 2] < 0
+        z = np.where(in_front[:, None], quad[:, :, 2], 1.0)
+        K = self.canvas_matrix
+        u = K[0, 0] * quad[:, :, 0] / z + K[0, 2]
+        v = K[1, 1] * quad[:, :, 1] / z + K[1, 2]
+        cw, ch = self.canvas_size
+        on_canvas = (u.max(axis=1) > 0) & (u.min(axis=1) < cw) & (v.max(axis=1) > 0) & (v.min(axis=1) < ch)
+        keep = in_front & facing & on_canvas
+        return ids[keep], R_cam_tag[keep], t_cam_tag[keep]
+
+    def project_corners(self, R_cam_tag, t_cam_tag):
+        """(N, 4, 2) distorted pixel corners of the black squares, pupil_apriltags order."""
+        if len(t_cam_tag) == 0:
+            return np.empty((0, 4, 2))
+        pts = np.einsum("nij,kj->nki", R_cam_tag, self.corners) + t_cam_tag[:, None, :]
+        pixels, _ = cv2.projectPoints(pts.reshape(-1, 3), np.zeros(3), np.zeros(3),
+                                      self.camera_matrix, self.dist_coeffs)
+        return pixels.reshape(-1, 4, 2)
+
+    def _homography(self, R_cam_tag, t_cam_tag, width):
+        """Texture pixel (width x width mip level) -> canvas pixel."""
+        scale = self.outer_size / width
+        to_plane = np.array([[scale, 0.0, scale * 0.5 - self.outer_size / 2],
+                             [0.0, scale, scale * 0.5 - self.outer_size / 2],
+                             [0.0, 0.0, 1.0]])
+        plane_to_cam = np.column_stack((R_cam_tag[:, 0], R_cam_tag[:, 1], t_cam_tag))
+        return self.canvas_matrix @ plane_to_cam @ to_plane
+
+    # --- Rendering ---
+    def _motion_kernel(self, R_world_cam, position, target):
+        """
+        Line kernel along the image motion of target (world point) since the
+        previous frame, at most MAX_BLUR_PX long; None if there is none or
+        the target is not in front of both cameras.
+        """
+        if self.exposure <= 0 or self.previous is None:
+            return None
+        R_prev, p_prev = self.previous
+        K = self.camera_matrix
+        x_now, x_prev = (target - position) @ R_world_cam, (target - p_prev) @ R_prev
+        if x_now[2] <= 0.05 or x_prev[2] <= 0.05:
+            return None
+
+        shift = (K[:2, :2] @ (x_now[:2] / x_now[2] - x_prev[:2] / x_prev[2])) * self.exposure
+        length = float(np.linalg.norm(shift))
+        if length < 1.0:
+            return None
+        if length > MAX_BLUR_PX:
+            shift *= MAX_BLUR_PX / length
+            length = float(MAX_BLUR_PX)
+        size = int(np.ceil(length)) | 1
+        kernel = np.zeros((size, size), dtype=np.float32)
+        c = size // 2
+        d = shift / length * (length / 2)
+        cv2.line(kernel, (int(round(c - d[0])), int(round(c - d[1]))),
+                 (int(round(c + d[0])), int(round(c + d[1]))), 1.0, 1, cv2.LINE_AA)
+        return kernel / kernel.sum()
+
+    def render(self, R_world_cam, position):
+        """
+        (frame, truth) for a camera pose. frame is uint8 grayscale;
+        truth has R_world_cam, position, ids, corners (N, 4, 2),
+        inside (N,) (all four corners in the image), R_cam_tag (N, 3, 3)
+        and t_cam_tag (N, 3). Tags cut by the image edge are included.
+        """
+        R_world_cam = np.asarray(R_world_cam, dtype=float)
+        position = np.asarray(position, dtype=float)
+        ids, R_cam_tag, t_cam_tag = self.tag_poses(R_world_cam, position)
+
+        canvas = self.background.copy()
+        cw, ch = self.canvas_size
+        boxes = []
+        for n in np.argsort(-t_cam_tag[:, 2]) if len(ids) else ():
+            quad = (self.outer_corners @ R_cam_tag[n].T + t_cam_tag[n]) @ self.canvas_matrix.T
+            pix = quad[:, :2] / quad[:, 2:]
+            x0, y0 = np.maximum(np.floor(pix.min(axis=0)).astype(int) - 1, 0)
+            x1, y1 = np.minimum(np.ceil(pix.max(axis=0)).astype(int) + 2, (cw, ch))
+            if x1 <= x0 or y1 <= y0:
+                continue
+
+            # Smallest mip level at least as wide as the tag appears on screen
+            edge = np.linalg.norm(np.diff(np.vstack((pix, pix[:1])), axis=0), axis=1).max()
+            level = min(int(np.searchsorted(MIP_LEVELS, edge)), len(MIP_LEVELS) - 1)
+            texture = self.textures[int(ids[n])][level]
+            H = self._homography(R_cam_tag[n], t_cam_tag[n], MIP_LEVELS[level])
+            H = np.array([[1, 0, -x0], [0, 1, -y0], [0, 0, 1]], dtype=float) @ H
+            roi = canvas[y0:y1, x0:x1]
+            cv2.warpPerspective(texture, H, (x1 - x0, y1 - y0), dst=roi, flags=cv2.INTER_LINEAR,
+                                borderMode=cv2.BORDER_TRANSPARENT)
+            boxes.append((x0, y0, x1, y1))
+
+        # Motion blur around the tags only: the background is too smooth for it to show
+        kernel = self._motion_kernel(R_world_cam, position, self.tag_map.positions[ids].mean(axis=0)) \
+            if boxes else None
+        if kernel is not None:
+            r = kernel.shape[0] // 2 + 1
+            sharp = canvas.copy() if len(boxes) > 1 else canvas
+            for x0, y0, x1, y1 in boxes:
+                x0, y0, x1, y1 = max(x0 - r, 0), max(y0 - r, 0), min(x1 + r, cw), min(y1 + r, ch)
+                canvas[y0:y1, x0:x1] = cv2.filter2D(sharp[y0:y1, x0:x1], -1, kernel,
+                                                    borderType=cv2.BORDER_REFLECT)
+        frame = cv2.remap(canvas, self.map1, self.map2, cv2.INTER_LINEAR)
+        if self.blur_sigma > 0:
+            frame = cv2.GaussianBlur(frame, (0, 0), self.blur_sigma)
+        if self._noise_bank is not None:
+            w, h = self.image_size
+            oy = int(self.rng.integers(0, self._noise_bank.shape[0] - h + 1))
+            ox = int(self.rng.integers(0, self._noise_bank.shape[1] - w + 1))
+            frame = cv2.add(frame, self._noise_bank[oy:oy + h, ox:ox + w], dtype=cv2.CV_8U)
+        self.previous = (R_world_cam, position)
+
+        corners = self.project_corners(R_cam_tag, t_cam_tag)
+        w, h = self.image_size
+        inside = ((corners >= 0) & (corners <= (w - 1, h - 1))).all(axis=(1, 2))
+        truth = {
+            "R_world_cam": R_world_cam, "position": position, "ids": ids, "corners": corners,
+            "inside": inside, "R_cam_tag": R_cam_tag, "t_cam_tag": t_cam_tag,
+        }
+        return frame, truth
+
+    def render_sequence(self, poses):
+        """Yield (t, frame, truth) for [(t, R_world_cam, position)], with motion blur between them."""
+        self.previous = None
+        for t, R, p in poses:
+            frame, truth = self.render(R, p)
+            truth["t"] = t
+            yield t, frame, truth
+
+
+# --- BENCHMARK ---
+def _rotation_angle(R):
+    return np.degrees(np.arccos(np.clip((np.trace(R) - 1.0) / 2.0, -1.0, 1.0)))
+
+
+def benchmark(map_path=MAP_PATH, camera_path=CAMERA_PATH, frames=FRAMES, check_every=5):
+    from pupil_apriltags import Detector
+
+    tag_map = load_tag_map(map_path)
+    calib = np.load(CALIBRATION_PATH)
+    K, dist = calib["camera_matrix"], calib["dist_coeffs"]
+    poses = load_camera_poses(camera_path, tag_map) if camera_path else fly_past(tag_map, frames)
+
+    t0 = time.perf_counter()
+    renderer = SceneRenderer(tag_map, K, dist)
+    t_setup = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    rendered = [(frame, truth) for _, frame, truth in renderer.render_sequence(poses)]
+    t_render = (time.perf_counter() - t0) * 1000.0 / len(poses)
+    in_view = np.array([len(truth["ids"]) for _, truth in rendered])
+    print(f"{len(poses)} frames {IMAGE_SIZE[0]}x{IMAGE_SIZE[1]} of {os.path.basename(map_path)}: "
+          f"setup {t_setup:.2f} s, render {t_render:.2f} ms/frame ({1000.0 / t_render:.0f} fps), "
+          f"{in_view.mean():.1f} tags in view on average, {np.mean(in_view == 0):.0%} frames with none")
+    if not in_view.any():
+        print("[WARN] No tag faces the camera anywhere on this path (tags face their -z axis)")
+        return
+
+    # The detector on the distorted frames, against the truth. Poses come from
+    # IPPE on undistorted corners (pupil_apriltags' own pose step can corrupt
+    # its heap on ambiguous tags)
+    detector = Detector(families="tag36h11", nthreads=1, quad_decimate=1.0, refine_edges=1)
+    object_points = tag_object_points(TAG_SIZE)
+    found = expected = 0
+    offsets, corner_err, t_err, R_err = [], [], [], []
+    for frame, truth in rendered[::check_every]:
+        detections = {d.tag_id: d for d in detector.detect(frame)}
+        expected += int(truth["inside"].sum())
+        for n, tag_id in enumerate(truth["ids"]):
+            d = detections.get(int(tag_id))
+            if not truth["inside"][n]:
+                continue
+            if d is None:
+                continue
+            found += 1
+            offsets.append((d.corners - truth["corners"][n]).mean(axis=0))
+            corner_err.append(np.linalg.norm(d.corners - truth["corners"][n], axis=1).max())
+            ok, rvec, tvec = cv2.solvePnP(object_points, d.corners, K, dist, flags=cv2.SOLVEPNP_IPPE_SQUARE)
+            if ok:
+                t_err.append(np.linalg.norm(tvec.ravel() - truth["t_cam_tag"][n]))
+                R_err.append(_rotation_angle(cv2.Rodrigues(rvec)[0].T @ truth["R_cam_tag"][n]))
+    offset = np.mean(offsets, axis=0)
+    print(f"pupil_apriltags on every {check_every}th frame: recall {found / max(expected, 1):.1%} of whole tags, "
+          f"corner error p50 {np.median(corner_err):.2f} px / p95 {np.percentile(corner_err, 95):.2f} px "
+          f"(mean offset {offset[0]:+.2f}, {offset[1]:+.2f} px), "
+          f"position error p50 {np.median(t_err) * 1000:.1f} mm, rotation error p50 {np.median(R_err):.2f} deg")
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,321 @@
+"""
+Compiled tag maps.
+
+A JSON map ({"tags": [{"id", "position", optional "rotation"}]}) is
+compiled into a flat binary file that is memory-mapped on load:
+
+    header   magic, version, counts, grid geometry, array offsets
+    ids      (N,) int32 mapped tag ids
+    table    (max_id + 1, 3) float64 positions, NaN for unused ids
+    rotation (max_id + 1, 3, 3) float64 tag -> world, identity by default
+    grid     uniform 3D grid over the tags, CSR layout:
+             cell_start (cells + 1,) int32, cell_tags (N,) int32
+
+load_tag_map() takes either file. For a .json it uses (or rebuilds) the
+.tagmap next to it, so every script shares one loader and one API.
+
+Run: python tag_map.py maps/*.json      (compile)
+     python tag_map.py --benchmark
+"""
+
+import os
+import sys
+import json
+import mmap
+import struct
+import time
+import numpy as np
+from world_transform import TagMapArray
+
+MAGIC = b"TAGMAP\x00\x01"
+VERSION = 2  # 2: ids are unique (duplicates in the JSON are dropped when compiling)
+# magic, version, n_tags, table_size, cell_size, origin xyz, grid dims xyz, 5 array offsets
+HEADER = struct.Struct("<8sIIId3d3i5Q")
+ALIGN = 64
+
+
+def _aligned(offset):
+    return (offset + ALIGN - 1) // ALIGN * ALIGN
+
+
+# --- COMPILER ---
+def read_json_map(json_path):
+    with open(json_path, "r") as f:
+        tags = json.load(f)["tags"]
+    ids = np.array([t["id"] for t in tags], dtype=np.int32)
+    positions = np.array([t["position"] for t in tags], dtype=float).reshape(-1, 3)
+    rotations = np.array([t.get("rotation", np.eye(3)) for t in tags], dtype=float).reshape(-1, 3, 3)
+
+    # An id listed twice keeps its last entry, as the {id: position} loaders do
+    _, last = np.unique(ids[::-1], return_index=True)
+    keep = np.sort(len(ids) - 1 - last)
+    if len(keep) < len(ids):
+        dropped = sorted({int(i) for i in np.delete(ids, keep)})
+        print(f"[WARN] {json_path}: ids {dropped} are listed more than once, keeping the last entry of each")
+    return ids[keep], positions[keep], rotations[keep]
+
+
+def compile_map(json_path, out_path=None, cell_size=None):
+    """Write the binary map for a JSON map; returns the output path."""
+    out_path = out_path or os.path.splitext(json_path)[0] + ".tagmap"
+    ids, positions, rotations = read_json_map(json_path)
+
+    size = int(ids.max()) + 1 if len(ids) else 0
+    table = np.full((size, 3), np.nan)
+    rotation = np.tile(np.eye(3), (size, 1, 1))
+    table[ids] = positions
+    rotation[ids] = rotations
+
+    # Grid sized for a few tags per cell
+    lo = positions.min(axis=0) if len(ids) else np.zeros(3)
+    hi = positions.max(axis=0) if len(ids) else np.zeros(3)
+    if cell_size is None:
+        extent = np.maximum(hi - lo, 1e-6)
+        cell_size = max(float(np.prod(extent[extent > 1e-6]) / max(len(ids) / 4, 1)) ** (1.0 / max(np.sum(extent > 1e-6), 1)), 0.05)
+    dims = np.floor((hi - lo) / cell_size).astype(np.int32) + 1
+    cells = _cell_index(_cell_coords(positions, lo, cell_size, dims), dims)
+    order = np.argsort(cells, kind="stable").astype(np.int32)
+    cell_start = np.searchsorted(cells[order], np.arange(int(np.prod(dims)) + 1)).astype(np.int32)
+
+    arrays = [ids, table, rotation, cell_start, order]
+    offsets = []
+    offset = _aligned(HEADER.size)
+    for a in arrays:
+        offsets.append(offset)
+        offset = _aligned(offset + a.nbytes)
+
+    with open(out_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(ids), size, cell_size, *lo, *dims, *offsets))
+        for a, off in zip(arrays, offsets):
+            f.seek(off)
+            f.write(np.ascontiguousarray(a).tobytes())
+    return out_path
+
+
+def _cell_coords(points, origin, cell_size, dims):
+    return np.clip(np.floor((points - origin) / cell_size).astype(np.int64), 0, dims - 1)
+
+
+def _cell_index(coords, dims):
+    return (coords[:, 0] * dims[1] + coords[:, 1]) * dims[2] + coords[:, 2]
+
+
+# --- LOADER ---
+class TagMap(TagMapArray):
+    """
+    Memory-mapped compiled map.
+
+    positions / known / lookup() behave like TagMapArray, so it can be passed
+    straight to world_transform.camera_positions_in_world().
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, n_tags, size, self.cell_size, ox, oy, oz,
+         dx, dy, dz, *offsets) = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} tag map")
+
+        self.origin = np.array([ox, oy, oz])
+        self.dims = np.array([dx, dy, dz], dtype=np.int64)
+        n_cells = int(np.prod(self.dims))
+
+        def view(index, dtype, shape):
+            count = int(np.prod(shape))
+            if count == 0:
+                # An empty map ends before the offsets of its empty arrays
+                return np.empty(shape, dtype=dtype)
+            return np.frombuffer(self._mm, dtype=dtype, count=count, offset=offsets[index]).reshape(shape)
+
+        self.ids = view(0, np.int32, (n_tags,))
+        self.positions = view(1, np.float64, (size, 3))
+        self.rotations = view(2, np.float64, (size, 3, 3))
+        self.cell_start = view(3, np.int32, (n_cells + 1,))
+        self.cell_tags = view(4, np.int32, (n_tags,))
+
+        self.known = np.zeros(size, dtype=bool)
+        self.known[self.ids] = True
+        self._tag_positions = self.positions[self.ids]
+
+    @property
+    def world_positions(self):
+        """{tag_id: position} like the JSON loaders build."""
+        return {int(i): self.positions[i].copy() for i in self.ids}
+
+    @property
+    def world_rotations(self):
+        """{tag_id: R_world_tag}, for MultiTagLocalizer."""
+        return {int(i): self.rotations[i].copy() for i in self.ids}
+
+    def __len__(self):
+        return len(self.ids)
+
+    # --- Spatial queries ---
+    def _candidates(self, lo, hi):
+        """Indices into self.ids of every tag in grid cells overlapping [lo, hi]."""
+        c0 = np.clip(np.floor((np.asarray(lo) - self.origin) / self.cell_size).astype(np.int64), 0, self.dims - 1)
+        c1 = np.clip(np.floor((np.asarray(hi) - self.origin) / self.cell_size).astype(np.int64), 0, self.dims - 1)
+        cx, cy, cz = (np.arange(a, b + 1) for a, b in zip(c0, c1))
+        cells = ((cx[:, None, None] * self.dims[1] + cy[None, :, None]) * self.dims[2] + cz[None, None, :]).ravel()
+
+        # gather the CSR rows of all those cells in one go
+        starts = self.cell_start[cells]
+        lengths = self.cell_start[cells + 1] - starts
+        total = int(lengths.sum())
+        if total == 0:
+            return np.empty(0, dtype=np.int32)
+        shift = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+        return self.cell_tags[shift + np.arange(total)]
+
+    def within(self, point, radius):
+        """Tag ids within radius (m) of point, nearest first."""
+        point = np.asarray(point, dtype=float)
+        idx = self._candidates(point - radius, point + radius)
+        d = np.linalg.norm(self._tag_positions[idx] - point, axis=1)
+        keep = d <= radius
+        order = np.argsort(d[keep])
+        return self.ids[idx[keep][order]]
+
+    def nearest(self, point, k=1):
+        """The k tag ids nearest to point, nearest first."""
+        point = np.asarray(point, dtype=float)
+        k = min(k, len(self.ids))
+        if k <= 0:
+            return self.ids[:0]
+        radius = self.cell_size
+        while True:
+            idx = self._candidates(point - radius, point + radius)
+            if len(idx) >= k:
+                d = np.linalg.norm(self._tag_positions[idx] - point, axis=1)
+                kth = np.partition(d, k - 1)[k - 1]
+                # only trust the answer once the box fully contains that sphere
+                if kth <= radius or radius > self.cell_size * np.max(self.dims):
+                    return self.ids[idx[np.argsort(d)[:k]]]
+                radius = kth
+            else:
+                radius *= 2.0
+
+    def visible_from(self, R_world_cam, camera_position, camera_matrix, image_size, max_range=5.0):
+        """
+        Tag ids whose centre projects into the image and whose face points
+        at the camera (tags face their -z axis, as in main.py's convention).
+        """
+        camera_position = np.asarray(camera_position, dtype=float)
+        idx = self._candidates(camera_position - max_range, camera_position + max_range)
+        return self._visible(idx, R_world_cam, camera_position, camera_matrix, image_size, max_range)
+
+    def _visible(self, idx, R_world_cam, camera_position, camera_matrix, image_size, max_range):
+        ids = self.ids[idx]
+        p = self._tag_positions[idx]
+
+        in_range = np.linalg.norm(p - camera_position, axis=1) <= max_range
+        p_cam = (p - camera_position) @ np.asarray(R_world_cam)  # R_cam_world applied to rows
+        in_front = p_cam[:, 2] > 1e-6
+        uv = p_cam[:, :2] / np.where(in_front, p_cam[:, 2], 1.0)[:, None]
+        K = np.asarray(camera_matrix)
+        u = K[0, 0] * uv[:, 0] + K[0, 2]
+        v = K[1, 1] * uv[:, 1] + K[1, 2]
+        in_image = (u >= 0) & (u < image_size[0]) & (v >= 0) & (v < image_size[1])
+
+        # camera position in each tag frame must be on the -z side
+        cam_in_tag = np.einsum("nji,nj->ni", self.rotations[ids], camera_position - p)
+        facing = cam_in_tag[:, 2] < 0
+
+        return ids[in_range & in_front & in_image & facing]
+
+
+def load_tag_map(path):
+    """
+    Load a map from a .tagmap, or from a .json via its compiled .tagmap
+    (rebuilt when missing, older than the JSON or from an older VERSION).
+    """
+    if path.endswith(".json"):
+        compiled = os.path.splitext(path)[0] + ".tagmap"
+        if not os.path.exists(compiled) or os.path.getmtime(compiled) < os.path.getmtime(path):
+            try:
+                compile_map(path, compiled)
+            except OSError as e:
+                print(f"[WARN] Could not write compiled map {compiled}: {e}")
+                tmp = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".tagmap_tmp")
+                compiled = compile_map(path, tmp)
+        try:
+            return TagMap(compiled)
+        except ValueError:
+            # Compiled by an older version of this file
+            return TagMap(compile_map(path, compiled))
+    return TagMap(path)
+
+
+# --- BENCHMARK ---
+def benchmark(n_tags=5000, queries=200, seed=0):
+    import tempfile
+    rng = np.random.default_rng(seed)
+    tmp = tempfile.mkdtemp()
+    json_path = os.path.join(tmp, "venue.json")
+    # tags on the two long walls of a 60 x 40 m venue, 1.5 m up, facing in
+    facing_north = [[-1, 0, 0], [0, 0, -1], [0, -1, 0]]  # on the y = 0 wall
+    facing_south = [[1, 0, 0], [0, 0, 1], [0, -1, 0]]    # on the y = 40 wall
+    xs = rng.uniform(0, 60, n_tags)
+    north = rng.random(n_tags) < 0.5
+    tags = [
+        {"id": i, "position": [float(x), 0.0 if n else 40.0, 1.5],
+         "rotation": facing_north if n else facing_south}
+        for i, (x, n) in enumerate(zip(xs, north))
+    ]
+    with open(json_path, "w") as f:
+        json.dump({"tags": tags}, f)
+
+    def timed(fn, repeats=20):
+        t0 = time.perf_counter()
+        for _ in range(repeats):
+            out = fn()
+        return (time.perf_counter() - t0) * 1000.0 / repeats, out
+
+    def parse_json():
+        with open(json_path) as f:
+            return {t["id"]: np.array(t["position"]) for t in json.load(f)["tags"]}
+
+    t_compile, _ = timed(lambda: compile_map(json_path), repeats=1)
+    t_json, world_positions = timed(parse_json)
+    t_load, tag_map = timed(lambda: TagMap(os.path.splitext(json_path)[0] + ".tagmap"))
+
+    # a robot driving along the y = 0 wall, 1-3 m from it
+    points = np.column_stack((rng.uniform(0, 60, queries), rng.uniform(1, 3, queries), np.full(queries, 1.0)))
+    all_ids = np.array(list(world_positions))
+    all_pos = np.array(list(world_positions.values()))
+
+    t0 = time.perf_counter()
+    grid_nearest = [tag_map.nearest(p, k=3) for p in points]
+    t_grid = (time.perf_counter() - t0) * 1e6 / queries
+    t0 = time.perf_counter()
+    scan_nearest = [all_ids[np.argsort(np.linalg.norm(all_pos - p, axis=1))[:3]] for p in points]
+    t_scan = (time.perf_counter() - t0) * 1e6 / queries
+    agree = np.mean([np.array_equal(a, b) for a, b in zip(grid_nearest, scan_nearest)])
+
+    # camera looking at the y = 0 wall (along -y)
+    K = np.array([[1400.0, 0, 640], [0, 1400.0, 360], [0, 0, 1]])
+    R_world_cam = np.array([[-1, 0, 0], [0, 0, -1], [0, -1, 0]], dtype=float)
+    everything = np.arange(len(tag_map))
+    t0 = time.perf_counter()
+    grid_visible = [tag_map.visible_from(R_world_cam, p, K, (1280, 720), max_range=8.0) for p in points]
+    t_vis = (time.perf_counter() - t0) * 1e6 / queries
+    t0 = time.perf_counter()
+    scan_visible = [tag_map._visible(everything, R_world_cam, p, K, (1280, 720), 8.0) for p in points]
+    t_vis_scan = (time.perf_counter() - t0) * 1e6 / queries
+    agree_vis = np.mean([set(a) == set(b) for a, b in zip(grid_visible, scan_visible)])
+
+    print(f"{n_tags} tags")
+    print(f"  compile once:       {t_compile:.2f} ms")
+    print(f"  JSON parse to dict: {t_json:.2f} ms, mmap load: {t_load:.3f} ms")
+    print(f"  3-nearest:    grid {t_grid:.0f} us, full scan {t_scan:.0f} us, agree {agree:.0%}")
+    print(f"  visible_from: grid {t_vis:.0f} us, full scan {t_vis_scan:.0f} us, agree {agree_vis:.0%}, "
+          f"{np.mean([len(v) for v in grid_visible]):.0f} tags on average")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["--benchmark"]:
+        benchmark()
+    else:
+        for json_path in sys.argv[1:]:
+            print(f"{json_path} -> {compile_map(json_path)}")
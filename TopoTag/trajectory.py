@@ -0,0 +1,238 @@
+"""
+Bounded-memory trajectory recording.
+
+Poses go into a fixed-size ring of structured records (POSE_DTYPE). Every
+flush_every poses the ones not yet written are appended to a binary file,
+so memory stays constant however long the run, and a crash loses at most
+one chunk. The file is a small header followed by raw records:
+
+    magic (8s), version (I), record size (I), dtype descr (JSON, padded to 64 B)
+
+A torn last record (crash mid-write) is ignored by the readers.
+read_trajectory() streams the file back in chunks and export_csv() writes
+the x,y,z CSV that camera_path.csv always had.
+
+Run: python trajectory.py   (benchmark against a list + np.savetxt)
+"""
+
+import os
+import csv
+import json
+import struct
+import numpy as np
+
+MAGIC = b"TRAJ\x00\x00\x00\x01"
+VERSION = 1
+HEADER = struct.Struct("<8sII")
+HEADER_SIZE = 64
+
+POSE_DTYPE = np.dtype([
+    ("t", "<f8"),          # s
+    ("frame", "<i4"),
+    ("x", "<f8"), ("y", "<f8"), ("z", "<f8"),
+    ("qw", "<f4"), ("qx", "<f4"), ("qy", "<f4"), ("qz", "<f4"),  # R_world_cam, NaN if unknown
+    ("sigma", "<f4"),      # m, position std dev (NaN if unknown)
+    ("tags", "<u2"),       # tags behind this pose
+])
+
+
+def rotation_to_quaternion(R):
+    """(w, x, y, z) of a rotation matrix."""
+    R = np.asarray(R, dtype=float)
+    w = np.sqrt(max(1.0 + R[0, 0] + R[1, 1] + R[2, 2], 0.0)) / 2.0
+    if w > 1e-6:
+        return np.array([w, (R[2, 1] - R[1, 2]) / (4 * w), (R[0, 2] - R[2, 0]) / (4 * w),
+                         (R[1, 0] - R[0, 1]) / (4 * w)])
+    # 180 degree rotation: take the largest diagonal term
+    i = int(np.argmax(np.diag(R)))
+    j, k = (i + 1) % 3, (i + 2) % 3
+    q = np.zeros(4)
+    q[i + 1] = np.sqrt(max(1.0 + R[i, i] - R[j, j] - R[k, k], 0.0)) / 2.0
+    q[j + 1] = (R[j, i] + R[i, j]) / (4 * q[i + 1])
+    q[k + 1] = (R[k, i] + R[i, k]) / (4 * q[i + 1])
+    q[0] = (R[k, j] - R[j, k]) / (4 * q[i + 1])
+    return q
+
+
+def _write_header(f):
+    descr = json.dumps(POSE_DTYPE.descr).encode()
+    header = HEADER.pack(MAGIC, VERSION, POSE_DTYPE.itemsize) + descr
+    if len(header) > HEADER_SIZE * 4:
+        raise ValueError("Trajectory header too long")
+    size = -(-len(header) // HEADER_SIZE) * HEADER_SIZE
+    f.write(header.ljust(size, b"\x00"))
+
+
+def _read_header(f):
+    magic, version, record_size = HEADER.unpack(f.read(HEADER.size))
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"Not a trajectory file (magic {magic!r}, version {version})")
+    rest = f.read(HEADER_SIZE * 4 - HEADER.size)
+    descr = json.JSONDecoder().raw_decode(rest.decode("ascii", "ignore"))[0]
+    dtype = np.dtype([tuple(field) for field in descr])
+    if dtype.itemsize != record_size:
+        raise ValueError("Trajectory record size does not match its dtype")
+    data_start = -(-(HEADER.size + len(json.dumps(descr))) // HEADER_SIZE) * HEADER_SIZE
+    f.seek(data_start)
+    return dtype
+
+
+# --- RECORDER ---
+class TrajectoryRecorder:
+    def __init__(self, path=None, capacity=4096, flush_every=256):
+        """
+        path:        binary file to append to (created / truncated); None = memory only
+        capacity:    poses kept in memory (recent())
+        flush_every: poses per chunk appended to the file
+        """
+        self.capacity = capacity
+        self.flush_every = min(flush_every, capacity)
+        self.ring = np.zeros(capacity, dtype=POSE_DTYPE)
+        self.count = 0     # poses ever appended
+        self.written = 0   # poses already in the file
+        self.path = path
+        self.file = None
+        if path is not None:
+            self.file = open(path, "wb")
+            _write_header(self.file)
+            self.file.flush()
+
+    def __len__(self):
+        return self.count
+
+    def append(self, t, position, R_world_cam=None, frame=-1, tags=0, sigma=np.nan):
+        x, y, z = np.asarray(position, dtype=float).ravel()[:3]
+        qw, qx, qy, qz = (np.nan,) * 4 if R_world_cam is None else rotation_to_quaternion(R_world_cam)
+        # One tuple assignment; per-field writes into a record are several times slower
+        self.ring[self.count % self.capacity] = (t, frame, x, y, z, qw, qx, qy, qz, sigma, tags)
+        self.count += 1
+
+        if self.file is not None and self.count - self.written >= self.flush_every:
+            self.flush()
+
+    def recent(self, n=None):
+        """Copy of the last n (default: all in memory) poses, oldest first."""
+        n = min(self.count, self.capacity) if n is None else min(n, self.count, self.capacity)
+        start = (self.count - n) % self.capacity
+        if start + n <= self.capacity:
+            return self.ring[start:start + n].copy()
+        return np.concatenate((self.ring[start:], self.ring[:start + n - self.capacity]))
+
+    def flush(self):
+        """Append every pose not yet written as one chunk."""
+        if self.file is None or self.written == self.count:
+            return
+        pending = self.count - self.written
+        if pending > self.capacity:
+            print(f"[WARN] Trajectory ring overran the file by {pending - self.capacity} poses")
+            pending = self.capacity
+        self.file.write(self.recent(pending).tobytes())
+        self.file.flush()
+        self.written = self.count
+
+    def close(self):
+        if self.file is not None:
+            self.flush()
+            self.file.close()
+            self.file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# --- READERS ---
+def read_trajectory(path, chunk_size=65536):
+    """Yield the poses in a trajectory file as structured arrays of up to chunk_size records."""
+    with open(path, "rb") as f:
+        dtype = _read_header(f)
+        while True:
+            data = f.read(chunk_size * dtype.itemsize)
+            whole = len(data) // dtype.itemsize
+            if whole == 0:
+                return
+            yield np.frombuffer(data[:whole * dtype.itemsize], dtype=dtype)
+
+
+def read_positions(path, step=1):
+    """(N, 3) positions of a whole trajectory file, every step-th pose."""
+    chunks, offset = [], 0
+    for chunk in read_trajectory(path):
+        picked = chunk[(-offset) % step::step]
+        offset = (offset + len(chunk)) % step
+        chunks.append(np.column_stack((picked["x"], picked["y"], picked["z"])))
+    return np.concatenate(chunks) if chunks else np.empty((0, 3))
+
+
+def export_csv(path, csv_path, columns=("x", "y", "z"), float_format="%.6f"):
+    """Stream a trajectory file into a CSV (default: the x,y,z camera_path.csv layout)."""
+    rows = 0
+    with open(csv_path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        for chunk in read_trajectory(path):
+            fields = [chunk[c] for c in columns]
+            for values in zip(*fields):
+                writer.writerow([float_format % v if isinstance(v, np.floating) else v for v in values])
+            rows += len(chunk)
+    return rows
+
+
+# --- BENCHMARK ---
+def benchmark(poses=108000, seed=0):
+    """One hour at 30 fps: list of arrays + np.savetxt vs the recorder."""
+    import time
+    import tempfile
+    import tracemalloc
+
+    rng = np.random.default_rng(seed)
+    path = rng.normal(size=(poses, 3)).cumsum(axis=0) * 0.01
+    tmp = tempfile.mkdtemp()
+
+    tracemalloc.start()
+    camera_path = []
+    for p in path:
+        camera_path.append(p.copy())
+    mem_list = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    t0 = time.perf_counter()
+    np.savetxt(os.path.join(tmp, "old.csv"), np.array(camera_path), delimiter=",", header="x,y,z", comments='')
+    t_savetxt = time.perf_counter() - t0
+    del camera_path
+
+    def record():
+        recorder = TrajectoryRecorder(os.path.join(tmp, "path.traj"))
+        R = np.eye(3)
+        for i, p in enumerate(path):
+            recorder.append(i / 30.0, p, R, frame=i, tags=2, sigma=0.01)
+        recorder.close()
+
+    t0 = time.perf_counter()
+    record()
+    t_rec = (time.perf_counter() - t0) * 1e6 / poses
+    tracemalloc.start()
+    record()
+    mem_rec = tracemalloc.get_traced_memory()[1]  # peak: the recorder is gone by now
+    tracemalloc.stop()
+
+    t0 = time.perf_counter()
+    export_csv(os.path.join(tmp, "path.traj"), os.path.join(tmp, "new.csv"))
+    t_export = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    back = read_positions(os.path.join(tmp, "path.traj"))
+    t_read = time.perf_counter() - t0
+
+    print(f"{poses} poses (1 h at 30 fps)")
+    print(f"  list + savetxt: {mem_list / 1e6:.1f} MB held, "
+          f"CSV {os.path.getsize(os.path.join(tmp, 'old.csv')) / 1e6:.1f} MB written at the end in {t_savetxt:.2f} s")
+    print(f"  recorder:       {t_rec:.2f} us/pose, {mem_rec / 1e6:.2f} MB peak, "
+          f"binary {os.path.getsize(os.path.join(tmp, 'path.traj')) / 1e6:.1f} MB written as it goes "
+          f"(full pose, {POSE_DTYPE.itemsize} B/record)")
+    print(f"  read back {t_read * 1000:.0f} ms (max diff {np.abs(back - path).max():.1e}), "
+          f"CSV export {t_export:.2f} s, {os.path.getsize(os.path.join(tmp, 'new.csv')) / 1e6:.1f} MB")
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,113 @@
+"""
+Detection -> world transform for all tags at once.
+
+The map is an id-indexed (max_id + 1, 3) array instead of a dict. A frame's
+per-tag poses are stacked into (N, 3, 3) / (N, 3) arrays, and every
+camera-in-world estimate comes out of a single einsum:
+
+    t_world_cam = R_world_tag @ (-R_cam_tag^T @ t_cam_tag) + t_world_tag
+
+R_world_tag is the identity unless the map gives tag rotations.
+"""
+
+import time
+import numpy as np
+
+
+class TagMapArray:
+    def __init__(self, world_positions, world_rotations=None):
+        """
+        world_positions: {tag_id: (3,) tag centre in the world frame}
+        world_rotations: {tag_id: (3, 3) R_world_tag}, identity for missing ids
+        """
+        size = max(world_positions) + 1 if world_positions else 0
+        self.positions = np.full((size, 3), np.nan)
+        self.rotations = np.tile(np.eye(3), (size, 1, 1))
+        self.known = np.zeros(size, dtype=bool)
+        for tag_id, pos in world_positions.items():
+            self.positions[tag_id] = pos
+            self.known[tag_id] = True
+        for tag_id, R in (world_rotations or {}).items():
+            self.rotations[tag_id] = R
+
+    def lookup(self, ids):
+        """Mask of mapped ids and their world positions (for the mapped ones)."""
+        ids = np.asarray(ids, dtype=np.int64)
+        mapped = (ids >= 0) & (ids < len(self.known))
+        mapped[mapped] = self.known[ids[mapped]]
+        return mapped, self.positions[ids[mapped]]
+
+
+def stack_poses(detections):
+    """ids (N,), R_cam_tag (N, 3, 3) and t_cam_tag (N, 3) from pupil_apriltags detections."""
+    n = len(detections)
+    ids = np.fromiter((d.tag_id for d in detections), dtype=np.int64, count=n)
+    R = np.array([d.pose_R for d in detections], dtype=float).reshape(n, 3, 3)
+    t = np.array([d.pose_t for d in detections], dtype=float).reshape(n, 3)
+    return ids, R, t
+
+
+def camera_positions_in_world(detections, tag_map):
+    """(ids, (M, 3) camera positions) for every detection of a mapped tag."""
+    if not detections:
+        return np.empty(0, dtype=np.int64), np.empty((0, 3))
+    ids, R, t = stack_poses(detections)
+    mapped, world = tag_map.lookup(ids)
+    # -R^T t for every tag: sum over j of R[n, j, i] * t[n, j]
+    t_tag_cam = -np.einsum("nji,nj->ni", R[mapped], t[mapped])
+    # then from the tag frame into the world frame
+    t_tag_cam = np.einsum("nij,nj->ni", tag_map.rotations[ids[mapped]], t_tag_cam)
+    return ids[mapped], t_tag_cam + world
+
+
+# --- BENCHMARK ---
+def _loop(detections, world_positions):
+    """The per-detection loop from main.py."""
+    positions = []
+    for d in detections:
+        tag_id = d.tag_id
+        if tag_id not in world_positions:
+            continue
+        R_cam_tag = np.array(d.pose_R, dtype=float)
+        t_cam_tag = np.array(d.pose_t, dtype=float).reshape(3)
+        t_tag_cam = -R_cam_tag.T @ t_cam_tag
+        positions.append(t_tag_cam + world_positions[tag_id])
+    return positions
+
+
+def benchmark(tag_counts=(1, 5, 20, 50), repeats=2000, seed=0):
+    import os
+    import json
+    from types import SimpleNamespace
+
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    with open(os.path.join(base_dir, "maps", "125-lab.json")) as f:
+        world_positions = {t["id"]: np.array(t["position"], dtype=float) for t in json.load(f)["tags"]}
+    tag_map = TagMapArray(world_positions)
+    ids = list(world_positions)
+    rng = np.random.default_rng(seed)
+
+    print(f"{'tags':>5} {'loop us':>9} {'einsum us':>10} {'max diff':>9}")
+    for n in tag_counts:
+        detections = []
+        for k in range(n):
+            q, _ = np.linalg.qr(rng.normal(size=(3, 3)))
+            detections.append(SimpleNamespace(tag_id=ids[k % len(ids)], pose_R=q,
+                                              pose_t=rng.normal(size=(3, 1))))
+
+        t0 = time.perf_counter()
+        for _ in range(repeats):
+            expected = _loop(detections, world_positions)
+        t_loop = (time.perf_counter() - t0) * 1e6 / repeats
+
+        t0 = time.perf_counter()
+        for _ in range(repeats):
+            _, positions = camera_positions_in_world(detections, tag_map)
+        t_batch = (time.perf_counter() - t0) * 1e6 / repeats
+
+        diff = np.abs(np.array(expected) - positions).max()
+        print(f"{n:>5} {t_loop:>9.1f} {t_batch:>10.1f} {diff:>9.1e}")
+
+
+if __name__ == "__main__":
+    benchmark()